@@ -9,7 +9,8 @@ HA_URL="${HA_URL:?Set HA_URL in $CONFIG_FILE or env}"
 HA_TOKEN="${HA_TOKEN:?Set HA_TOKEN in $CONFIG_FILE or env}"
 THRESHOLD="${THRESHOLD:-26.0}"
 TARGETS="${TARGETS:-media_player.north_echo,media_player.hallway_echo}"
-FLAG="/tmp/battery-low-reported"
+FLAG_DIR="${FLAG_DIR:-/tmp}"
+FLAG="$FLAG_DIR/battery-low-reported"
 
 get_voltage() {
   curl -s -H "Authorization: Bearer $HA_TOKEN" "$HA_URL/api/states/$1" | python3 -c "import json,sys; print(json.load(sys.stdin)['state'])" 2>/dev/null
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Event-driven battery monitor on the Home Assistant WebSocket API.
+
+The cron monitor can take up to a minute to notice an overvoltage cell, and
+most of its polls find nothing new. This daemon subscribes to state_changed,
+keeps the watched states in memory and, when one changes, re-evaluates only
+the rules that read it (via the RuleSet entity index). Owed announcements go
+to a notify.Dispatcher task, so a slow or failing Alexa call never holds up
+event handling. Idle cost is one quiet socket.
+
+After every (re)connect it subscribes first and then resyncs with get_states,
+so nothing that changed during an outage is missed. Rules, messages and
+flag files are the same as battery_monitor.py, so cron and daemon can be
+swapped freely. With METRICS_PORT set it serves Prometheus /metrics (see
+metrics.py).
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from battery_monitor import (
+    BANK_SENSORS, CONFIG_FILE, FlagStore, evaluate_trends, load_config, load_rules, open_history,
+    record_readings, targets, watched_entities
+)
+from ha_client import HAError
+from ha_ws import HAWebSocket
+from metrics import TEXTFILE_PERIOD, Metrics
+from notify import DELIVERY_ERRORS, Dispatcher
+from rules import RuleError, numeric_state
+
+import aiohttp
+
+MAX_BACKOFF = 60
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+class BatteryDaemon:
+    """Mirror of the watched sensors plus the rules that run on each change."""
+
+    def __init__(self, config):
+        self.config = config
+        self.flags = FlagStore(config['FLAG_DIR'])
+        self.rules = load_rules(config)
+        self.history = open_history(config) if float(config['PREDICT_HORIZON']) > 0 else None
+        self.watched = self.rules.entities | (watched_entities() if self.history is not None else set())
+        self.states = {}
+        self.connected = False
+        self.ws = None
+        self.notifier = Dispatcher(self.announce, self.flags,
+                                   errors=DELIVERY_ERRORS + (aiohttp.ClientError,), log=log)
+        self.metrics = Metrics()
+        self.metrics.collectors.append(self.collect)
+
+    async def announce(self, message):
+        """Send one announcement over the current connection (used by the dispatcher)."""
+        if self.ws is None:
+            self.metrics.inc('battery_notify_failures_total')
+            raise ConnectionError('not connected')
+        with self.metrics.timer('battery_notify_duration_seconds'):
+            try:
+                await self.ws.call_service('notify', 'alexa_media',
+                                           {'message': message, 'target': targets(self.config)})
+            except Exception:
+                self.metrics.inc('battery_notify_failures_total')
+                raise
+
+    def check(self, rules=None, trends=True):
+        """Evaluate rules (default all) and optionally bank trends; queue what is owed."""
+        start = time.perf_counter()
+        announcements, ok = self.rules.evaluate(self.states, self.flags, rules)
+        if trends and self.history is not None:
+            announcements += evaluate_trends(self.history, self.config, self.flags)
+        self.notifier.submit(announcements)
+        self.metrics.inc('battery_checks_total')
+        if ok:
+            self.metrics.set('battery_last_success_timestamp_seconds', time.time())
+        else:
+            self.metrics.inc('battery_check_failures_total', reason='unavailable')
+        self.metrics.observe('battery_check_duration_seconds', time.perf_counter() - start)
+
+    def collect(self, metrics):
+        """Refresh the values that are read rather than counted, at scrape time."""
+        record_readings(metrics, self.states)
+        metrics.set('battery_ha_connected', self.connected)
+        for flag, count in self.notifier.sent.items():
+            metrics.set('battery_alerts_total', count, flag=flag)
+
+    def apply(self, event):
+        """Fold a state_changed event into the mirror; return its entity_id if watched."""
+        data = event.get('data', {})
+        entity_id = data.get('entity_id')
+        if entity_id not in self.watched:
+            return None
+        self.states[entity_id] = data.get('new_state')
+        if self.history is not None:
+            self.history.record(entity_id, numeric_state(self.states, entity_id))
+        return entity_id
+
+    async def session(self, http):
+        """One connected session: subscribe, resync, then react to events."""
+        ws = await HAWebSocket(self.config['HA_URL'], self.config['HA_TOKEN'], http).connect()
+        self.ws = ws
+        try:
+            events = await ws.subscribe_events('state_changed')
+            with self.metrics.timer('battery_fetch_duration_seconds'):
+                states = await ws.get_states()
+            self.states = {s['entity_id']: s for s in states if s['entity_id'] in self.watched}
+            if self.history is not None:
+                for entity_id in self.states:
+                    self.history.record(entity_id, numeric_state(self.states, entity_id))
+            self.connected = True
+            log(f"connected; tracking {len(self.states)} of {len(self.watched)} sensors")
+            self.check()
+            while True:
+                event = await events.get()
+                if event is None:
+                    raise ConnectionError('event stream closed')
+                entity_id = self.apply(event)
+                if entity_id:
+                    self.metrics.inc('battery_events_total')
+                    self.check(self.rules.affected(entity_id), entity_id in BANK_SENSORS)
+        finally:
+            self.ws = None
+            await ws.close()
+
+    async def serve_metrics(self):
+        """Serve /metrics on METRICS_PORT ('port' or 'host:port'); returns the runner."""
+        from aiohttp import web
+
+        async def handler(request):
+            return web.Response(text=self.metrics.render(), content_type='text/plain',
+                                charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+        host, _, port = self.config['METRICS_PORT'].rpartition(':')
+        app = web.Application()
+        app.router.add_get('/metrics', handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host or None, int(port)).start()
+        log(f"serving metrics on :{port}/metrics")
+        return runner
+
+    async def write_metrics(self):
+        """Rewrite METRICS_FILE every TEXTFILE_PERIOD seconds."""
+        while True:
+            try:
+                self.metrics.write(self.config['METRICS_FILE'])
+            except OSError as e:
+                log(f"metrics: {e}")
+            await asyncio.sleep(TEXTFILE_PERIOD)
+
+    async def run(self):
+        """Run forever, reconnecting with exponential backoff."""
+        backoff = 1
+        tasks = [asyncio.create_task(self.notifier.run())]
+        if self.config['METRICS_FILE']:
+            tasks.append(asyncio.create_task(self.write_metrics()))
+        try:
+            runner = await self.serve_metrics() if self.config['METRICS_PORT'] else None
+        except (OSError, ValueError) as e:
+            for task in tasks:
+                task.cancel()
+            sys.exit(f"ERROR: METRICS_PORT: {e}")
+        try:
+            async with aiohttp.ClientSession() as http:
+                while True:
+                    self.connected = False
+                    try:
+                        await self.session(http)
+                    except (aiohttp.ClientError, ConnectionError, HAError, asyncio.TimeoutError) as e:
+                        if self.connected:
+                            backoff = 1
+                        self.metrics.inc('battery_check_failures_total', reason='ha')
+                        log(f"disconnected: {e}; retrying in {backoff}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(MAX_BACKOFF, backoff * 2)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if runner is not None:
+                await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Event-driven battery monitor daemon')
+    parser.add_argument('--config', default=str(CONFIG_FILE), help='Config file path')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    try:
+        daemon = BatteryDaemon(config)
+    except (OSError, RuleError) as e:
+        sys.exit(f"ERROR: rules: {e}")
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""Pull long-term bank and cell history from HA and report daily statistics.
+
+`pull` walks /api/history/period one day at a time and appends each
+sensor's changes to a columnar archive. Each sensor gets two raw files,
+<n>.t (uint32 epoch seconds) and <n>.v (int16 millivolts; unavailable
+states stored as MISSING). Memory stays at one day's response, and a
+re-run resumes after the last day stored.
+
+`stats` resamples the archive to a one-minute sample-and-hold grid, a
+month at a time. With NumPy it computes per day:
+- bank min/max voltage, and depth of discharge estimated from a LiFePO4
+  resting-voltage curve (rough: readings under load sag)
+- minutes each bank spent below THRESHOLD, and minutes both did (the alert
+  condition)
+- max and mean cell spread (highest minus lowest cell) per BMS bank
+
+A year of one-minute data for all 18 sensors is ~60 MB on disk and takes a
+few seconds.
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).parent))
+from battery_monitor import (
+    BANK_NAMES, BANK_SENSORS, CELL_BANKS, CELLS_PER_BANK, CONFIG_FILE, load_config,
+    watched_entities
+)
+from ha_client import HAClient, HAError
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: Run: pip install numpy  (Debian/Ubuntu: sudo apt install python3-numpy)")
+    sys.exit(1)
+
+ARCHIVE_DIR = Path.home() / '.local' / 'share' / 'battery-monitor' / 'archive'
+MISSING = np.iinfo(np.int16).min
+MAX_MV = np.iinfo(np.int16).max
+TIME_DTYPE = np.dtype(np.uint32)  # epoch seconds, good until 2106
+DAY = 86400
+MINUTES = 1440
+BLOCK_DAYS = 31
+HOLD = 6 * 3600  # HA records changes only; a quiet sensor holds its value this long
+DEFAULT_DAYS = 30
+
+# LiFePO4 resting voltage per cell -> state of charge (%)
+LFP_OCV = np.array([2.50, 2.90, 3.00, 3.20, 3.22, 3.25, 3.26, 3.27, 3.28, 3.29, 3.30, 3.32, 3.35, 3.40])
+LFP_SOC = np.array([0, 5, 9, 17, 20, 30, 40, 50, 60, 70, 80, 90, 99, 100])
+
+
+class Archive:
+    """Append-only columnar store: per-sensor time and millivolt columns."""
+
+    def __init__(self, path, sensors=None):
+        self.path = Path(path)
+        meta = self._read_meta()
+        self.sensors = meta.get('sensors') or sorted(sensors or [])
+        self.until = meta.get('until')
+        for sensor in sensors or []:
+            if sensor not in self.sensors:
+                self.sensors.append(sensor)
+
+    def _read_meta(self):
+        try:
+            return json.loads((self.path / 'archive.json').read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def save_meta(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / 'archive.json.tmp'
+        tmp.write_text(json.dumps({'sensors': self.sensors, 'until': self.until}))
+        tmp.replace(self.path / 'archive.json')
+
+    def _files(self, sensor):
+        n = self.sensors.index(sensor)
+        return self.path / f'{n}.t', self.path / f'{n}.v'
+
+    def last_time(self, sensor):
+        t_file, _ = self._files(sensor)
+        size = t_file.stat().st_size if t_file.exists() else 0
+        if size < TIME_DTYPE.itemsize:
+            return None
+        return int(np.fromfile(t_file, dtype=TIME_DTYPE, offset=size - TIME_DTYPE.itemsize)[0])
+
+    def append(self, sensor, times, millivolts):
+        """Append samples newer than the last stored one."""
+        last = self.last_time(sensor)
+        if last is not None:
+            keep = times > last
+            times, millivolts = times[keep], millivolts[keep]
+        if not len(times):
+            return 0
+        t_file, v_file = self._files(sensor)
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(v_file, 'ab') as f:
+            millivolts.astype(np.int16).tofile(f)
+        with open(t_file, 'ab') as f:
+            times.astype(TIME_DTYPE).tofile(f)
+        return len(times)
+
+    def read(self, sensor):
+        """(times, millivolts) as read-only memmaps (empty arrays if none)."""
+        t_file, v_file = self._files(sensor)
+        if not t_file.exists() or t_file.stat().st_size == 0:
+            return np.empty(0, TIME_DTYPE), np.empty(0, np.int16)
+        times = np.memmap(t_file, dtype=TIME_DTYPE, mode='r')
+        values = np.memmap(v_file, dtype=np.int16, mode='r')
+        n = min(len(times), len(values))  # a crash between the two appends
+        return times[:n], values[:n]
+
+
+def _epoch(iso):
+    return int(datetime.fromisoformat(iso.replace('Z', '+00:00')).timestamp())
+
+
+def parse_history(rows):
+    """One entity's history list -> (times, millivolts) arrays."""
+    times = np.fromiter((_epoch(r['last_changed']) for r in rows), dtype=np.int64, count=len(rows))
+    millivolts = np.empty(len(rows), dtype=np.int16)
+    for i, row in enumerate(rows):
+        try:
+            mv = round(float(row['state']) * 1000)
+        except (TypeError, ValueError, OverflowError):
+            mv = MISSING  # 'unavailable', None, NaN, infinity
+        # Past the int16 range (a glitch, or a bank over 32.767 V): no reading
+        millivolts[i] = mv if MISSING < mv <= MAX_MV else MISSING
+    order = np.argsort(times, kind='stable')
+    return times[order], millivolts[order]
+
+
+def fetch_day(client, sensors, start, end):
+    """One /api/history/period chunk as {entity_id: rows}."""
+    path = (f"/api/history/period/{quote(start.isoformat())}"
+            f"?end_time={quote(end.isoformat())}"
+            f"&filter_entity_id={','.join(sensors)}"
+            f"&minimal_response&no_attributes&significant_changes_only=0")
+    result = {}
+    for rows in client.request('GET', path) or []:
+        if rows:
+            result[rows[0]['entity_id']] = rows
+    return result
+
+
+def pull(client, archive, start, end, progress=None):
+    """Fetch [start, end) a day at a time into the archive; returns samples added."""
+    added = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(end, chunk_start + timedelta(days=1))
+        for sensor, rows in fetch_day(client, archive.sensors, chunk_start, chunk_end).items():
+            if sensor in archive.sensors:
+                added += archive.append(sensor, *parse_history(rows))
+        archive.until = chunk_end.isoformat()
+        archive.save_meta()
+        if progress:
+            progress(chunk_end, added)
+        chunk_start = chunk_end
+    return added
+
+
+def resample(times, millivolts, grid, hold=HOLD):
+    """Sample-and-hold onto grid (epoch seconds) as float32 volts, NaN when unknown."""
+    if not len(times):
+        return np.full(len(grid), np.nan, dtype=np.float32)
+    idx = np.searchsorted(times, grid, side='right') - 1
+    safe = np.clip(idx, 0, None)
+    raw = np.asarray(millivolts[safe])
+    volts = raw.astype(np.float32) / 1000
+    age = grid - np.asarray(times[safe]).astype(np.int64)
+    volts[(idx < 0) | (raw == MISSING) | (age > hold)] = np.nan
+    return volts
+
+
+def soc(cell_volts):
+    """Rough LiFePO4 state of charge (%) from per-cell voltage."""
+    return np.interp(cell_volts, LFP_OCV, LFP_SOC, left=0, right=100)
+
+
+def _day_starts(first, last):
+    """Local-midnight epoch seconds for every day from first to last inclusive."""
+    days = (last - first).days + 1
+    return [int(datetime.combine(first + timedelta(days=i), datetime.min.time()).timestamp())
+            for i in range(days)]
+
+
+def _nan_stat(fn, values):
+    """fn over the last axis; NaN (without a warning) where a row has no data."""
+    rows = (~np.isnan(values)).any(axis=-1)
+    out = np.full(values.shape[:-1], np.nan, dtype=np.float32)
+    if rows.any():
+        out[rows] = fn(values[rows], axis=-1)
+    return out
+
+
+def daily_stats(archive, first, last, threshold):
+    """Yield one stats dict per day, computed a block of days at a time."""
+    day_starts = _day_starts(first, last)
+    minute = np.arange(MINUTES, dtype=np.int64) * 60
+    for b in range(0, len(day_starts), BLOCK_DAYS):
+        starts = np.array(day_starts[b:b + BLOCK_DAYS], dtype=np.int64)
+        grid = (starts[:, None] + minute[None, :]).ravel()
+        shape = (len(starts), MINUTES)
+
+        banks = np.stack([resample(*archive.read(s), grid) for s in BANK_SENSORS]).reshape(
+            (len(BANK_SENSORS),) + shape)
+        with np.errstate(invalid='ignore'):
+            below = banks < threshold
+        bank_min = _nan_stat(np.nanmin, banks)
+        bank_max = _nan_stat(np.nanmax, banks)
+        dod = soc(bank_max / CELLS_PER_BANK) - soc(bank_min / CELLS_PER_BANK)
+        coverage = (~np.isnan(banks)).mean(axis=2)
+        minutes_below = below.sum(axis=2)
+        both_below = below.all(axis=0).sum(axis=1)
+
+        spreads = {}
+        for bank_name, prefix, _ in CELL_BANKS:
+            cells = np.stack([resample(*archive.read(f'{prefix}{i}'), grid)
+                              for i in range(1, CELLS_PER_BANK + 1)])
+            known = (~np.isnan(cells)).sum(axis=0) >= 2
+            spread = np.full(grid.shape, np.nan, dtype=np.float32)
+            spread[known] = np.nanmax(cells[:, known], axis=0) - np.nanmin(cells[:, known], axis=0)
+            spread = spread.reshape(shape)
+            spreads[bank_name] = (_nan_stat(np.nanmax, spread), _nan_stat(np.nanmean, spread))
+
+        for d, start in enumerate(starts):
+            record = {'date': date.fromtimestamp(int(start)).isoformat(), 'banks': {}, 'cells': {},
+                      'both_below_min': int(both_below[d])}
+            for s, sensor in enumerate(BANK_SENSORS):
+                record['banks'][BANK_NAMES[sensor]] = {
+                    'min': _round(bank_min[s, d], 2),
+                    'max': _round(bank_max[s, d], 2),
+                    'dod_pct': _round(dod[s, d], 0),
+                    'below_min': int(minutes_below[s, d]),
+                    'coverage': _round(coverage[s, d], 2),
+                }
+            for bank_name, (peak, mean) in spreads.items():
+                record['cells'][bank_name] = {
+                    'spread_max_mv': _round(peak[d] * 1000, 0),
+                    'spread_mean_mv': _round(mean[d] * 1000, 0),
+                }
+            yield record
+
+
+def _round(value, digits):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def _fmt(value, spec):
+    return '—' if value is None else format(value, spec)
+
+
+def print_stats(records, threshold):
+    names = [BANK_NAMES[s] for s in BANK_SENSORS]
+    cell_names = [name for name, _, _ in CELL_BANKS]
+    print(f"{'date':<10}  " + '  '.join(f"{n.replace(' amp hour', 'Ah'):>23}" for n in names)
+          + f"  {'both<':>6}  " + '  '.join(f"{n.replace(' amp hour', 'Ah') + ' spread':>17}"
+                                           for n in cell_names))
+    print(f"{'':<10}  " + '  '.join(f"{'min–max V':>11} {'DoD':>4} {'<' + format(threshold, 'g'):>6}"
+                                    for _ in names)
+          + f"  {'min':>6}  " + '  '.join(f"{'max/avg mV':>17}" for _ in cell_names))
+    for r in records:
+        line = f"{r['date']:<10}  "
+        for n in names:
+            b = r['banks'][n]
+            line += (f"{_fmt(b['min'], '.2f'):>5}–{_fmt(b['max'], '.2f'):<5} "
+                     f"{_fmt(b['dod_pct'], '.0f'):>3}% {b['below_min']:>6}  ")
+        line += f"{r['both_below_min']:>6}  "
+        line += '  '.join(f"{_fmt(c['spread_max_mv'], '.0f'):>8}/{_fmt(c['spread_mean_mv'], '.0f'):<8}"
+                          for c in (r['cells'][n] for n in cell_names))
+        print(line.rstrip())
+
+
+def _parse_date(text):
+    return date.fromisoformat(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Battery history archive and daily statistics')
+    parser.add_argument('--config', default=str(CONFIG_FILE), help='Config file path')
+    parser.add_argument('--archive', help=f'Archive directory (default: ARCHIVE_DIR or {ARCHIVE_DIR})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('pull', help='Fetch history from HA into the archive')
+    p.add_argument('--days', type=int, default=DEFAULT_DAYS,
+                   help=f'Days back to start a new archive (default: {DEFAULT_DAYS})')
+    p.add_argument('--since', type=_parse_date, help='Start date (default: resume)')
+
+    p = sub.add_parser('stats', help='Daily min/max, DoD, cell spread and time below threshold')
+    p.add_argument('--since', type=_parse_date, help='First day (default: 30 days ago)')
+    p.add_argument('--until', type=_parse_date, help='Last day (default: today)')
+    p.add_argument('--json', action='store_true', help='One JSON object per day')
+    args = parser.parse_args()
+
+    config = load_config(args.config, require_ha=args.command == 'pull')
+    archive = Archive(args.archive or config.get('ARCHIVE_DIR') or ARCHIVE_DIR,
+                      sorted(watched_entities()))
+
+    if args.command == 'pull':
+        now = datetime.now().astimezone()
+        if args.since:
+            start = datetime.combine(args.since, datetime.min.time()).astimezone()
+        elif archive.until:
+            start = datetime.fromisoformat(archive.until)
+        else:
+            start = now - timedelta(days=args.days)
+        client = HAClient(config['HA_URL'], config['HA_TOKEN'], timeout=120)
+        began = time.monotonic()
+
+        def progress(day_end, added):
+            print(f"  {day_end:%Y-%m-%d %H:%M}  {added} samples", file=sys.stderr, flush=True)
+
+        try:
+            added = pull(client, archive, start, now, progress)
+        except HAError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            client.close()
+        print(f"✅ {added} samples in {time.monotonic() - began:.1f}s → {archive.path}")
+        return
+
+    until = args.until or date.today()
+    since = args.since or until - timedelta(days=DEFAULT_DAYS - 1)
+    threshold = float(config['THRESHOLD'])
+    records = daily_stats(archive, since, until, threshold)
+    if args.json:
+        for record in records:
+            print(json.dumps(record))
+    else:
+        print_stats(records, threshold)
+
+
+if __name__ == '__main__':
+    main()
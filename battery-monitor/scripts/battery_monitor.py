@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""Battery bank and cell overvoltage monitor: one process, one state fetch.
+
+Replaces battery-monitor.sh and cell-overvoltage-monitor.sh. Those ran 18
+curls and ~55 python3 spawns per minute. This pulls every sensor in a single
+/api/states request, compares the values in-process and reuses the same
+connection for any Alexa announcement. The two checks are built-in rules
+(see rules.py), and RULES_FILE can add more. Flag files and reset behaviour
+are unchanged:
+
+- bank: announce once when both banks are below THRESHOLD; clear the flag
+  as soon as either bank is back at or above it.
+- cells: announce once per bank when any cell is at or above HIGH_THRESHOLD;
+  clear the flag only when every reporting cell is at or below
+  RESET_THRESHOLD.
+
+With --loop it stays running and polls at an adaptive interval: seconds
+near a threshold and up to POLL_MAX when far away (see cadence.py).
+"""
+
+import argparse
+import os
+import shlex
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from ha_client import HAClient, HAError
+from metrics import Metrics, reported_at
+from notify import DELIVERY_ERRORS, deliver
+from rules import RuleError, compile_rules, load_rules_file, merge_specs, numeric_state
+
+CONFIG_FILE = Path.home() / '.config' / 'battery-monitor' / 'config'
+
+DEFAULTS = {
+    'THRESHOLD': '26.0',
+    'HIGH_THRESHOLD': '3.6',
+    'RESET_THRESHOLD': '3.39',
+    'TARGETS': 'media_player.north_echo,media_player.hallway_echo',
+    'FLAG_DIR': '/tmp',
+    'PREDICT_HORIZON': '60',
+    'TREND_WINDOW': '15',
+    'HISTORY_DIR': '',
+    'RULES_FILE': '',
+    'ARCHIVE_DIR': '',
+    'METRICS_FILE': '',
+    'METRICS_PORT': '',
+    'POLL_MIN': '5',
+    'POLL_MAX': '300',
+}
+
+BANK_SENSORS = [
+    'sensor.power_room_250ah_battery_bank_measured_voltage',
+    'sensor.power_room_500ah_battery_bank_measured_voltage',
+]
+BANK_FLAG = 'battery-low-reported'
+BANK_NAMES = {
+    'sensor.power_room_250ah_battery_bank_measured_voltage': '250 amp hour',
+    'sensor.power_room_500ah_battery_bank_measured_voltage': '500 amp hour',
+}
+# A trend needs readings over at least this share of TREND_WINDOW
+TREND_COVERAGE = 0.5
+
+# (spoken bank name, cell sensor prefix, flag file name)
+CELL_BANKS = [
+    ('150 amp hour', 'sensor.bms_battery_150ah_cell_voltage_', 'cell-overvoltage-150ah'),
+    ('500 amp hour', 'sensor.bms_battery_500ah_cell_voltage_', 'cell-overvoltage-500ah'),
+]
+CELLS_PER_BANK = 8
+
+
+def load_config(path=CONFIG_FILE, require_ha=True):
+    """Read the shell-style config; like `source`, file values override env."""
+    config = dict(DEFAULTS)
+    config.update({k: v for k, v in os.environ.items() if k in DEFAULTS or k.startswith('HA_')})
+    path = Path(path)
+    if path.exists():
+        for line in path.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, _, value = line.partition('=')
+            key = key.strip().removeprefix('export ').strip()
+            parsed = shlex.split(value, comments=True)
+            config[key] = os.path.expandvars(parsed[0]) if parsed else ''
+    for key in ('HA_URL', 'HA_TOKEN') if require_ha else ():
+        if not config.get(key):
+            sys.exit(f"{key}: Set {key} in {path} or env")
+    return config
+
+
+def targets(config):
+    return [t.strip() for t in config['TARGETS'].split(',') if t.strip()]
+
+
+class FlagStore:
+    """Report-once flags as files, compatible with the old /tmp flags."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def is_set(self, name):
+        return (self.directory / name).exists()
+
+    def set(self, name):
+        (self.directory / name).touch()
+
+    def clear(self, name):
+        (self.directory / name).unlink(missing_ok=True)
+
+
+def default_rules(config):
+    """The two shell-script checks as rule specs, levels taken from the config."""
+    specs = [{
+        'name': 'battery-low',
+        'group': 'bank',
+        'flag': BANK_FLAG,
+        'entities': BANK_SENSORS,
+        'when': 'all',
+        'below': config['THRESHOLD'],
+        'message': 'The battery voltage is below {max:.2f} volts.',
+    }]
+    for bank_name, prefix, flag in CELL_BANKS:
+        specs.append({
+            'name': flag,
+            'group': 'cells',
+            'entities': f'{prefix}{{1..{CELLS_PER_BANK}}}',
+            'when': 'any',
+            'above': config['HIGH_THRESHOLD'],
+            'reset': config['RESET_THRESHOLD'],
+            'message': f'Warning! {bank_name} bank overvoltage. {{items}}',
+            'item': 'Cell {index} at {value:.3f} volts. ',
+        })
+    return specs
+
+
+def load_rules(config):
+    """Built-in battery rules, overlaid by RULES_FILE when set."""
+    specs = default_rules(config)
+    if config.get('RULES_FILE'):
+        specs = merge_specs(specs, load_rules_file(config['RULES_FILE']))
+    return compile_rules(specs)
+
+
+def evaluate_trends(history, config, flags, now=None):
+    """Predict when each bank will cross THRESHOLD; return announcements owed.
+
+    A bank is announced once when its trend over TREND_WINDOW minutes
+    reaches THRESHOLD within PREDICT_HORIZON minutes. The prediction flag
+    resets when the ETA moves beyond 1.5x the horizon, or when the bank is
+    already below THRESHOLD and the regular alert applies.
+    """
+    from timeseries import slopes, time_to_threshold
+    import numpy as np
+
+    horizon = float(config['PREDICT_HORIZON']) * 60
+    if horizon <= 0:
+        return []
+    threshold = float(config['THRESHOLD'])
+    times, volts = history.window(BANK_SENSORS, int(float(config['TREND_WINDOW']) * 60), now)
+    coverage = (~np.isnan(volts)).mean(axis=1)
+    current = history.latest(BANK_SENSORS, now)
+    eta = time_to_threshold(current, slopes(times, volts), threshold)
+
+    announcements = []
+    for sensor, v, seconds, covered in zip(BANK_SENSORS, current, eta, coverage):
+        flag = f"battery-low-predicted-{sensor.split('_')[2]}"
+        if np.isnan(v):
+            continue
+        if v < threshold or seconds > 1.5 * horizon:
+            flags.clear(flag)
+        elif seconds <= horizon and covered >= TREND_COVERAGE and not flags.is_set(flag):
+            minutes = max(1, round(seconds / 60))
+            announcements.append((f"The {BANK_NAMES[sensor]} bank will reach {config['THRESHOLD']} volts "
+                                  f"in about {minutes} minutes.", flag))
+    return announcements
+
+
+def open_history(config):
+    """Voltage history for trend alerts, persisted when HISTORY_DIR is set."""
+    from timeseries import VoltageHistory
+    return VoltageHistory(sorted(watched_entities()), path=config['HISTORY_DIR'] or None)
+
+
+def watched_entities():
+    """Every battery sensor, the set the voltage history keeps."""
+    cells = [f'{prefix}{i}' for _, prefix, _ in CELL_BANKS for i in range(1, CELLS_PER_BANK + 1)]
+    return set(BANK_SENSORS) | set(cells)
+
+
+def record_readings(metrics, states, now=None):
+    """Set voltage, availability and age gauges for every battery sensor."""
+    now = time.time() if now is None else now
+    series = [(e, 'battery_bank_voltage_volts', {'bank': e.split('_')[2]}) for e in BANK_SENSORS]
+    for _, prefix, flag in CELL_BANKS:
+        series += [(f'{prefix}{i}', 'battery_cell_voltage_volts', {'bank': flag.rsplit('-', 1)[1], 'cell': i})
+                   for i in range(1, CELLS_PER_BANK + 1)]
+    for entity_id, name, labels in series:
+        value = numeric_state(states, entity_id)
+        metrics.set('battery_sensor_available', value is not None, entity_id=entity_id)
+        if value is None:
+            metrics.drop(name, **labels)
+        else:
+            metrics.set(name, value, **labels)
+        reported = reported_at(states.get(entity_id) or {})
+        if reported is not None:
+            metrics.set('battery_sensor_age_seconds', max(0.0, now - reported), entity_id=entity_id)
+
+
+def announce(client, config, message):
+    client.call_service('notify', 'alexa_media', {'message': message, 'target': targets(config)})
+
+
+def fetch_states(client, metrics):
+    with metrics.timer('battery_fetch_duration_seconds'):
+        return {s['entity_id']: s for s in client.get_states()}
+
+
+def run_checks(client, config, which='all', rules=None, metrics=None, states=None):
+    """Run one rule group (or all rules) against one /api/states snapshot.
+
+    Owed announcements go out as one message, and flags are set only once HA
+    accepts it. Returns False when an `all` rule, such as the bank check, could
+    not read every entity, or when the announcement could not be delivered.
+    """
+    rules = rules or load_rules(config)
+    metrics = metrics or Metrics()
+    start = time.perf_counter()
+    if states is None:
+        states = fetch_states(client, metrics)
+    record_readings(metrics, states)
+    flags = FlagStore(config['FLAG_DIR'])
+    announcements, ok = rules.evaluate(states, flags, rules.select(which))
+
+    # Trends need history across runs, so cron only predicts with HISTORY_DIR
+    if config['HISTORY_DIR'] and which in ('all', 'bank'):
+        history = open_history(config)
+        for entity_id in history.sensors:
+            history.record(entity_id, numeric_state(states, entity_id))
+        announcements += evaluate_trends(history, config, flags)
+        history.flush()
+
+    def send(message):
+        with metrics.timer('battery_notify_duration_seconds'):
+            try:
+                announce(client, config, message)
+            except DELIVERY_ERRORS:
+                metrics.inc('battery_notify_failures_total')
+                raise
+
+    delivered = deliver(send, flags, announcements)
+    if delivered:
+        for _, flag in announcements:
+            metrics.inc('battery_alerts_total', flag=flag)
+    else:
+        metrics.inc('battery_check_failures_total', reason='notify')
+    if not ok:
+        metrics.inc('battery_check_failures_total', reason='unavailable')
+    if ok and delivered:
+        metrics.set('battery_last_success_timestamp_seconds', time.time())
+    metrics.inc('battery_checks_total')
+    metrics.observe('battery_check_duration_seconds', time.perf_counter() - start)
+    return ok and delivered
+
+
+def write_metrics(config, metrics):
+    if config['METRICS_FILE']:
+        try:
+            metrics.write(config['METRICS_FILE'])
+        except OSError as e:
+            print(f"ERROR: metrics: {e}", file=sys.stderr)
+
+
+def run_loop(client, config, which, rules, metrics):
+    """Check forever, sleeping as long as the nearest threshold allows."""
+    from cadence import POLL_UNKNOWN, Cadence
+
+    cadence = Cadence(float(config['POLL_MIN']), float(config['POLL_MAX']))
+    selected = rules.select(which)
+    watched = {e for rule in selected for e in rule.entities}
+    flags = FlagStore(config['FLAG_DIR'])
+    while True:
+        started = time.monotonic()
+        try:
+            states = fetch_states(client, metrics)
+        except HAError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            metrics.inc('battery_checks_total')
+            metrics.inc('battery_check_failures_total', reason='ha')
+            delay = POLL_UNKNOWN
+        else:
+            run_checks(client, config, which, rules, metrics, states)
+            for entity_id in watched:
+                cadence.observe(entity_id, numeric_state(states, entity_id), started)
+            intervals = cadence.intervals(selected, flags)
+            for group, seconds in intervals.items():
+                metrics.set('battery_poll_interval_seconds', seconds, group=group)
+            delay = min(intervals.values())
+        write_metrics(config, metrics)
+        time.sleep(max(0.0, delay - (time.monotonic() - started)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check battery bank and cell voltages')
+    parser.add_argument('--check', default='all',
+                        help='Rule group to run: all, bank, cells or a RULES_FILE group (default: all)')
+    parser.add_argument('--config', default=str(CONFIG_FILE), help='Config file path')
+    parser.add_argument('--loop', action='store_true',
+                        help='Keep polling at an adaptive interval (POLL_MIN..POLL_MAX seconds)')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    try:
+        rules = load_rules(config)
+    except (OSError, RuleError) as e:
+        sys.exit(f"ERROR: rules: {e}")
+    if not rules.select(args.check):
+        sys.exit(f"ERROR: unknown check {args.check!r}; groups: {', '.join(rules.groups)}")
+    # Counters carry over from the previous run's textfile
+    metrics = Metrics().load(config['METRICS_FILE']) if config['METRICS_FILE'] else Metrics()
+    client = HAClient(config['HA_URL'], config['HA_TOKEN'])
+    if args.loop:
+        try:
+            run_loop(client, config, args.check, rules, metrics)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        finally:
+            client.close()
+    try:
+        ok = run_checks(client, config, args.check, rules, metrics)
+    except HAError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        metrics.inc('battery_checks_total')
+        metrics.inc('battery_check_failures_total', reason='ha')
+        ok = False
+    finally:
+        client.close()
+        write_metrics(config, metrics)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,8 +10,9 @@ HA_TOKEN="${HA_TOKEN:?Set HA_TOKEN in $CONFIG_FILE or env}"
 HIGH_THRESHOLD="${HIGH_THRESHOLD:-3.6}"
 RESET_THRESHOLD="${RESET_THRESHOLD:-3.39}"
 TARGETS="${TARGETS:-media_player.north_echo,media_player.hallway_echo}"
-FLAG_150="/tmp/cell-overvoltage-150ah"
-FLAG_500="/tmp/cell-overvoltage-500ah"
+FLAG_DIR="${FLAG_DIR:-/tmp}"
+FLAG_150="$FLAG_DIR/cell-overvoltage-150ah"
+FLAG_500="$FLAG_DIR/cell-overvoltage-500ah"
 
 get_voltage() {
   curl -s -H "Authorization: Bearer $HA_TOKEN" "$HA_URL/api/states/$1" | python3 -c "import json,sys; print(json.load(sys.stdin)['state'])" 2>/dev/null
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Minimal Home Assistant REST client over one kept-alive connection.
+
+Standard library only, so the cron path stays a single cheap process on the
+controller box.
+"""
+
+import http.client
+import json
+from urllib.parse import urlsplit
+
+# Safe to replay when the response was lost; service calls (POST) are not
+IDEMPOTENT = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+
+class HAError(Exception):
+    """Home Assistant request failed (transport error or non-2xx status)."""
+
+
+class HAUnknownOutcome(HAError):
+    """A non-idempotent request was sent but its response was lost; it may have run."""
+
+
+class HAClient:
+    """Sequential REST client that reuses a single HTTP(S) connection."""
+
+    def __init__(self, url, token, timeout=10):
+        parts = urlsplit(url)
+        self._scheme = parts.scheme or 'http'
+        self._netloc = parts.netloc
+        self._base = parts.path.rstrip('/')
+        self._timeout = timeout
+        self._headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+        }
+        self._conn = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self._scheme == 'https' else http.client.HTTPConnection
+        return cls(self._netloc, timeout=self._timeout)
+
+    def request(self, method, path, body=None):
+        """Send a request and return the decoded JSON body.
+
+        A dropped keep-alive connection is reopened and retried once, but a
+        request that is not idempotent is never sent twice: it goes out on a
+        fresh connection and is retried only if connecting failed. Losing its
+        response raises HAUnknownOutcome.
+        """
+        payload = json.dumps(body).encode() if body is not None else None
+        if method not in IDEMPOTENT:
+            # A stale keep-alive could swallow it after sending; start fresh
+            self.close()
+        for attempt in (1, 2):
+            sent = False
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                    self._conn.connect()
+                sent = True
+                self._conn.request(method, self._base + path, body=payload, headers=self._headers)
+                resp = self._conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if sent and method not in IDEMPOTENT:
+                    raise HAUnknownOutcome(f'{method} {path}: sent, response lost: {e}') from e
+                if attempt == 2:
+                    raise HAError(f'{method} {path}: {e}') from e
+                continue
+            if resp.status >= 300:
+                raise HAError(f'{method} {path}: HTTP {resp.status}')
+            return json.loads(data) if data else None
+
+    def get_states(self):
+        """All entity states in one request."""
+        return self.request('GET', '/api/states')
+
+    def get_state(self, entity_id):
+        return self.request('GET', f'/api/states/{entity_id}')
+
+    def call_service(self, domain, service, data):
+        return self.request('POST', f'/api/services/{domain}/{service}', data)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Local Home Assistant stand-in for exercising the monitors without real batteries.
+
+It serves the parts of HA the monitors use:
+- REST: GET /api/states, GET /api/states/<id>, POST /api/services/<domain>/<service>
+- WebSocket /api/websocket: auth, get_states, subscribe_events (state_changed),
+  call_service
+
+Control endpoints (no auth) let a test drive it:
+- POST /standin/states   {"entity_id": "3.61", ...}  set states, broadcast events
+- GET  /standin/calls    service calls received so far
+- POST /standin/drop     close every WebSocket (reconnect testing)
+- POST /standin/fail     {"count": n}  fail the next n service calls
+
+It can also be embedded: StandIn(token).start(port), then set_states()/calls.
+Pass clock= to timestamp calls on a virtual clock (see replay.py).
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    from aiohttp import web, WSMsgType
+except ImportError:
+    print("ERROR: Run: pip install aiohttp  (Debian/Ubuntu: sudo apt install python3-aiohttp)")
+    sys.exit(1)
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class StandIn:
+    """In-memory HA state plus the REST/WebSocket surface over it."""
+
+    def __init__(self, token='standin-token', clock=time.time):
+        self.token = token
+        self.clock = clock
+        self.states = {}
+        self.calls = []
+        self.fail_calls = 0
+        self._sockets = {}  # ws -> set of subscription ids
+        self._runner = None
+
+    # --------------------------------------------------------
+    # State
+    # --------------------------------------------------------
+
+    def _state_obj(self, entity_id, value):
+        now = _now_iso()
+        return {'entity_id': entity_id, 'state': str(value), 'attributes': {},
+                'last_changed': now, 'last_updated': now}
+
+    async def set_states(self, updates):
+        """Set entity states and push state_changed to every subscriber."""
+        for entity_id, value in updates.items():
+            old = self.states.get(entity_id)
+            new = self._state_obj(entity_id, value)
+            self.states[entity_id] = new
+            event = {'event_type': 'state_changed', 'time_fired': new['last_updated'],
+                     'data': {'entity_id': entity_id, 'old_state': old, 'new_state': new}}
+            for ws, subs in list(self._sockets.items()):
+                for sub_id in subs:
+                    try:
+                        await ws.send_json({'id': sub_id, 'type': 'event', 'event': event})
+                    except ConnectionError:
+                        pass
+
+    def _record_call(self, domain, service, data):
+        """Record a service call; False if it was told to fail instead."""
+        if self.fail_calls > 0:
+            self.fail_calls -= 1
+            return False
+        self.calls.append({'time': self.clock(), 'domain': domain, 'service': service, 'data': data})
+        return True
+
+    @property
+    def subscribers(self):
+        """Number of WebSocket clients with a live event subscription."""
+        return sum(1 for subs in self._sockets.values() if subs)
+
+    # --------------------------------------------------------
+    # HTTP
+    # --------------------------------------------------------
+
+    def _authorized(self, request):
+        return request.headers.get('Authorization') == f'Bearer {self.token}'
+
+    async def _get_states(self, request):
+        if not self._authorized(request):
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        return web.json_response(list(self.states.values()))
+
+    async def _get_state(self, request):
+        if not self._authorized(request):
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        state = self.states.get(request.match_info['entity_id'])
+        if state is None:
+            return web.json_response({'message': 'Entity not found.'}, status=404)
+        return web.json_response(state)
+
+    async def _call_service(self, request):
+        if not self._authorized(request):
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        data = await request.json() if request.can_read_body else {}
+        if not self._record_call(request.match_info['domain'], request.match_info['service'], data):
+            return web.json_response({'message': 'Service call failed'}, status=500)
+        return web.json_response([])
+
+    async def _control_states(self, request):
+        await self.set_states(await request.json())
+        return web.json_response({'ok': True})
+
+    async def _control_calls(self, request):
+        return web.json_response(self.calls)
+
+    async def _control_fail(self, request):
+        self.fail_calls = int((await request.json()).get('count', 1))
+        return web.json_response({'ok': True})
+
+    async def _control_drop(self, request):
+        for ws in list(self._sockets):
+            await ws.close()
+        return web.json_response({'ok': True})
+
+    # --------------------------------------------------------
+    # WebSocket
+    # --------------------------------------------------------
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({'type': 'auth_required', 'ha_version': 'standin'})
+        msg = await ws.receive_json()
+        if msg.get('access_token') != self.token:
+            await ws.send_json({'type': 'auth_invalid', 'message': 'Invalid access token'})
+            await ws.close()
+            return ws
+        await ws.send_json({'type': 'auth_ok', 'ha_version': 'standin'})
+        self._sockets[ws] = set()
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                await self._ws_command(ws, json.loads(msg.data))
+        finally:
+            self._sockets.pop(ws, None)
+        return ws
+
+    async def _ws_command(self, ws, msg):
+        msg_id, kind = msg.get('id'), msg.get('type')
+        result, success = None, True
+        if kind == 'get_states':
+            result = list(self.states.values())
+        elif kind == 'subscribe_events':
+            self._sockets[ws].add(msg_id)
+        elif kind == 'call_service':
+            success = self._record_call(msg['domain'], msg['service'], msg.get('service_data', {}))
+            error = {'code': 'home_assistant_error', 'message': 'Service call failed'}
+        else:
+            success = False
+            error = {'code': 'unknown_command', 'message': f'Unknown command: {kind}'}
+        reply = {'id': msg_id, 'type': 'result', 'success': success, 'result': result}
+        if not success:
+            reply['error'] = error
+        await ws.send_json(reply)
+
+    # --------------------------------------------------------
+    # Lifecycle
+    # --------------------------------------------------------
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/states', self._get_states)
+        app.router.add_get('/api/states/{entity_id}', self._get_state)
+        app.router.add_post('/api/services/{domain}/{service}', self._call_service)
+        app.router.add_get('/api/websocket', self._websocket)
+        app.router.add_post('/standin/states', self._control_states)
+        app.router.add_get('/standin/calls', self._control_calls)
+        app.router.add_post('/standin/drop', self._control_drop)
+        app.router.add_post('/standin/fail', self._control_fail)
+        return app
+
+    async def start(self, port=8123, host='127.0.0.1'):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Home Assistant stand-in')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--token', default='standin-token')
+    parser.add_argument('--states', help='JSON file of {entity_id: state} to start with')
+    args = parser.parse_args()
+
+    async def serve():
+        standin = await StandIn(args.token).start(args.port)
+        if args.states:
+            with open(args.states) as f:
+                await standin.set_states(json.load(f))
+        print(f"HA stand-in on http://127.0.0.1:{args.port} (token: {args.token})", file=sys.stderr)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Home Assistant WebSocket API client (asyncio, aiohttp).
+
+Handles the auth handshake, numbers commands, resolves their results and
+fans subscribed events out to per-subscription queues. When the socket
+drops, every pending command fails and every subscription queue receives
+None, so consumers can reconnect and resync.
+"""
+
+import asyncio
+import itertools
+import sys
+
+try:
+    import aiohttp
+except ImportError:
+    print("ERROR: Run: pip install aiohttp  (Debian/Ubuntu: sudo apt install python3-aiohttp)")
+    sys.exit(1)
+
+from ha_client import HAError, HAUnknownOutcome
+
+
+def websocket_url(base_url):
+    """http(s)://host:8123 -> ws(s)://host:8123/api/websocket"""
+    scheme, _, rest = base_url.rstrip('/').partition('://')
+    return f"{'wss' if scheme == 'https' else 'ws'}://{rest}/api/websocket"
+
+
+class HAWebSocket:
+    """One authenticated WebSocket session."""
+
+    def __init__(self, url, token, session):
+        self._url = websocket_url(url)
+        self._token = token
+        self._session = session
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._subscriptions = {}
+        self._ws = None
+        self._reader = None
+
+    async def connect(self):
+        self._ws = await self._session.ws_connect(self._url, heartbeat=30)
+        msg = await self._ws.receive_json()
+        if msg.get('type') != 'auth_required':
+            raise HAError(f'unexpected greeting: {msg}')
+        await self._ws.send_json({'type': 'auth', 'access_token': self._token})
+        msg = await self._ws.receive_json()
+        if msg.get('type') != 'auth_ok':
+            raise HAError(f"auth failed: {msg.get('message', msg.get('type'))}")
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def _read(self):
+        try:
+            async for msg in self._ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = msg.json()
+                # HA may coalesce several messages into one JSON array frame
+                for item in data if isinstance(data, list) else [data]:
+                    self._dispatch(item)
+        finally:
+            error = ConnectionError('Home Assistant WebSocket closed')
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(error)
+            self._pending.clear()
+            for queue in self._subscriptions.values():
+                queue.put_nowait(None)
+
+    def _dispatch(self, item):
+        if item.get('type') == 'event':
+            queue = self._subscriptions.get(item.get('id'))
+            if queue is not None:
+                queue.put_nowait(item['event'])
+        elif item.get('type') == 'result':
+            fut = self._pending.pop(item.get('id'), None)
+            if fut is not None and not fut.done():
+                if item.get('success'):
+                    fut.set_result(item.get('result'))
+                else:
+                    fut.set_exception(HAError(item.get('error', {}).get('message', 'command failed')))
+
+    async def command(self, type_, timeout=30, **payload):
+        """Send a command and wait for its result.
+
+        Raises HAUnknownOutcome when the connection drops or the wait times
+        out after sending: the command may have run.
+        """
+        msg_id = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        await self._ws.send_json({'id': msg_id, 'type': type_, **payload})
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            self._pending.pop(msg_id, None)
+            raise HAUnknownOutcome(f'{type_}: sent, no result: {e or "timed out"}') from e
+
+    async def subscribe_events(self, event_type):
+        """Subscribe to an event type; returns a queue of events (None = closed)."""
+        msg_id = next(self._ids)
+        queue = asyncio.Queue()
+        self._subscriptions[msg_id] = queue
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = fut
+        await self._ws.send_json({'id': msg_id, 'type': 'subscribe_events', 'event_type': event_type})
+        await asyncio.wait_for(fut, 30)
+        return queue
+
+    async def get_states(self):
+        return await self.command('get_states')
+
+    async def call_service(self, domain, service, data):
+        return await self.command('call_service', domain=domain, service=service, service_data=data)
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
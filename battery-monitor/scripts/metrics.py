@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Prometheus metrics for the battery monitors.
+
+A silent failure used to look just like a quiet battery: a failed fetch
+exited 1 and a stuck sensor kept its last value. Both monitors now record
+what they saw and how it went, in the Prometheus text format:
+
+- cron (battery_monitor.py): every run rewrites METRICS_FILE, e.g. in the
+  node_exporter textfile collector directory. Counters and histograms are
+  read back from the previous file, so they keep counting across runs.
+- daemon (battery_daemon.py): serves /metrics on METRICS_PORT and, with
+  METRICS_FILE set, rewrites the file every TEXTFILE_PERIOD seconds.
+
+Readings: bank and cell voltages, sensor availability and age (seconds since
+HA last heard from it). Health: check/fetch/notify latency histograms, checks,
+check failures by reason, alerts delivered per flag, notify failures and the
+time of the last successful check.
+"""
+
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TEXTFILE_PERIOD = 15
+
+# name -> (type, help)
+METRICS = {
+    'battery_bank_voltage_volts': ('gauge', 'Measured bank voltage.'),
+    'battery_cell_voltage_volts': ('gauge', 'BMS cell voltage.'),
+    'battery_sensor_available': ('gauge', '1 if the sensor has a numeric state, else 0.'),
+    'battery_sensor_age_seconds': ('gauge', 'Seconds since Home Assistant last heard from the sensor.'),
+    'battery_check_duration_seconds': ('histogram', 'Time to run one check, fetch to delivery.'),
+    'battery_fetch_duration_seconds': ('histogram', 'Time to fetch states from Home Assistant.'),
+    'battery_notify_duration_seconds': ('histogram', 'Time for one notify call, failed or not.'),
+    'battery_checks_total': ('counter', 'Checks run.'),
+    'battery_check_failures_total': ('counter', 'Checks that did not complete cleanly, by reason.'),
+    'battery_alerts_total': ('counter', 'Announcements delivered, by flag.'),
+    'battery_notify_failures_total': ('counter', 'Failed notify calls.'),
+    'battery_last_success_timestamp_seconds': ('gauge', 'Unix time of the last clean check.'),
+    'battery_poll_interval_seconds': ('gauge', 'Current adaptive poll interval (--loop), by rule group.'),
+    'battery_ha_connected': ('gauge', '1 while the daemon holds a Home Assistant connection.'),
+    'battery_events_total': ('counter', 'state_changed events received for watched sensors.'),
+}
+
+# Gauges that load() carries over, so a failed run still shows the last success
+PERSISTENT = {'battery_last_success_timestamp_seconds'}
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(name, labels, value):
+    text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f'{name}{{{text}}} {float(value)!r}' if text else f'{name} {float(value)!r}'
+
+
+class Metrics:
+    """In-process registry for the metrics in METRICS.
+
+    Gauges hold the last value set. Counters and histograms only grow.
+    collectors are callables run just before rendering, for values such as
+    sensor age that depend on when they are read.
+    """
+
+    def __init__(self):
+        self.values = {}       # (name, labels) -> float, gauges and counters
+        self.histograms = {}   # (name, labels) -> [bucket counts..., sum, count]
+        self.collectors = []
+
+    def set(self, name, value, **labels):
+        self.values[(name, _labels(labels))] = float(value)
+
+    def drop(self, name, **labels):
+        self.values.pop((name, _labels(labels)), None)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        h = self.histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+    def timer(self, name, **labels):
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self, name, labels)
+
+    def render(self):
+        """The registry as Prometheus text exposition format."""
+        for collect in self.collectors:
+            collect(self)
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = []
+            if kind == 'histogram':
+                for (n, labels), h in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(LATENCY_BUCKETS, h):
+                        samples.append(_format(f'{name}_bucket', labels + (('le', repr(bound)),), count))
+                    samples.append(_format(f'{name}_bucket', labels + (('le', '+Inf'),), h[-1]))
+                    samples.append(_format(f'{name}_sum', labels, h[-2]))
+                    samples.append(_format(f'{name}_count', labels, h[-1]))
+            else:
+                samples = [_format(name, labels, v) for (n, labels), v in sorted(self.values.items())
+                           if n == name]
+            if samples:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', *samples]
+        return '\n'.join(lines) + '\n'
+
+    def load(self, path):
+        """Resume counters, histograms and PERSISTENT gauges from a previous textfile."""
+        try:
+            text = Path(path).read_text()
+        except OSError:
+            return self
+        for line in text.splitlines():
+            match = SAMPLE.match(line)
+            if not match:
+                continue
+            name, raw, value = match.groups()
+            labels = dict(LABEL.findall(raw or ''))
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+            base, _, suffix = name.rpartition('_')
+            if METRICS.get(name, ('',))[0] == 'counter' or name in PERSISTENT:
+                self.values[(name, _labels(labels))] = value
+            elif METRICS.get(base, ('',))[0] == 'histogram' and suffix in ('bucket', 'sum', 'count'):
+                le = labels.pop('le', None)
+                h = self.histograms.setdefault((base, _labels(labels)), [0] * (len(LATENCY_BUCKETS) + 2))
+                if suffix == 'sum':
+                    h[-2] = value
+                elif suffix == 'count':
+                    h[-1] = value
+                elif le != '+Inf':
+                    try:
+                        h[LATENCY_BUCKETS.index(float(le))] = value
+                    except (TypeError, ValueError):
+                        pass  # bucket layout changed; those counts restart
+        return self
+
+    def write(self, path):
+        """Atomically replace path with the rendered metrics (no half-read scrapes)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def reported_at(state):
+    """Epoch seconds HA last heard from an entity (last_reported on 2024.3+), or None."""
+    stamp = state.get('last_reported') or state.get('last_updated') or state.get('last_changed')
+    if not stamp:
+        return None
+    try:
+        return datetime.fromisoformat(stamp.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
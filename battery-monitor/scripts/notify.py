@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Alexa announcement delivery that stays out of the evaluation path.
+
+Alerts owed at the same moment (both banks, a bank and a cell) are coalesced
+into one announcement. A flag is set only after Home Assistant acknowledges
+the notify call, so a lost announcement is retried rather than forgotten.
+The exception is HAUnknownOutcome: the call reached HA but its answer was
+lost. It may already be playing, so it counts as delivered and is not sent
+again.
+
+- Dispatcher: async queue for the daemon. submit() never blocks; a worker
+  task waits a short window for companions, sends, and backs off on failure
+  while monitoring carries on.
+- deliver(): the same coalesce-and-retry for the one-shot cron run.
+"""
+
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from ha_client import HAError, HAUnknownOutcome
+
+COALESCE_WINDOW = 0.5
+MAX_ATTEMPTS = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+DELIVERY_ERRORS = (HAError, ConnectionError, OSError, asyncio.TimeoutError)
+
+
+def coalesce(announcements):
+    """Combine (message, flag) pairs into one (message, [flags])."""
+    messages = [m for m, _ in announcements]
+    message = messages[0] if len(messages) == 1 else ' '.join(m.strip() for m in messages)
+    return message, [f for _, f in announcements]
+
+
+def backoff(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """Exponential delay with jitter for the given 1-based attempt."""
+    return min(cap, base * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+
+
+def deliver(send, flags, announcements, attempts=3, base=BASE_DELAY):
+    """Send announcements as one message, retrying; set flags on success.
+
+    Returns True when delivered, unconfirmed (HAUnknownOutcome) or nothing
+    was owed. On failure the flags stay unset, so the next run announces
+    again.
+    """
+    if not announcements:
+        return True
+    message, names = coalesce(announcements)
+    for attempt in range(1, attempts + 1):
+        try:
+            send(message)
+        except HAUnknownOutcome as e:
+            print(f"WARNING: notify unconfirmed, not resending: {e}", file=sys.stderr)
+        except DELIVERY_ERRORS as e:
+            if attempt == attempts:
+                print(f"ERROR: notify failed after {attempts} attempts: {e}", file=sys.stderr)
+                return False
+            time.sleep(backoff(attempt, base))
+            continue
+        for name in names:
+            flags.set(name)
+        return True
+
+
+class Dispatcher:
+    """Background announcer: coalesce, retry with backoff, commit flags on ack.
+
+    send is an async callable taking the message text. A flag that is already
+    queued or in flight is not queued again. The daemon re-evaluates on every
+    state change, so the same owed alert comes back until it is delivered.
+    """
+
+    def __init__(self, send, flags, window=COALESCE_WINDOW, max_attempts=MAX_ATTEMPTS,
+                 errors=DELIVERY_ERRORS, log=None):
+        self.send = send
+        self.flags = flags
+        self.window = window
+        self.max_attempts = max_attempts
+        self.errors = errors
+        self.log = log or (lambda message: None)
+        self.pending = {}
+        self.in_flight = set()
+        self.delivered = 0
+        self.failed = 0
+        self.sent = {}  # flag -> announcements delivered
+        self._wake = asyncio.Event()
+
+    def submit(self, announcements):
+        """Queue (message, flag) pairs; returns immediately."""
+        for message, flag in announcements:
+            if flag not in self.pending and flag not in self.in_flight:
+                self.pending[flag] = message
+        if self.pending:
+            self._wake.set()
+
+    async def run(self):
+        """Deliver forever. Cancel the task to stop."""
+        attempt = 0
+        while True:
+            await self._wake.wait()
+            await asyncio.sleep(self.window)
+            self._wake.clear()
+            batch = [(m, f) for f, m in self.pending.items()]
+            self.pending.clear()
+            if not batch:
+                continue
+            message, names = coalesce(batch)
+            self.in_flight.update(names)
+            try:
+                await self.send(message)
+            except HAUnknownOutcome as e:
+                self.log(f"notify unconfirmed, not resending: {e}")
+            except self.errors as e:
+                attempt += 1
+                self.failed += 1
+                self.in_flight.difference_update(names)
+                if attempt >= self.max_attempts:
+                    # Give up; the flags stay unset, so the next evaluation resubmits
+                    self.log(f"notify failed, dropping after {attempt} attempts: {e}")
+                    attempt = 0
+                    continue
+                delay = backoff(attempt)
+                self.log(f"notify failed ({e}); retrying in {delay:.0f}s")
+                for m, f in batch:
+                    self.pending.setdefault(f, m)
+                self._wake.set()
+                await asyncio.sleep(delay)
+                continue
+            attempt = 0
+            self.delivered += 1
+            self.in_flight.difference_update(names)
+            for name in names:
+                self.flags.set(name)
+                self.sent[name] = self.sent.get(name, 0) + 1
+            self.log(f"announced: {message}")
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""Replay voltage traces through the monitors, faster than real time.
+
+Each monitor runs against its own ha_standin.StandIn, flag directory and
+HOME. The trace is fed on a virtual clock at --speed (default 1000x), so an
+hour of battery behaviour takes seconds. Real work is never accelerated:
+- cron monitors: every --interval virtual seconds the clock drops to 1x and
+  the check command runs to completion.
+- daemon monitors: run for the whole replay. After each event that should
+  raise an alert, the clock runs at 1x for --settle seconds so the daemon
+  reacts in real time.
+
+The reference is the rule engine run on every trace event, i.e. instant
+detection. Against it each monitor gets:
+- detection latency: first matching announcement minus the event that
+  opened the episode (virtual seconds, including real processing time)
+- missed episodes, duplicate announcements within one episode, and
+  announcements with no episode
+- CPU (user+sys of every child process, via getrusage) and processes forked
+  (/proc/stat, system-wide) per check
+
+Traces are CSV (t,entity_id,state; t in seconds), a battery_history archive
+window, or the built-in synthetic scenario: bank sag, cell spikes with
+re-arm and a flapping cell.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import shlex
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+from battery_monitor import (
+    BANK_SENSORS, CELL_BANKS, CELLS_PER_BANK, CONFIG_FILE, DEFAULTS, load_config, load_rules
+)
+from ha_standin import StandIn
+
+TOKEN = 'replay-token'
+SPEED = 1000
+INTERVAL = 60
+SETTLE = 1.5
+SAMPLE_PERIOD = 10
+
+MONITORS = {
+    'bash': ('cron', f"bash {SCRIPT_DIR / 'battery-monitor.sh'}; "
+                     f"bash {SCRIPT_DIR / 'cell-overvoltage-monitor.sh'}"),
+    'python': ('cron', f"{shlex.quote(sys.executable)} {SCRIPT_DIR / 'battery_monitor.py'} "
+                       f"--config \"$HOME/.config/battery-monitor/config\""),
+    'daemon': ('daemon', f"{shlex.quote(sys.executable)} {SCRIPT_DIR / 'battery_daemon.py'} "
+                         f"--config \"$HOME/.config/battery-monitor/config\""),
+}
+
+
+# ------------------------------------------------------------
+# Traces
+# ------------------------------------------------------------
+
+def synthetic_trace(duration=3600, seed=1):
+    """Bank sag below THRESHOLD, two cell spikes (one re-entering while armed) and a flapping cell.
+
+    Sensors report every SAMPLE_PERIOD seconds, staggered, and like HA only
+    when the rounded value changes.
+    """
+    rng = random.Random(seed)
+    d = duration
+
+    def bank(t):
+        if 0.3 * d <= t < 0.6 * d:
+            return 27.0 - 1.3 * (t - 0.3 * d) / (0.3 * d)
+        if 0.6 * d <= t < 0.7 * d:
+            return 25.7
+        return 27.0
+
+    def cell_150(i, t):
+        if i == 3:
+            for lo, hi, v in ((0.2, 0.25, 3.62), (0.25, 0.3, 3.50), (0.3, 0.32, 3.60), (0.8, 0.85, 3.65)):
+                if lo * d <= t < hi * d:
+                    return v
+        return 3.30
+
+    def cell_500(i, t):
+        if i == 6 and 0.45 * d <= t < 0.55 * d:
+            return 3.61 if int(t // 20) % 2 else 3.59
+        return 3.31
+
+    series = [(s, bank, 2, 0.02) for s in BANK_SENSORS]
+    for (_, prefix, _), fn in zip(CELL_BANKS, (cell_150, cell_500)):
+        for i in range(1, CELLS_PER_BANK + 1):
+            series.append((f'{prefix}{i}', (lambda fn, i: lambda t: fn(i, t))(fn, i), 3, 0.002))
+
+    events = []
+    for n, (entity_id, fn, digits, noise) in enumerate(series):
+        last = None
+        for t in range(n % SAMPLE_PERIOD, d, SAMPLE_PERIOD):
+            value = f'{fn(t) + rng.uniform(-noise, noise):.{digits}f}'
+            if value != last:
+                events.append((float(t), entity_id, value))
+                last = value
+    events.sort()
+    return events
+
+
+def load_trace(path):
+    """CSV of t,entity_id,state (header optional); t is rebased to start at 0."""
+    events = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0] == 't':
+                continue
+            events.append((float(row[0]), row[1], row[2]))
+    events.sort()
+    start = events[0][0] if events else 0
+    return [(t - start, e, v) for t, e, v in events]
+
+
+def archive_trace(path, since, days):
+    """Events from a battery_history archive between since and since + days."""
+    from battery_history import MISSING, Archive
+    from datetime import datetime, timedelta
+
+    start = datetime.combine(since, datetime.min.time()).timestamp()
+    end = start + timedelta(days=days).total_seconds()
+    archive = Archive(path)
+    events = []
+    for sensor in archive.sensors:
+        times, millivolts = archive.read(sensor)
+        for t, mv in zip(times, millivolts):
+            if start <= t < end:
+                events.append((float(t) - start, sensor, 'unavailable' if mv == MISSING else f'{mv / 1000:.3f}'))
+    events.sort()
+    return events
+
+
+def save_trace(events, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['t', 'entity_id', 'state'])
+        writer.writerows(events)
+
+
+# ------------------------------------------------------------
+# Reference and scoring
+# ------------------------------------------------------------
+
+class MemoryFlags:
+    def __init__(self):
+        self.names = set()
+
+    def is_set(self, name):
+        return name in self.names
+
+    def set(self, name):
+        self.names.add(name)
+
+    def clear(self, name):
+        self.names.discard(name)
+
+
+def reference(events, rules):
+    """Instant-detection episodes per flag, and the event indexes that open one.
+
+    Returns ({flag: [[fire_t, reset_t or None], ...]}, set of event indexes).
+    """
+    states = {}
+    flags = MemoryFlags()
+    episodes = {}
+    openers = set()
+    for n, (t, entity_id, value) in enumerate(events):
+        states[entity_id] = {'state': value}
+        for rule in rules.affected(entity_id):
+            action, _ = rule.evaluate(states)
+            if action == 'fire' and not flags.is_set(rule.flag):
+                flags.set(rule.flag)
+                episodes.setdefault(rule.flag, []).append([t, None])
+                openers.add(n)
+            elif action == 'reset' and flags.is_set(rule.flag):
+                flags.clear(rule.flag)
+                episodes[rule.flag][-1][1] = t
+    return episodes, openers
+
+
+def classify(message, rules):
+    """Flags an announcement covers (coalesced messages may cover several)."""
+    found = []
+    for rule in rules.rules:
+        prefix = rule.message.split('{', 1)[0]
+        if prefix and prefix in message:
+            found.append(rule.flag)
+    return found
+
+
+def score(episodes, calls, rules):
+    """Match announcements to reference episodes."""
+    matched = {flag: [0] * len(eps) for flag, eps in episodes.items()}
+    latencies = []
+    duplicates = unexpected = 0
+    for call in calls:
+        flags = classify(call['data'].get('message', ''), rules) or ['?']
+        for flag in flags:
+            opened = [i for i, (fire, _) in enumerate(episodes.get(flag, [])) if fire <= call['time']]
+            if not opened:
+                unexpected += 1
+                continue
+            i = opened[-1]
+            if matched[flag][i]:
+                duplicates += 1
+            else:
+                latencies.append(call['time'] - episodes[flag][i][0])
+            matched[flag][i] += 1
+    expected = sum(len(eps) for eps in episodes.values())
+    detected = sum(1 for counts in matched.values() for c in counts if c)
+    latencies.sort()
+    return {
+        'expected': expected,
+        'detected': detected,
+        'missed': expected - detected,
+        'duplicates': duplicates,
+        'unexpected': unexpected,
+        'latency_s': {
+            'p50': round(latencies[len(latencies) // 2], 2) if latencies else None,
+            'max': round(latencies[-1], 2) if latencies else None,
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        },
+    }
+
+
+# ------------------------------------------------------------
+# Replay
+# ------------------------------------------------------------
+
+class VirtualClock:
+    """Monotonic virtual seconds advancing at a switchable rate (0 = stopped)."""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._wall = time.monotonic()
+        self._virtual = 0.0
+
+    def now(self):
+        return self._virtual + (time.monotonic() - self._wall) * self.rate
+
+    def set_rate(self, rate):
+        self._virtual = self.now()
+        self._wall = time.monotonic()
+        self.rate = rate
+
+    async def sleep_until(self, t):
+        while (ahead := t - self.now()) > 0:
+            await asyncio.sleep(min(ahead / self.rate, 0.05))
+
+
+def forks():
+    """Processes created since boot (/proc/stat), or None off Linux."""
+    try:
+        with open('/proc/stat') as f:
+            for line in f:
+                if line.startswith('processes '):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_home(home, config, port):
+    """Isolated HOME with a config pointing at the stand-in."""
+    values = {k: config[k] for k in DEFAULTS if k in config}
+    values.update(HA_URL=f'http://127.0.0.1:{port}', HA_TOKEN=TOKEN, FLAG_DIR=str(home / 'flags'),
+                  PREDICT_HORIZON='0', HISTORY_DIR='')
+    (home / 'flags').mkdir(parents=True)
+    config_dir = home / '.config' / 'battery-monitor'
+    config_dir.mkdir(parents=True)
+    (config_dir / 'config').write_text(''.join(f'{k}={shlex.quote(str(v))}\n' for k, v in values.items()))
+
+
+async def replay(name, kind, command, events, openers, config, speed=SPEED, interval=INTERVAL,
+                 settle=SETTLE):
+    """Run one monitor over the trace; return (calls, counters)."""
+    home = Path(tempfile.mkdtemp(prefix=f'replay-{name}-'))
+    port = free_port()
+    write_home(home, config, port)
+    env = dict(os.environ, HOME=str(home))
+    env.pop('HA_URL', None)
+    env.pop('HA_TOKEN', None)
+
+    clock = VirtualClock()  # held at 0 until the monitor is up
+    standin = await StandIn(TOKEN, clock=clock.now).start(port)
+    duration = events[-1][0] if events else 0
+    initial = {}
+    for _, entity_id, value in events:
+        initial.setdefault(entity_id, value)
+    await standin.set_states(initial)
+
+    cpu_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    forks_before = forks()
+    wall_start = time.monotonic()
+    checks = failed = 0
+    daemon = None
+    try:
+        if kind == 'daemon':
+            # exec, so terminate() reaches the monitor rather than the shell
+            daemon = await asyncio.create_subprocess_shell(
+                f'exec {command}', env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            deadline = time.monotonic() + 10
+            while standin.subscribers == 0 and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(settle)  # initial resync and check
+
+        clock.set_rate(speed)
+
+        async def feed():
+            nonlocal checks
+            for n, (t, entity_id, value) in enumerate(events):
+                if t <= 0:
+                    continue
+                await clock.sleep_until(t)
+                await standin.set_states({entity_id: value})
+                if daemon is not None:
+                    checks += 1
+                    if n in openers:
+                        clock.set_rate(1)
+                        await asyncio.sleep(settle)
+                        clock.set_rate(speed)
+
+        async def ticker():
+            nonlocal checks, failed
+            tick = 0.0
+            while tick <= duration:
+                await clock.sleep_until(tick)
+                clock.set_rate(1)
+                proc = await asyncio.create_subprocess_shell(
+                    command, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+                if await proc.wait() != 0:
+                    failed += 1
+                checks += 1
+                clock.set_rate(speed)
+                tick += interval
+
+        await asyncio.gather(feed(), *([ticker()] if kind == 'cron' else []))
+        if daemon is not None:
+            clock.set_rate(1)
+            await asyncio.sleep(settle)
+    finally:
+        if daemon is not None and daemon.returncode is None:
+            daemon.terminate()
+            await daemon.wait()
+        await standin.stop()
+        shutil.rmtree(home, ignore_errors=True)
+
+    cpu_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    forks_after = forks()
+    cpu_ms = ((cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)) * 1000
+    processes = forks_after - forks_before if forks_before is not None else None
+    counters = {
+        'checks': checks,
+        'failed_checks': failed,
+        'wall_s': round(time.monotonic() - wall_start, 1),
+        'cpu_ms': round(cpu_ms),
+        'cpu_ms_per_check': round(cpu_ms / checks, 2) if checks else None,
+        'processes': processes,
+        'processes_per_check': round(processes / checks, 1) if checks and processes is not None else None,
+    }
+    return [c for c in standin.calls if c['service'] == 'alexa_media'], counters
+
+
+def print_report(results):
+    header = (f"{'monitor':<10} {'checks':>6} {'alerts':>6} {'expect':>6} {'missed':>6} {'dup':>4} "
+              f"{'unexp':>5} {'lat p50/max s':>14} {'cpu ms/chk':>10} {'procs/chk':>9} {'wall s':>7}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        lat = r['latency_s']
+        latency = f"{lat['p50'] if lat['p50'] is not None else '—'}/{lat['max'] if lat['max'] is not None else '—'}"
+        print(f"{r['monitor']:<10} {r['checks']:>6} {r['alerts']:>6} {r['expected']:>6} {r['missed']:>6} "
+              f"{r['duplicates']:>4} {r['unexpected']:>5} {latency:>14} "
+              f"{r['cpu_ms_per_check'] if r['cpu_ms_per_check'] is not None else '—':>10} "
+              f"{r['processes_per_check'] if r['processes_per_check'] is not None else '—':>9} "
+              f"{r['wall_s']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay voltage traces through the battery monitors')
+    parser.add_argument('--config', default=str(CONFIG_FILE),
+                        help='Config for thresholds/rules (HA settings are ignored)')
+    parser.add_argument('--monitor', action='append', choices=sorted(MONITORS),
+                        help='Monitor to benchmark, repeatable (default: python and daemon)')
+    parser.add_argument('--cron', action='append', default=[], metavar='CMD',
+                        help='Extra cron-style command to benchmark (runs with the replay HOME)')
+    parser.add_argument('--daemon', action='append', default=[], metavar='CMD',
+                        help='Extra long-running command to benchmark')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--trace', help='CSV trace: t,entity_id,state')
+    source.add_argument('--archive', help='battery_history archive directory')
+    parser.add_argument('--since', help='Archive start date (YYYY-MM-DD)')
+    parser.add_argument('--days', type=float, default=1, help='Archive days to replay (default: 1)')
+    parser.add_argument('--duration', type=int, default=3600,
+                        help='Synthetic trace length in seconds (default: 3600)')
+    parser.add_argument('--save-trace', help='Write the trace used to this CSV')
+    parser.add_argument('--speed', type=float, default=SPEED, help=f'Virtual speed-up (default: {SPEED})')
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help=f'Cron interval in virtual seconds (default: {INTERVAL})')
+    parser.add_argument('--json', action='store_true', help='Output results as JSON')
+    args = parser.parse_args()
+
+    config = load_config(args.config, require_ha=False)
+    config['PREDICT_HORIZON'] = '0'
+    rules = load_rules(config)
+    if args.trace:
+        events = load_trace(args.trace)
+    elif args.archive:
+        from datetime import date
+        if not args.since:
+            parser.error('--archive needs --since')
+        events = archive_trace(args.archive, date.fromisoformat(args.since), args.days)
+    else:
+        events = synthetic_trace(args.duration)
+    if args.save_trace:
+        save_trace(events, args.save_trace)
+    episodes, openers = reference(events, rules)
+
+    monitors = [(m, *MONITORS[m]) for m in args.monitor or ([] if args.cron or args.daemon
+                                                            else ['python', 'daemon'])]
+    monitors += [(f'cron{i + 1}', 'cron', cmd) for i, cmd in enumerate(args.cron)]
+    monitors += [(f'daemon{i + 1}', 'daemon', cmd) for i, cmd in enumerate(args.daemon)]
+
+    results = []
+    for name, kind, command in monitors:
+        print(f"▶ {name}: {len(events)} events over {events[-1][0] if events else 0:.0f}s virtual",
+              file=sys.stderr, flush=True)
+        calls, counters = asyncio.run(replay(name, kind, command, events, openers, config,
+                                             args.speed, args.interval))
+        results.append({'monitor': name, 'alerts': len(calls), **counters, **score(episodes, calls, rules)})
+
+    if args.json:
+        print(json.dumps({'episodes': episodes, 'results': results}, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == '__main__':
+    main()
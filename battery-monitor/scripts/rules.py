@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Declarative threshold rules, indexed by the entities they read.
+
+A rule watches a set of entities and fires when `any` or `all` of them
+cross a level:
+
+    - name: cell-overvoltage-150ah
+      group: cells
+      entities: sensor.bms_battery_150ah_cell_voltage_{1..8}
+      when: any              # any | all
+      above: 3.6             # fires at or above; or `below:` (strictly below)
+      reset: 3.39            # hysteresis level, defaults to the trigger level
+      flag: cell-overvoltage-150ah
+      message: "Warning! 150 amp hour bank overvoltage. {items}"
+      item: "Cell {index} at {value:.3f} volts. "
+
+A rule has three states:
+- fire: the condition holds. It is announced once, and the caller sets the
+  flag after a successful delivery.
+- reset: the entities are back past the reset level (every one for `any`,
+  at least one for `all`). The flag is cleared.
+- hold: anything in between. The flag is left alone.
+
+Unavailable entities are skipped for `any`. For `all` they make the rule
+unknown: it holds and is reported as not ok.
+
+Message fields: {name} {level} {count} {max} {min} {value} {entity} {items}.
+Here {value} and {entity} are the first matching entity. {items} joins the
+`item` template, which gets {entity} {index} {value}, for each match.
+{index} is the number a {a..b} range expanded to.
+
+RuleSet compiles the rules into an entity_id -> rules index. A state change
+re-evaluates only the rules that read that entity, so one process can
+watch hundreds of sensors.
+"""
+
+import re
+import sys
+
+BRACE_RANGE = re.compile(r'\{(\d+)\.\.(\d+)\}')
+RULE_KEYS = {'name', 'group', 'entities', 'when', 'above', 'below', 'reset', 'flag',
+             'message', 'item', 'enabled'}
+
+
+class RuleError(ValueError):
+    """A rule definition is malformed."""
+
+
+def numeric_state(states, entity_id):
+    """Numeric state of an entity, or None if missing/unavailable."""
+    state = states.get(entity_id)
+    if state is None:
+        return None
+    try:
+        return float(state['state'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def expand(pattern):
+    """Expand {a..b} ranges: 'cell_{1..3}' -> [('cell_1', 1), ('cell_2', 2), ('cell_3', 3)].
+
+    Several ranges expand as a product. The index is the first range's value.
+    """
+    match = BRACE_RANGE.search(pattern)
+    if not match:
+        return [(pattern, None)]
+    lo, hi = int(match[1]), int(match[2])
+    step = 1 if hi >= lo else -1
+    expanded = []
+    for i in range(lo, hi + step, step):
+        rest = pattern[:match.start()] + str(i) + pattern[match.end():]
+        expanded.extend((entity_id, i) for entity_id, _ in expand(rest))
+    return expanded
+
+
+class Rule:
+    """One threshold rule over one or more entities."""
+
+    def __init__(self, name, entities, message, when='any', above=None, below=None,
+                 reset=None, flag=None, item='', group=None):
+        if (above is None) == (below is None):
+            raise RuleError(f"{name}: give exactly one of 'above' or 'below'")
+        if when not in ('any', 'all'):
+            raise RuleError(f"{name}: 'when' must be 'any' or 'all', not {when!r}")
+        self.name = name
+        self.group = group or name
+        self.flag = flag or name
+        self.when = when
+        self.above = above is not None
+        try:
+            self.level = float(above if self.above else below)
+            self.reset = self.level if reset is None else float(reset)
+        except (TypeError, ValueError):
+            raise RuleError(f"{name}: levels must be numbers") from None
+        self.message = message
+        self.item = item
+
+        self.entities = []
+        self.indexes = {}
+        for pattern in [entities] if isinstance(entities, str) else entities or []:
+            for entity_id, index in expand(pattern):
+                if entity_id not in self.indexes:
+                    self.entities.append(entity_id)
+                    self.indexes[entity_id] = index
+        if not self.entities:
+            raise RuleError(f"{name}: no entities")
+
+        # Catch template typos at load time rather than at 3 a.m.
+        try:
+            self.render([(self.entities[0], self.level)])
+        except (KeyError, IndexError, ValueError) as e:
+            raise RuleError(f"{name}: bad message template: {e}") from None
+
+    def _hot(self, value):
+        return value >= self.level if self.above else value < self.level
+
+    def _cool(self, value):
+        return value <= self.reset if self.above else value >= self.reset
+
+    def evaluate(self, states):
+        """Return (action, message): action is 'fire', 'reset', 'unknown' or None (hold)."""
+        known = []
+        for entity_id in self.entities:
+            value = numeric_state(states, entity_id)
+            if value is not None:
+                known.append((entity_id, value))
+            elif self.when == 'all':
+                return 'unknown', None
+
+        hot = [(e, v) for e, v in known if self._hot(v)]
+        if hot and (self.when == 'any' or len(hot) == len(known)):
+            return 'fire', self.render(hot)
+        cool = [self._cool(v) for _, v in known]
+        recovered = all(cool) if self.when == 'any' else any(cool)
+        return ('reset' if recovered else None), None
+
+    def render(self, matches):
+        """Format the message for the matching (entity_id, value) pairs."""
+        values = [v for _, v in matches]
+        items = ''.join(self.item.format(entity=e, index=self.indexes[e], value=v)
+                        for e, v in matches)
+        return self.message.format(name=self.name, level=self.level, count=len(matches),
+                                   max=max(values), min=min(values), value=values[0],
+                                   entity=matches[0][0], items=items)
+
+
+class RuleSet:
+    """Compiled rules plus the entity_id -> rules index."""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        names = [r.name for r in self.rules]
+        duplicates = {n for n in names if names.count(n) > 1}
+        if duplicates:
+            raise RuleError(f"duplicate rule names: {', '.join(sorted(duplicates))}")
+        self.index = {}
+        for rule in self.rules:
+            for entity_id in rule.entities:
+                self.index.setdefault(entity_id, []).append(rule)
+
+    @property
+    def entities(self):
+        """Every entity some rule reads."""
+        return set(self.index)
+
+    @property
+    def groups(self):
+        return sorted({r.group for r in self.rules})
+
+    def affected(self, entity_id):
+        """Rules that read entity_id."""
+        return self.index.get(entity_id, [])
+
+    def select(self, group='all'):
+        """Rules in a group ('all' for every rule)."""
+        if group == 'all':
+            return list(self.rules)
+        return [r for r in self.rules if r.group == group]
+
+    def evaluate(self, states, flags, rules=None):
+        """Apply flag resets and return the announcements still owed.
+
+        Returns (announcements, ok): announcements is a list of (message, flag)
+        whose flag is not yet set. The caller announces and then sets the flag.
+        ok is False when an `all` rule could not read every entity.
+        """
+        announcements = []
+        ok = True
+        for rule in self.rules if rules is None else rules:
+            action, message = rule.evaluate(states)
+            if action == 'unknown':
+                ok = False
+            elif action == 'fire':
+                if not flags.is_set(rule.flag):
+                    announcements.append((message, rule.flag))
+            elif action == 'reset':
+                flags.clear(rule.flag)
+        return announcements, ok
+
+
+def merge_specs(base, overrides):
+    """Overlay rule specs by name; `enabled: false` drops a rule."""
+    merged = {spec['name']: spec for spec in base}
+    for spec in overrides:
+        merged[spec['name']] = spec
+    return [s for s in merged.values() if s.get('enabled', True)]
+
+
+def compile_rules(specs):
+    """Build a RuleSet from a list of rule dicts."""
+    rules = []
+    for spec in specs:
+        if not isinstance(spec, dict) or 'name' not in spec:
+            raise RuleError(f"rule needs a name: {spec!r}")
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise RuleError(f"{spec['name']}: unknown keys: {', '.join(sorted(unknown))}")
+        if 'message' not in spec:
+            raise RuleError(f"{spec['name']}: no message")
+        rules.append(Rule(**{k: v for k, v in spec.items() if k != 'enabled'}))
+    return RuleSet(rules)
+
+
+def load_rules_file(path):
+    """Rule specs from a YAML file: a list, or a mapping with a `rules` list."""
+    try:
+        import yaml
+    except ImportError:
+        print("ERROR: Run: pip install pyyaml  (needed for RULES_FILE)")
+        sys.exit(1)
+    with open(path) as f:
+        data = yaml.safe_load(f) or []
+    if isinstance(data, dict):
+        data = data.get('rules', [])
+    if not isinstance(data, list):
+        raise RuleError(f"{path}: expected a list of rules")
+    for spec in data:
+        if isinstance(spec, dict) and 'name' in spec:
+            spec['name'] = str(spec['name'])
+    return data
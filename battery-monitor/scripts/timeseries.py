@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Compact per-sensor voltage history with trend and time-to-threshold math.
+
+Each sensor gets one row of a fixed 1-second ring: slot = epoch second mod
+N, and each sample is an int16 in millivolts. Readings are sample-and-hold,
+matching HA's state_changed semantics: a value holds until the next reading,
+for at most `hold` seconds. 24 h at 1 s for all 18 sensors is 18 x 86400 x
+2 bytes, about 3 MB. With a directory the ring is a numpy memmap and
+survives restarts.
+
+All analytics are vectorised over sensors:
+- slopes():       least-squares V/s over a trailing window, NaN-aware
+- spread():       max - min of the latest readings in a group
+- imbalance():    per-second max - min across a group over a window
+- time_to_threshold(): seconds until a trend crosses a level
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    print("ERROR: Run: pip install numpy  (Debian/Ubuntu: sudo apt install python3-numpy)")
+    sys.exit(1)
+
+MISSING = np.iinfo(np.int16).min
+MAX_MV = np.iinfo(np.int16).max
+NEVER = -1
+DAY = 86400
+DEFAULT_HOLD = 900
+
+
+def to_millivolts(volts):
+    """A reading in int16 millivolts, or MISSING if it cannot be stored.
+
+    NaN, infinity and anything past +/-32.767 V (a sensor glitch, or a bank
+    too big for this store) count as no reading rather than an error.
+    """
+    try:
+        mv = round(volts * 1000)
+    except (OverflowError, ValueError):
+        return MISSING
+    return mv if MISSING < mv <= MAX_MV else MISSING
+
+
+class VoltageHistory:
+    """Ring buffer of millivolt readings, one row per sensor."""
+
+    def __init__(self, sensors, seconds=DAY, path=None, hold=DEFAULT_HOLD):
+        self.sensors = list(sensors)
+        self.rows = {s: i for i, s in enumerate(self.sensors)}
+        self.size = seconds
+        self.hold = hold
+        shape = (len(self.sensors), seconds)
+        if path is None:
+            self.data = np.full(shape, MISSING, dtype=np.int16)
+            self.clock = np.full(len(self.sensors), NEVER, dtype=np.int64)
+        else:
+            self.data, self.clock = self._open(Path(path), shape)
+
+    def _open(self, path, shape):
+        """Map an existing store, or create one if missing or laid out differently."""
+        path.mkdir(parents=True, exist_ok=True)
+        meta_file = path / 'sensors.json'
+        meta = {'sensors': self.sensors, 'seconds': shape[1]}
+        fresh = not meta_file.exists() or json.loads(meta_file.read_text()) != meta
+        mode = 'w+' if fresh else 'r+'
+        data = np.lib.format.open_memmap(path / 'voltages.npy', mode=mode,
+                                         dtype=np.int16, shape=shape)
+        clock = np.lib.format.open_memmap(path / 'clock.npy', mode=mode,
+                                          dtype=np.int64, shape=(shape[0],))
+        if fresh:
+            data[:] = MISSING
+            clock[:] = NEVER
+            meta_file.write_text(json.dumps(meta))
+        return data, clock
+
+    def record(self, sensor, volts, t=None):
+        """Store a reading at epoch second t (default now).
+
+        Seconds since the sensor's previous reading are back-filled with that
+        reading, up to `hold` seconds, and left missing beyond it.
+        """
+        row = self.rows.get(sensor)
+        if row is None or volts is None:
+            return
+        sec = int(time.time() if t is None else t)
+        last = int(self.clock[row])
+        mv = to_millivolts(volts)
+        if last != NEVER and sec > last + 1:
+            gap = np.arange(last + 1, sec)[-self.size:]
+            held = gap <= last + self.hold
+            prev = self.data[row, last % self.size]
+            self.data[row, gap[held] % self.size] = prev
+            self.data[row, gap[~held] % self.size] = MISSING
+        if last != NEVER and sec <= last - self.size:
+            return
+        self.data[row, sec % self.size] = mv
+        if sec > last:
+            self.clock[row] = sec
+
+    def window(self, sensors, seconds, now=None):
+        """Return (times, volts) for the trailing window; volts is NaN where unknown."""
+        now = int(time.time() if now is None else now)
+        seconds = min(seconds, self.size)
+        times = np.arange(now - seconds + 1, now + 1)
+        rows = np.array([self.rows[s] for s in sensors])
+        raw = self.data[np.ix_(rows, times % self.size)]
+        volts = np.where(raw == MISSING, np.nan, raw / 1000.0)
+
+        # Seconds after a sensor's last reading hold its value (for a while);
+        # seconds it has never covered, or long overwritten, are unknown.
+        clock = self.clock[rows][:, None]
+        last_mv = self.data[rows, self.clock[rows] % self.size]
+        last = np.where((last_mv == MISSING) | (self.clock[rows] == NEVER), np.nan, last_mv / 1000.0)
+        after = times[None, :] > clock
+        volts = np.where(after, np.where(times[None, :] <= clock + self.hold, last[:, None], np.nan), volts)
+        volts[(clock == NEVER).ravel()] = np.nan
+        volts[times[None, :] <= clock - self.size] = np.nan
+        return times, volts
+
+    def latest(self, sensors, now=None):
+        """Most recent known value per sensor (NaN if none within hold)."""
+        _, volts = self.window(sensors, 1, now)
+        return volts[:, -1]
+
+    def flush(self):
+        for arr in (self.data, self.clock):
+            if isinstance(arr, np.memmap):
+                arr.flush()
+
+
+def slopes(times, volts):
+    """Least-squares slope in V/s per row, ignoring NaNs (NaN if < 2 points)."""
+    known = ~np.isnan(volts)
+    n = known.sum(axis=1)
+    t = np.where(known, times[None, :] - times[0], 0.0)
+    v = np.where(known, volts, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = t.sum(axis=1) / n
+        v_mean = v.sum(axis=1) / n
+        dt = np.where(known, t - t_mean[:, None], 0.0)
+        dv = np.where(known, v - v_mean[:, None], 0.0)
+        result = (dt * dv).sum(axis=1) / (dt * dt).sum(axis=1)
+    result[n < 2] = np.nan
+    return result
+
+
+def spread(latest):
+    """Max - min across a group's latest readings."""
+    if np.all(np.isnan(latest)):
+        return np.nan
+    return float(np.nanmax(latest) - np.nanmin(latest))
+
+
+def imbalance(volts):
+    """Per-second max - min across a group (rows = cells) over a window."""
+    with np.errstate(invalid='ignore'):
+        known = ~np.isnan(volts)
+        hi = np.where(known, volts, -np.inf).max(axis=0)
+        lo = np.where(known, volts, np.inf).min(axis=0)
+    result = hi - lo
+    result[known.sum(axis=0) < 2] = np.nan
+    return result
+
+
+def time_to_threshold(current, slope, threshold):
+    """Seconds until each trend reaches threshold; inf if moving away or flat."""
+    current = np.asarray(current, dtype=float)
+    slope = np.asarray(slope, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        eta = (threshold - current) / slope
+    eta = np.where((eta >= 0) & np.isfinite(eta), eta, np.inf)
+    return eta
+
+
+def main():
+    sys.path.insert(0, str(Path(__file__).parent))
+    from battery_monitor import (
+        BANK_SENSORS, CELL_BANKS, CELLS_PER_BANK, CONFIG_FILE, load_config, watched_entities
+    )
+
+    parser = argparse.ArgumentParser(description='Report trends from a stored voltage history')
+    parser.add_argument('--config', default=str(CONFIG_FILE), help='Config file path')
+    parser.add_argument('--window', type=int, default=15, help='Trend window in minutes')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if not config.get('HISTORY_DIR'):
+        sys.exit("Set HISTORY_DIR in the config to keep a persistent history")
+    history = VoltageHistory(sorted(watched_entities()), path=config['HISTORY_DIR'])
+    now = int(time.time())
+    threshold = float(config['THRESHOLD'])
+
+    times, volts = history.window(BANK_SENSORS, args.window * 60, now)
+    banks_slope = slopes(times, volts)
+    banks_now = history.latest(BANK_SENSORS, now)
+    eta = time_to_threshold(banks_now, banks_slope, threshold)
+    for sensor, v, s, e in zip(BANK_SENSORS, banks_now, banks_slope, eta):
+        when = f"{e / 60:.0f} min" if np.isfinite(e) else 'not approaching'
+        print(f"{sensor}: {v:.2f} V, {s * 3600:+.3f} V/h, {threshold} V in {when}")
+
+    for bank_name, prefix, _ in CELL_BANKS:
+        cells = [f'{prefix}{i}' for i in range(1, CELLS_PER_BANK + 1)]
+        _, cell_volts = history.window(cells, args.window * 60, now)
+        window_imbalance = imbalance(cell_volts)
+        peak = np.nanmax(window_imbalance) if np.any(~np.isnan(window_imbalance)) else np.nan
+        print(f"{bank_name}: spread {spread(history.latest(cells, now)) * 1000:.0f} mV now, "
+              f"{peak * 1000:.0f} mV peak over {args.window} min")
+
+
+if __name__ == '__main__':
+    main()
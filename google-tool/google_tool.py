@@ -11,12 +11,19 @@ Usage:
     google-tool mail read <message-id>   # Read specific email
     google-tool mail send --to X --subject Y --body Z
     google-tool mail search "query"      # Search emails
+    google-tool mail watch               # Stream newly arrived mail
+    google-tool mail export DEST [--format maildir|mbox] [--query Q]
+    google-tool mail attachments DEST [--query Q] [--mime TYPE]
+
+    google-tool --ndjson <command> ...   # Stream JSON records (schema: records.py)
 """
 
 import os
 import sys
 import json
 import pickle
+import shutil
+import asyncio
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -40,10 +47,35 @@ SCOPES = [
 SCRIPT_DIR = Path(__file__).parent
 CREDENTIALS_FILE = SCRIPT_DIR / 'credentials.json'
 TOKEN_FILE = SCRIPT_DIR / 'token.json'
-
-
-def get_credentials():
-    """Get valid credentials, refreshing or running OAuth flow as needed."""
+WATCH_STATE_FILE = SCRIPT_DIR / 'watch_state.json'
+OUTBOX_DIR = SCRIPT_DIR / 'outbox'
+BODY_CACHE_FILE = SCRIPT_DIR / 'body_cache.sqlite'
+MAIL_STATS_DIR = SCRIPT_DIR / 'mail_stats'
+
+# The async REST client is shared with the email-calendar skill scripts
+sys.path.insert(0, str(SCRIPT_DIR.parent / 'skills' / 'email-calendar' / 'scripts'))
+from auth_common import AuthError
+from body_cache import open_cache
+from gcal_bulk import bulk_edit, parse_delta, parse_fields, plan_delete, plan_move, plan_patch, print_changes
+from gapi_async import GoogleClient, ApiError, header_map, METADATA_HEADERS
+from gmail_watch import watch, print_message
+from gmail_export import export_mailbox, open_writer
+from gmail_read import fetch_entry, prefetch_detached
+from outbox import Outbox, queued_record, run_flusher, start_flusher
+from gmail_stats import MailStats, aggregate as aggregate_stats, emit_stats, print_stats, sync as sync_stats
+from gmail_attachments import AttachmentStore, download_attachments
+from records import (
+    emit, busy_record, error_record, event_record, message_body_record, message_record,
+    sent_record
+)
+
+
+def get_credentials(interactive=True):
+    """Get valid credentials, refreshing or running OAuth flow as needed.
+
+    With interactive=False a missing or unrefreshable token raises AuthError
+    instead (for background processes).
+    """
     creds = None
     
     if TOKEN_FILE.exists():
@@ -52,6 +84,8 @@ def get_credentials():
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+        elif not interactive:
+            raise AuthError(f"No valid token in {TOKEN_FILE} (run any command to sign in)")
         else:
             if not CREDENTIALS_FILE.exists():
                 click.echo(f"Error: {CREDENTIALS_FILE} not found.", err=True)
@@ -73,6 +107,11 @@ def get_credentials():
     return creds
 
 
+def background_credentials():
+    """get_credentials for detached processes, which must never prompt."""
+    return get_credentials(interactive=False)
+
+
 def get_calendar_service():
     """Get Google Calendar API service."""
     creds = get_credentials()
@@ -85,19 +124,48 @@ def get_gmail_service():
     return build('gmail', 'v1', credentials=creds)
 
 
+def run_async(fn):
+    """Run `fn(client)` on an async client bound to this tool's credentials."""
+    async def runner():
+        async with GoogleClient(get_credentials()) as client:
+            return await fn(client)
+    return asyncio.run(runner())
+
+
+def streaming():
+    """True when the top-level --ndjson flag was given."""
+    return click.get_current_context().find_root().obj.get('ndjson', False)
+
+
+def fail(error):
+    """Report a command error in the active output mode and exit 1."""
+    if streaming():
+        emit(error_record(error))
+    else:
+        click.echo(f"Error: {error}", err=True)
+    sys.exit(1)
+
+
 # ============================================================
 # CLI Structure
 # ============================================================
 
 @click.group()
-def cli():
+@click.option('--ndjson', is_flag=True,
+              help='Stream newline-delimited JSON records instead of text')
+@click.pass_context
+def cli(ctx, ndjson):
     """Google Calendar and Gmail CLI tool."""
-    pass
+    ctx.obj = {'ndjson': ndjson}
 
 
 @cli.command()
 def auth():
     """Run OAuth authentication flow."""
+    if streaming():
+        get_credentials()
+        emit({'type': 'auth', 'token_file': str(TOKEN_FILE)})
+        return
     click.echo("Starting OAuth flow...")
     creds = get_credentials()
     click.echo(f"✓ Authenticated successfully. Token saved to {TOKEN_FILE}")
@@ -118,22 +186,20 @@ def cal():
 def cal_list(days):
     """List upcoming calendar events."""
     try:
-        service = get_calendar_service()
-        
         now = datetime.utcnow().isoformat() + 'Z'
         end = (datetime.utcnow() + timedelta(days=days)).isoformat() + 'Z'
         
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=now,
-            timeMax=end,
-            maxResults=50,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        events_result = run_async(lambda client: client.list_events(
+            'primary', time_min=now, time_max=end, max_results=50
+        ))
         
         events = events_result.get('items', [])
         
+        if streaming():
+            for event in events:
+                emit(event_record(event))
+            return
+        
         if not events:
             click.echo('No upcoming events.')
             return
@@ -144,9 +210,8 @@ def cal_list(days):
             formatted = start_dt.strftime('%a %b %d %I:%M %p')
             click.echo(f"{formatted} — {event['summary']}")
             
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+    except (HttpError, ApiError) as e:
+        fail(e)
 
 
 @cal.command('add')
@@ -161,8 +226,7 @@ def cal_add(title, start_time, duration):
         # Parse start time
         start_dt = dateparser.parse(start_time)
         if not start_dt:
-            click.echo(f"Error: Could not parse time '{start_time}'", err=True)
-            sys.exit(1)
+            fail(f"Could not parse time '{start_time}'")
         
         # Parse duration
         if duration.endswith('h'):
@@ -181,12 +245,14 @@ def cal_add(title, start_time, duration):
         }
         
         created = service.events().insert(calendarId='primary', body=event).execute()
+        if streaming():
+            emit(event_record(created))
+            return
         click.echo(f"✓ Created: {created['summary']} at {start_dt.strftime('%a %b %d %I:%M %p')}")
         click.echo(f"  Link: {created.get('htmlLink')}")
         
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+    except (HttpError, ApiError) as e:
+        fail(e)
 
 
 @cal.command('free')
@@ -194,21 +260,18 @@ def cal_add(title, start_time, duration):
 def cal_free(target_date):
     """Check free/busy for a specific date."""
     try:
-        service = get_calendar_service()
-        
         date_dt = dateparser.parse(target_date)
         start = date_dt.replace(hour=0, minute=0, second=0).isoformat() + 'Z'
         end = date_dt.replace(hour=23, minute=59, second=59).isoformat() + 'Z'
         
-        body = {
-            'timeMin': start,
-            'timeMax': end,
-            'items': [{'id': 'primary'}]
-        }
-        
-        result = service.freebusy().query(body=body).execute()
+        result = run_async(lambda client: client.freebusy(start, end))
         busy = result['calendars']['primary']['busy']
         
+        if streaming():
+            for slot in busy:
+                emit(busy_record(slot))
+            return
+        
         if not busy:
             click.echo(f"✓ {target_date}: Completely free!")
         else:
@@ -218,11 +281,83 @@ def cal_free(target_date):
                 e = dateparser.parse(slot['end']).strftime('%I:%M %p')
                 click.echo(f"  {s} - {e}")
                 
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
+    except (HttpError, ApiError) as e:
+        fail(e)
+
+
+def bulk_options(fn):
+    """Event selection and safety options shared by cal move/patch/delete."""
+    options = [
+        click.option('--from', 'range_start', required=True, help='Range start (e.g., "2026-03-02")'),
+        click.option('--to', 'range_end', required=True, help='Range end, exclusive'),
+        click.option('--match', default=None, help='Only events whose title contains this'),
+        click.option('--series', is_flag=True, help='Change whole recurring series, not occurrences'),
+        click.option('--notify', is_flag=True, help='Email attendees about the changes'),
+        click.option('--dry-run', is_flag=True, help='Show what would change, send nothing'),
+    ]
+    for option in reversed(options):
+        fn = option(fn)
+    return fn
+
+
+def run_bulk(make_plan, range_start, range_end, match, series, notify, dry_run):
+    """Select events, apply make_plan's changes in batches, report per event."""
+    try:
+        time_min = dateparser.parse(range_start).astimezone().isoformat()
+        time_max = dateparser.parse(range_end).astimezone().isoformat()
+    except (ValueError, OverflowError, AttributeError):
+        fail(f"Could not parse range '{range_start}' .. '{range_end}'")
+    try:
+        records = run_async(lambda client: bulk_edit(
+            client, 'primary', time_min, time_max, make_plan, match=match, series=series,
+            dry_run=dry_run, send_updates='all' if notify else 'none'
+        ))
+    except (HttpError, ApiError) as e:
+        fail(e)
+    
+    if streaming():
+        for record in records:
+            emit(record)
+    elif not records:
+        click.echo('No matching events.')
+    else:
+        print_changes(records, dry_run)
+    if any(r['status'] == 'error' for r in records):
         sys.exit(1)
 
 
+@cal.command('move')
+@bulk_options
+@click.option('--by', 'offset', required=True, help='Offset (e.g., "+1h", "-30m", "2d", "1w")')
+def cal_move(offset, **selection):
+    """Shift matching events by an offset."""
+    try:
+        delta = parse_delta(offset)
+    except ValueError as e:
+        fail(e)
+    run_bulk(lambda events, time_zone: plan_move(events, delta, time_zone), **selection)
+
+
+@cal.command('patch')
+@bulk_options
+@click.option('--set', 'assignments', multiple=True, required=True,
+              help='field=value to set (repeatable, e.g., location="Room 4")')
+def cal_patch(assignments, **selection):
+    """Set fields on matching events."""
+    try:
+        body = parse_fields(assignments)
+    except ValueError as e:
+        fail(e)
+    run_bulk(lambda events, time_zone: plan_patch(events, body, time_zone), **selection)
+
+
+@cal.command('delete')
+@bulk_options
+def cal_delete(**selection):
+    """Delete matching events."""
+    run_bulk(plan_delete, **selection)
+
+
 # ============================================================
 # Gmail Commands
 # ============================================================
@@ -235,32 +370,30 @@ def mail():
 
 @mail.command('unread')
 @click.option('--limit', default=10, help='Maximum emails to show')
-def mail_unread(limit):
+@click.option('--prefetch', default=0, metavar='N',
+              help='Then cache the bodies of the top N in the background')
+def mail_unread(limit, prefetch):
     """List unread emails."""
+    async def fetch(client):
+        results = await client.list_messages(q='is:unread', max_results=limit)
+        messages = results.get('messages', [])
+        return await client.get_messages([m['id'] for m in messages], format='metadata',
+                                         metadata_headers=METADATA_HEADERS)
+    
     try:
-        service = get_gmail_service()
-        
-        results = service.users().messages().list(
-            userId='me',
-            q='is:unread',
-            maxResults=limit
-        ).execute()
+        if streaming():
+            ids = run_async(lambda client: stream_messages(client, 'is:unread', limit))
+            prefetch_detached([(background_credentials, BODY_CACHE_FILE, ids[:prefetch])])
+            return
         
-        messages = results.get('messages', [])
+        messages = run_async(fetch)
         
         if not messages:
             click.echo('No unread messages.')
             return
         
-        for msg in messages:
-            msg_data = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
-            
-            headers = {h['name']: h['value'] for h in msg_data['payload']['headers']}
+        for msg_data in messages:
+            headers = header_map(msg_data)
             
             from_addr = headers.get('From', 'Unknown')
             subject = headers.get('Subject', '(no subject)')
@@ -272,91 +405,138 @@ def mail_unread(limit):
             if len(subject) > 50:
                 subject = subject[:47] + '...'
             
-            click.echo(f"[{msg['id'][:8]}] {from_addr}")
+            click.echo(f"[{msg_data['id'][:8]}] {from_addr}")
             click.echo(f"         {subject}")
-            
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+        
+        prefetch_detached([(background_credentials, BODY_CACHE_FILE, [m['id'] for m in messages[:prefetch]])])
+        
+    except (HttpError, ApiError) as e:
+        fail(e)
+
+
+async def stream_messages(client, query, limit):
+    """Emit a message record for each search hit as its metadata arrives; return the IDs in list order."""
+    results = await client.list_messages(q=query, max_results=limit)
+    ids = [m['id'] for m in results.get('messages', [])]
+    async for msg_data in client.iter_messages(ids, format='metadata',
+                                               metadata_headers=METADATA_HEADERS):
+        emit(message_record(msg_data))
+    return ids
+
+
+async def resolve_message_id(client, message_id):
+    """Expand a short ID prefix against the 100 most recent messages."""
+    if len(message_id) >= 16:
+        return message_id
+    results = await client.list_messages(max_results=100)
+    for msg in results.get('messages', []):
+        if msg['id'].startswith(message_id):
+            return msg['id']
+    return message_id
 
 
 @mail.command('read')
 @click.argument('message_id')
-def mail_read(message_id):
-    """Read a specific email by ID."""
+@click.option('--no-cache', is_flag=True, help='Fetch from Gmail even if cached')
+def mail_read(message_id, no_cache):
+    """Read a specific email by ID (cached bodies cost no API calls)."""
+    cache = None if no_cache else open_cache(BODY_CACHE_FILE)
+    if cache:
+        message_id = cache.resolve(message_id)
+    
+    async def fetch(client):
+        full_id = await resolve_message_id(client, message_id)
+        return await fetch_entry(client, full_id, cache)
+    
     try:
-        service = get_gmail_service()
-        
-        # Handle partial IDs
-        if len(message_id) < 16:
-            results = service.users().messages().list(userId='me', maxResults=100).execute()
-            for msg in results.get('messages', []):
-                if msg['id'].startswith(message_id):
-                    message_id = msg['id']
-                    break
+        entry = (cache.get(message_id) if cache else None) or run_async(fetch)
+        msg = entry['message']
+        headers = header_map(msg)
+        body = entry['text']
         
-        msg = service.users().messages().get(
-            userId='me',
-            id=message_id,
-            format='full'
-        ).execute()
-        
-        headers = {h['name']: h['value'] for h in msg['payload']['headers']}
+        if streaming():
+            emit(message_body_record(msg, body, entry['attachments']))
+            return
         
         click.echo(f"From: {headers.get('From', 'Unknown')}")
         click.echo(f"To: {headers.get('To', 'Unknown')}")
         click.echo(f"Subject: {headers.get('Subject', '(no subject)')}")
         click.echo(f"Date: {headers.get('Date', '')}")
         click.echo("-" * 60)
-        
-        # Extract body
-        body = ""
-        if 'parts' in msg['payload']:
-            for part in msg['payload']['parts']:
-                if part['mimeType'] == 'text/plain':
-                    import base64
-                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                    break
-        elif 'body' in msg['payload'] and 'data' in msg['payload']['body']:
-            import base64
-            body = base64.urlsafe_b64decode(msg['payload']['body']['data']).decode('utf-8')
-        
         click.echo(body or "(no text body)")
         
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+    except (HttpError, ApiError) as e:
+        fail(e)
 
 
 @mail.command('send')
 @click.option('--to', required=True, help='Recipient email')
 @click.option('--subject', required=True, help='Email subject')
 @click.option('--body', required=True, help='Email body')
-def mail_send(to, subject, body):
+@click.option('--queue', is_flag=True, help='Spool and return at once; a background flusher sends it')
+def mail_send(to, subject, body, queue):
     """Send an email."""
     try:
         import base64
         from email.mime.text import MIMEText
         
-        service = get_gmail_service()
-        
         message = MIMEText(body)
         message['to'] = to
         message['subject'] = subject
         
         raw = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
         
+        if queue:
+            name = Outbox(OUTBOX_DIR).enqueue(raw, to, subject)
+            if streaming():
+                emit(queued_record(name, to, subject))
+            else:
+                click.echo(f"✓ Queued for {to} (see: mail outbox)")
+            start_flusher(OUTBOX_DIR, background_credentials)
+            return
+        
+        service = get_gmail_service()
         sent = service.users().messages().send(
             userId='me',
             body={'raw': raw}
         ).execute()
         
+        if streaming():
+            emit(sent_record(sent, to, subject))
+            return
+        
         click.echo(f"✓ Sent to {to}")
         click.echo(f"  Message ID: {sent['id']}")
         
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+    except (HttpError, ApiError) as e:
+        fail(e)
+
+
+@mail.command('outbox')
+@click.option('--flush', is_flag=True, help='Send everything queued now (foreground)')
+@click.option('--retry-failed', is_flag=True, help='Requeue dead letters')
+def mail_outbox(flush, retry_failed):
+    """Show the outbox spool; optionally flush it or requeue failures."""
+    outbox = Outbox(OUTBOX_DIR)
+    if retry_failed:
+        count = outbox.retry_failed()
+        if not streaming():
+            click.echo(f"✓ {count} dead letters requeued")
+    if flush:
+        if not run_flusher(OUTBOX_DIR, background_credentials) and not streaming():
+            click.echo("Another flusher is already running", err=True)
+    elif retry_failed:
+        start_flusher(OUTBOX_DIR, background_credentials)
+    
+    status = outbox.status()
+    if streaming():
+        emit({'type': 'outbox', 'profile': None, **status})
+        return
+    click.echo(f"Outbox: {status['queued']} queued, {status['in_flight']} in flight, "
+               f"{status['failed']} failed, {status['sent']} sent")
+    for name in outbox.entries('failed'):
+        entry = outbox.read('failed', name) or {}
+        click.echo(f"  ✗ {entry.get('to')}: {entry.get('subject')} ({entry.get('last_error')})")
 
 
 @mail.command('search')
@@ -364,16 +544,18 @@ def mail_send(to, subject, body):
 @click.option('--limit', default=10, help='Maximum results')
 def mail_search(query, limit):
     """Search emails."""
+    async def fetch(client):
+        results = await client.list_messages(q=query, max_results=limit)
+        messages = results.get('messages', [])
+        return await client.get_messages([m['id'] for m in messages], format='metadata',
+                                         metadata_headers=METADATA_HEADERS)
+    
     try:
-        service = get_gmail_service()
-        
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=limit
-        ).execute()
+        if streaming():
+            run_async(lambda client: stream_messages(client, query, limit))
+            return
         
-        messages = results.get('messages', [])
+        messages = run_async(fetch)
         
         if not messages:
             click.echo('No messages found.')
@@ -381,24 +563,143 @@ def mail_search(query, limit):
         
         click.echo(f"Found {len(messages)} message(s):")
         
-        for msg in messages:
-            msg_data = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
-            
-            headers = {h['name']: h['value'] for h in msg_data['payload']['headers']}
+        for msg_data in messages:
+            headers = header_map(msg_data)
             subject = headers.get('Subject', '(no subject)')
             if len(subject) > 60:
                 subject = subject[:57] + '...'
             
-            click.echo(f"[{msg['id'][:8]}] {subject}")
+            click.echo(f"[{msg_data['id'][:8]}] {subject}")
             
-    except HttpError as e:
-        click.echo(f"Error: {e}", err=True)
-        sys.exit(1)
+    except (HttpError, ApiError) as e:
+        fail(e)
+
+
+@mail.command('watch')
+@click.option('--label', default='INBOX', help='Only messages added to this label')
+@click.option('--min-interval', default=5.0, help='Seconds between polls while mail is arriving')
+@click.option('--max-interval', default=120.0, help='Longest idle poll interval in seconds')
+@click.option('--once', is_flag=True, help='Poll once and exit')
+def mail_watch(label, min_interval, max_interval, once):
+    """Stream newly arrived emails (history polling, resumable)."""
+    def on_message(msg_data):
+        if streaming():
+            emit(message_record(msg_data))
+        else:
+            print_message(msg_data)
+    
+    def on_error(error):
+        if streaming():
+            emit(error_record(error))
+        else:
+            click.echo(f"Warning: {error}", err=True)
+    
+    try:
+        run_async(lambda client: watch(
+            client, WATCH_STATE_FILE, on_message, label=label, min_interval=min_interval,
+            max_interval=max_interval, once=once, on_error=on_error
+        ))
+    except (HttpError, ApiError) as e:
+        fail(e)
+    except KeyboardInterrupt:
+        pass
+
+
+@mail.command('export')
+@click.argument('dest')
+@click.option('--format', 'fmt', type=click.Choice(['maildir', 'mbox']), default='maildir')
+@click.option('--query', default=None, help='Only export messages matching this search')
+@click.option('--limit', default=None, type=int, help='Stop after writing this many new messages')
+def mail_export(dest, fmt, query, limit):
+    """Export the mailbox to Maildir or mbox (resumable)."""
+    def progress(exported, skipped):
+        if streaming():
+            emit({'type': 'export_progress', 'profile': None,
+                  'exported': exported, 'skipped': skipped})
+        else:
+            click.echo(f"\r   exported {exported}, skipped {skipped}", nl=False, err=True)
+    
+    writer = open_writer(fmt, dest)
+    try:
+        exported, skipped = run_async(lambda client: export_mailbox(
+            client, writer, query=query, limit=limit, progress=progress
+        ))
+    except (HttpError, ApiError) as e:
+        fail(e)
+    finally:
+        writer.close()
+    
+    if streaming():
+        emit({'type': 'export_done', 'profile': None, 'dest': dest,
+              'exported': exported, 'skipped': skipped})
+    else:
+        click.echo(f"\n✓ Exported {exported} messages to {dest} ({skipped} already done)")
+
+
+@mail.command('attachments')
+@click.argument('dest')
+@click.option('--query', default=None, help='Gmail search (has:attachment is implied)')
+@click.option('--limit', default=None, type=int, help='Stop after processing this many new messages')
+@click.option('--mime', multiple=True, help='Only parts whose type starts with this (repeatable)')
+@click.option('--include-inline', is_flag=True, help='Also keep inline parts (logos, images)')
+def mail_attachments(dest, query, limit, mime, include_inline):
+    """Download attachments into a deduplicated store (resumable)."""
+    def on_record(record):
+        if streaming():
+            emit(dict(record, profile=None))
+    
+    def progress(stats, skipped):
+        if not streaming():
+            click.echo(f"\r   {stats['messages']} messages, {stats['attachments']} attachments, "
+                       f"{stats['downloaded']} downloaded, {skipped} skipped", nl=False, err=True)
+    
+    store = AttachmentStore(dest)
+    try:
+        stats = run_async(lambda client: download_attachments(
+            client, store, query=query, limit=limit, include_inline=include_inline,
+            mime_prefixes=mime, on_record=on_record, progress=progress
+        ))
+    except (HttpError, ApiError) as e:
+        fail(e)
+    
+    if streaming():
+        emit({'type': 'attachments_done', 'profile': None, 'dest': dest, **stats})
+    else:
+        click.echo(f"\n✓ {stats['attachments']} attachments from {stats['messages']} messages in {dest} "
+                   f"({stats['downloaded']} downloaded, {stats['reused']} reused, "
+                   f"{stats['skipped']} messages already done)")
+
+
+@mail.command('stats')
+@click.option('--by', type=click.Choice(['day', 'week', 'month']), default='month', help='Volume period')
+@click.option('--top', default=20, help='Senders to list')
+@click.option('--offline', is_flag=True, help='Report from the store without syncing')
+@click.option('--rebuild', is_flag=True, help='Discard the store and sync from scratch')
+def mail_stats(by, top, offline, rebuild):
+    """Sender, label, thread and volume breakdowns (synced incrementally)."""
+    fetched = []
+    
+    def progress(done, total):
+        fetched.append(done)
+        if not streaming():
+            click.echo(f"\r   fetched {done:,}/{total:,}", nl=False, err=True)
+    
+    if rebuild:
+        shutil.rmtree(MAIL_STATS_DIR, ignore_errors=True)
+    stats = MailStats(MAIL_STATS_DIR)
+    if not offline:
+        try:
+            run_async(lambda client: sync_stats(client, stats, progress))
+        except (HttpError, ApiError) as e:
+            fail(e)
+        if fetched and not streaming():
+            click.echo(err=True)
+    
+    result = aggregate_stats(stats, by=by, top=top)
+    if streaming():
+        emit_stats(result)
+    else:
+        print_stats(result)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""Home Assistant entity lookup from a local index.
+
+`refresh` keeps a JSON index of every entity's id, friendly name, area and
+last state in ~/.cache/home-assistant/entities.json. After the first full
+pull, a refresh asks HA (through POST /api/template) for only the entities
+updated since the last sync, plus the current id list so removals drop out.
+The REST API has no area lookup, but a template can call area_name(), so
+areas arrive in the same request.
+
+`find` and `areas` read only the index, so lookups take milliseconds and
+never touch HA. `md` regenerates references/entities.md from it.
+
+`call` and `batch` run many service calls concurrently on one pooled aiohttp
+session (at most --concurrency at once). Twenty lights take about one round
+trip instead of twenty, and each action's result is reported.
+
+Usage:
+    ha.py refresh [--full]
+    ha.py find [QUERY] [-d DOMAIN] [-a AREA] [-n N] [--json] [--refresh]
+    ha.py areas
+    ha.py md [-d DOMAIN ...] [-o PATH]
+    ha.py call SERVICE [ENTITY ...] [--data JSON] [-q QUERY] [-a AREA] [--dry-run]
+    ha.py batch [FILE] [--concurrency N] [--json]
+
+Needs HA_URL and HA_TOKEN in the environment to refresh or call services.
+"""
+
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'home-assistant'
+INDEX_FILE = CACHE_DIR / 'entities.json'
+EPOCH = '1970-01-01T00:00:00+00:00'
+FUZZY_CUTOFF = 0.75
+
+# Rows: [entity_id, state, name, area, last_changed, unit, device_class]
+CHANGES_TEMPLATE = """
+{%- set since = as_datetime(SINCE) -%}
+{%- set ns = namespace(rows=[]) -%}
+{%- for s in states if s.last_updated > since -%}
+{%- set ns.rows = ns.rows + [[s.entity_id, s.state, s.name, area_name(s.entity_id),
+    s.last_changed.isoformat(), s.attributes.get('unit_of_measurement'),
+    s.attributes.get('device_class')]] -%}
+{%- endfor -%}
+{{ {'now': now().isoformat(), 'ids': states | map(attribute='entity_id') | list,
+    'rows': ns.rows} | tojson }}
+"""
+
+DOMAIN_TITLES = {
+    'light': 'Lights',
+    'climate': 'Thermostats',
+    'sensor': 'Sensors',
+    'binary_sensor': 'Binary Sensors',
+    'switch': 'Switches',
+    'media_player': 'Media Players',
+    'cover': 'Covers',
+    'fan': 'Fans',
+    'lock': 'Locks',
+    'scene': 'Scenes',
+    'script': 'Scripts',
+    'automation': 'Automations',
+}
+MD_DOMAINS = ['light', 'climate', 'switch', 'media_player', 'cover', 'fan', 'lock', 'scene']
+DEFAULT_CONCURRENCY = 20
+
+
+class HAError(Exception):
+    """Home Assistant request failed."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def ha_env():
+    """(base URL, headers) from HA_URL/HA_TOKEN."""
+    url, token = os.environ.get('HA_URL'), os.environ.get('HA_TOKEN')
+    if not url or not token:
+        raise HAError('Set HA_URL and HA_TOKEN')
+    return url.rstrip('/'), {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+
+
+def ha_request(method, path, body=None, timeout=30):
+    """One REST call using HA_URL/HA_TOKEN; returns the response text."""
+    # Imported here: urllib.request costs ~30 ms and lookups never need it
+    import urllib.error
+    import urllib.request
+
+    url, headers = ha_env()
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url + path, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.read().decode()
+    except urllib.error.HTTPError as e:
+        raise HAError(f'{method} {path}: HTTP {e.code}', e.code) from e
+    except (urllib.error.URLError, OSError) as e:
+        raise HAError(f'{method} {path}: {e}') from e
+
+
+def _words(text):
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+class EntityIndex:
+    """Entities keyed by id, plus the server time of the last sync."""
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = Path(path)
+        self.entities = {}
+        self.synced = None
+        self.url = None
+        self._words = None
+        self._vocab = None
+
+    def load(self):
+        """Read the index; False if there is none yet."""
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return False
+        self.entities = data.get('entities', {})
+        self.synced = data.get('synced')
+        self.url = data.get('url')
+        return True
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps({'url': self.url, 'synced': self.synced,
+                                   'entities': self.entities}))
+        os.replace(tmp, self.path)
+
+    def apply(self, rows):
+        for entity_id, state, name, area, changed, unit, device_class in rows:
+            self.entities[entity_id] = {'state': state, 'name': name or '', 'area': area or '',
+                                        'changed': changed, 'unit': unit, 'class': device_class}
+        self._words = None
+
+    def words(self):
+        """Search words per entity, built once per process."""
+        if self._words is None:
+            self._words = {eid: _words(f"{eid} {e['name']} {e['area']}")
+                           for eid, e in self.entities.items()}
+            self._vocab = {w for ws in self._words.values() for w in ws}
+        return self._words
+
+    def search(self, query='', domain=None, area=None, limit=None):
+        """Entities matching every query word (exactly, by prefix or fuzzily), best first.
+
+        Returns (entity_id, record) pairs. A word scores 3 for a whole-word
+        hit, 2 for a prefix, 1.5 for a substring, and the similarity ratio for
+        a close spelling (difflib over the index vocabulary).
+        """
+        words = self.words()
+        tokens = _words(query or '')
+        close = {}
+        for token in tokens:
+            if not any(token in w for w in self._vocab):
+                close[token] = {w: difflib.SequenceMatcher(None, token, w).ratio()
+                                for w in difflib.get_close_matches(token, self._vocab, n=20,
+                                                                   cutoff=FUZZY_CUTOFF)}
+        area = area.lower() if area else None
+
+        results = []
+        for entity_id, record in self.entities.items():
+            if domain and entity_id.split('.', 1)[0] != domain:
+                continue
+            if area and area not in record['area'].lower():
+                continue
+            score = 0.0
+            entity_words = words[entity_id]
+            for token in tokens:
+                if token in close:
+                    hit = max((close[token].get(w, 0) for w in entity_words), default=0)
+                elif token in entity_words:
+                    hit = 3
+                elif any(w.startswith(token) for w in entity_words):
+                    hit = 2
+                elif any(token in w for w in entity_words):
+                    hit = 1.5
+                else:
+                    hit = 0
+                if not hit:
+                    break
+                score += hit
+            else:
+                results.append((-score, entity_id, record))
+        results.sort(key=lambda r: (r[0], r[1]))
+        return [(eid, rec) for _, eid, rec in results[:limit]]
+
+    def areas(self):
+        counts = {}
+        for record in self.entities.values():
+            counts[record['area']] = counts.get(record['area'], 0) + 1
+        return counts
+
+
+def refresh(index, full=False):
+    """Bring the index up to date; returns (changed, removed) counts.
+
+    Incremental unless full, the index is empty, or it came from another HA.
+    Falls back to a plain /api/states pull (no areas) if the template API is
+    unavailable.
+    """
+    url = os.environ.get('HA_URL', '').rstrip('/')
+    if index.url != url:
+        full = True
+        index.entities = {}
+    since = EPOCH if full or not index.synced else index.synced
+    try:
+        result = json.loads(ha_request('POST', '/api/template',
+                                       {'template': CHANGES_TEMPLATE.replace('SINCE', json.dumps(since))}))
+    except HAError as e:
+        if e.status not in (400, 404):
+            raise
+        return _refresh_from_states(index, url)
+
+    ids = set(result['ids'])
+    removed = [eid for eid in index.entities if eid not in ids]
+    for entity_id in removed:
+        del index.entities[entity_id]
+    index.apply(result['rows'])
+    if not full and ids - index.entities.keys():
+        # Entities we never saw that have not changed since (e.g. a partial index)
+        return refresh(index, full=True)
+    index.url = url
+    index.synced = result['now']
+    index.save()
+    return len(result['rows']), len(removed)
+
+
+def _refresh_from_states(index, url):
+    states = json.loads(ha_request('GET', '/api/states'))
+    known = {eid: rec['area'] for eid, rec in index.entities.items()}
+    removed = len(index.entities.keys() - {s['entity_id'] for s in states})
+    index.entities = {}
+    index.apply([[s['entity_id'], s['state'], s.get('attributes', {}).get('friendly_name'),
+                  known.get(s['entity_id']), s.get('last_changed'),
+                  s.get('attributes', {}).get('unit_of_measurement'),
+                  s.get('attributes', {}).get('device_class')] for s in states])
+    index.url = url
+    index.synced = datetime.now(timezone.utc).isoformat()
+    index.save()
+    return len(states), removed
+
+
+def render_markdown(index, domains=None):
+    """entities.md body: one section per domain, entities grouped by area."""
+    domains = domains or MD_DOMAINS
+    lines = ['# Home Assistant Entity Inventory', '',
+             '_Generated by `scripts/ha.py md` from the entity index; re-run after adding devices._']
+    for domain in domains:
+        entries = index.search(domain=domain)
+        if not entries:
+            continue
+        lines += ['', f"## {DOMAIN_TITLES.get(domain, domain.replace('_', ' ').title())}"]
+        entries.sort(key=lambda e: (not e[1]['area'], e[1]['area'], e[0]))
+        for entity_id, record in entries:
+            detail = record['name']
+            if record['area']:
+                detail += f" ({record['area']})"
+            lines.append(f"- `{entity_id}`" + (f" — {detail}" if detail else ''))
+    return '\n'.join(lines) + '\n'
+
+
+def parse_actions(text):
+    """Actions from a JSON list or NDJSON lines of {service, entity_id, data}.
+
+    An entity_id list becomes one action per entity, so each gets its own result.
+    """
+    text = text.strip()
+    if text.startswith('['):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    actions = []
+    for item in items:
+        service = item.get('service', '')
+        if '.' not in service:
+            raise HAError(f"action needs a 'domain.service' service: {item}")
+        entities = item.get('entity_id')
+        for entity_id in entities if isinstance(entities, list) else [entities]:
+            actions.append({'service': service, 'entity_id': entity_id, 'data': item.get('data') or {}})
+    return actions
+
+
+async def run_actions(actions, concurrency=DEFAULT_CONCURRENCY, timeout=30):
+    """POST every action concurrently; return one result dict per action, in order."""
+    try:
+        import aiohttp
+    except ImportError:
+        print("ERROR: Run: pip install aiohttp  (Debian/Ubuntu: sudo apt install python3-aiohttp)")
+        sys.exit(1)
+    url, headers = ha_env()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=client_timeout) as session:
+        async def run(action):
+            domain, service = action['service'].split('.', 1)
+            body = dict(action['data'])
+            if action['entity_id']:
+                body['entity_id'] = action['entity_id']
+            started = time.monotonic()
+            error = None
+            try:
+                async with session.post(f'{url}/api/services/{domain}/{service}', json=body) as resp:
+                    await resp.read()
+                    if resp.status >= 300:
+                        error = f'HTTP {resp.status}'
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            return dict(action, ok=error is None, error=error,
+                        ms=round((time.monotonic() - started) * 1000))
+
+        return await asyncio.gather(*(run(a) for a in actions))
+
+
+def report(results, elapsed, output_json=False):
+    """Print per-action results; return True if all succeeded."""
+    if output_json:
+        print(json.dumps({'elapsed_ms': round(elapsed * 1000), 'results': results}, indent=2))
+    else:
+        for r in results:
+            mark = '✅' if r['ok'] else '❌'
+            detail = f"{r['ms']} ms" if r['ok'] else r['error']
+            print(f"{mark} {r['service']} {r['entity_id'] or ''}  ({detail})")
+        failed = sum(not r['ok'] for r in results)
+        print(f"{len(results) - failed}/{len(results)} ok in {elapsed * 1000:.0f} ms")
+    return all(r['ok'] for r in results)
+
+
+def execute(actions, concurrency, output_json=False):
+    started = time.monotonic()
+    results = asyncio.run(run_actions(actions, concurrency))
+    if not report(results, time.monotonic() - started, output_json):
+        sys.exit(1)
+
+
+def load_index(refresh_first=False):
+    """The local index, pulling it from HA on first use or when asked."""
+    index = EntityIndex()
+    if not index.load() or refresh_first:
+        refresh(index)
+    return index
+
+
+def cmd_refresh(args):
+    index = EntityIndex()
+    index.load()
+    changed, removed = refresh(index, full=args.full)
+    print(f"✅ {len(index.entities)} entities ({changed} updated, {removed} removed)")
+
+
+def cmd_find(args):
+    index = load_index(args.refresh)
+    matches = index.search(args.query, args.domain, args.area, args.limit)
+    if args.json:
+        print(json.dumps([dict(entity_id=eid, **rec) for eid, rec in matches], indent=2))
+        return
+    if not matches:
+        print("No matching entities.")
+        return
+    for entity_id, record in matches:
+        state = record['state'] + (f" {record['unit']}" if record['unit'] else '')
+        area = f"  [{record['area']}]" if record['area'] else ''
+        print(f"{entity_id}  {state}  {record['name']}{area}")
+
+
+def cmd_areas(args):
+    index = load_index()
+    for area, count in sorted(index.areas().items(), key=lambda a: (not a[0], a[0])):
+        print(f"{area or '(no area)'}: {count}")
+
+
+def cmd_md(args):
+    text = render_markdown(load_index(args.refresh), args.domain)
+    if args.output:
+        Path(args.output).write_text(text)
+        print(f"✅ Wrote {args.output}")
+    else:
+        print(text, end='')
+
+
+def cmd_call(args):
+    domain = args.service.split('.', 1)[0]
+    entities = list(args.entities)
+    if args.query or args.area:
+        index = load_index(args.refresh)
+        entities += [eid for eid, _ in index.search(args.query, args.domain or domain, args.area)]
+    if not entities:
+        raise HAError('No entities given or matched')
+    data = json.loads(args.data) if args.data else {}
+    actions = [{'service': args.service, 'entity_id': e, 'data': data} for e in dict.fromkeys(entities)]
+    if args.dry_run:
+        for action in actions:
+            print(f"{action['service']} {action['entity_id']} {json.dumps(action['data'])}")
+        return
+    execute(actions, args.concurrency, args.json)
+
+
+def cmd_batch(args):
+    text = sys.stdin.read() if args.file in (None, '-') else Path(args.file).read_text()
+    try:
+        actions = parse_actions(text)
+    except ValueError as e:
+        raise HAError(f'Bad actions: {e}') from None
+    execute(actions, args.concurrency, args.json)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Home Assistant entity lookup and service calls')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('refresh', help='Update the local entity index from HA')
+    p.add_argument('--full', action='store_true', help='Re-pull everything, including areas')
+    p.set_defaults(func=cmd_refresh)
+
+    p = sub.add_parser('find', help='Search the index by name, domain and area')
+    p.add_argument('query', nargs='?', default='', help='Words to match (fuzzy)')
+    p.add_argument('-d', '--domain', help='Only this domain (light, sensor, ...)')
+    p.add_argument('-a', '--area', help='Only areas containing this text')
+    p.add_argument('-n', '--limit', type=int, default=25, help='Max results (default: 25)')
+    p.add_argument('--json', action='store_true', help='Output as JSON')
+    p.add_argument('--refresh', action='store_true', help='Refresh the index first')
+    p.set_defaults(func=cmd_find)
+
+    p = sub.add_parser('areas', help='List areas and entity counts')
+    p.set_defaults(func=cmd_areas)
+
+    p = sub.add_parser('md', help='Regenerate references/entities.md')
+    p.add_argument('-d', '--domain', action='append',
+                   help=f"Domain to include, repeatable (default: {', '.join(MD_DOMAINS)})")
+    p.add_argument('-o', '--output', help='Write here instead of stdout')
+    p.add_argument('--refresh', action='store_true', help='Refresh the index first')
+    p.set_defaults(func=cmd_md)
+
+    p = sub.add_parser('call', help='Call one service on many entities at once')
+    p.add_argument('service', help='domain.service, e.g. light.turn_off')
+    p.add_argument('entities', nargs='*', help='Entity IDs')
+    p.add_argument('--data', help='Extra service data as JSON, e.g. \'{"brightness": 128}\'')
+    p.add_argument('-q', '--query', default='', help='Also target index matches for this text')
+    p.add_argument('-a', '--area', help='Also target index matches in this area')
+    p.add_argument('-d', '--domain', help="Domain for -q/-a matches (default: the service's)")
+    p.add_argument('--refresh', action='store_true', help='Refresh the index before matching')
+    p.add_argument('--dry-run', action='store_true', help='Print the actions without calling')
+    p.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                   help=f'Max calls in flight (default: {DEFAULT_CONCURRENCY})')
+    p.add_argument('--json', action='store_true', help='Output results as JSON')
+    p.set_defaults(func=cmd_call)
+
+    p = sub.add_parser('batch', help='Run a list of service calls concurrently')
+    p.add_argument('file', nargs='?', help='JSON list or NDJSON of {service, entity_id, data} (default: stdin)')
+    p.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                   help=f'Max calls in flight (default: {DEFAULT_CONCURRENCY})')
+    p.add_argument('--json', action='store_true', help='Output results as JSON')
+    p.set_defaults(func=cmd_batch)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except HAError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
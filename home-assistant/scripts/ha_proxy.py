@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Local Home Assistant proxy backed by a live state mirror.
+
+The battery monitors, ha.py and ad-hoc queries each used to ask HA for the
+same states, often in the same second. Point them at this proxy instead
+(HA_URL=http://127.0.0.1:8124) and:
+
+- GET /api/states and /api/states/<entity_id> are answered from memory. One
+  WebSocket subscription to state_changed keeps the mirror current: it
+  subscribes first, then loads get_states, then replays any event newer than
+  the snapshot. While the socket is down, reads go upstream.
+- Other reads (GET, and POST /api/template) go upstream single-flight.
+  Concurrent identical requests share one upstream call and its response.
+- Service calls and other writes pass straight through, never coalesced.
+- /api/websocket is tunnelled to HA, so WebSocket clients (battery_daemon.py)
+  work through the proxy too.
+
+Clients must send HA_TOKEN as their bearer token, the same one the proxy
+uses upstream. GET /proxy/status reports mirror and coalescing counters.
+
+Usage:
+    ha_proxy.py [--host 127.0.0.1] [--port 8124]
+
+Needs HA_URL and HA_TOKEN in the environment. Requires aiohttp.
+"""
+
+import argparse
+import asyncio
+import functools
+import hmac
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from ha import HAError, ha_env
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    print("ERROR: Run: pip install aiohttp  (Debian/Ubuntu: sudo apt install python3-aiohttp)")
+    sys.exit(1)
+
+DEFAULT_PORT = 8124
+MAX_BACKOFF = 60
+UPSTREAM_TIMEOUT = 30
+# Requests that only read, so identical concurrent ones can share a response
+COALESCED_POSTS = {'/api/template'}
+
+
+def websocket_url(base_url):
+    return base_url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1) + '/api/websocket'
+
+
+def _changed_at(state):
+    return (state or {}).get('last_updated') or ''
+
+
+class Mirror:
+    """Every entity state, kept current from the WebSocket event stream."""
+
+    def __init__(self, url, token, session, log):
+        self.url = url
+        self.token = token
+        self.session = session
+        self.log = log
+        self.states = {}
+        self.connected = False
+        self.synced_at = None
+        self.events = 0
+        self.version = 0
+        self._body = (None, b'')
+
+    def apply(self, entity_id, new_state):
+        """Fold one state change in; events older than what we hold are ignored."""
+        if new_state is None:
+            if self.states.pop(entity_id, None) is not None:
+                self.version += 1
+            return
+        if _changed_at(new_state) >= _changed_at(self.states.get(entity_id)):
+            self.states[entity_id] = new_state
+            self.version += 1
+
+    def states_body(self):
+        """The /api/states JSON, re-serialised only after something changed."""
+        version, body = self._body
+        if version != self.version:
+            body = json.dumps(list(self.states.values())).encode()
+            self._body = (self.version, body)
+        return body
+
+    async def session_once(self):
+        """One connection: auth, subscribe, snapshot, then follow events."""
+        async with self.session.ws_connect(websocket_url(self.url), heartbeat=30,
+                                           max_msg_size=0) as ws:
+            msg = await ws.receive_json()
+            if msg.get('type') != 'auth_required':
+                raise HAError(f'unexpected greeting: {msg}')
+            await ws.send_json({'type': 'auth', 'access_token': self.token})
+            msg = await ws.receive_json()
+            if msg.get('type') != 'auth_ok':
+                raise HAError(f"auth failed: {msg.get('message', msg)}")
+
+            await ws.send_json({'id': 1, 'type': 'subscribe_events', 'event_type': 'state_changed'})
+            await ws.send_json({'id': 2, 'type': 'get_states'})
+            early = []  # events that arrive before the snapshot
+            async for raw in ws:
+                if raw.type != aiohttp.WSMsgType.TEXT:
+                    break
+                msg = json.loads(raw.data)
+                if msg.get('type') == 'event':
+                    data = msg['event']['data']
+                    self.events += 1
+                    if self.connected:
+                        self.apply(data['entity_id'], data.get('new_state'))
+                    else:
+                        early.append(data)
+                elif msg.get('id') == 2:
+                    if not msg.get('success'):
+                        raise HAError(f"get_states failed: {msg.get('error')}")
+                    self.states = {s['entity_id']: s for s in msg['result']}
+                    for data in early:
+                        self.apply(data['entity_id'], data.get('new_state'))
+                    self.version += 1
+                    self.connected = True
+                    self.synced_at = time.time()
+                    self.log(f"mirror synced: {len(self.states)} entities")
+                elif msg.get('id') == 1 and not msg.get('success'):
+                    raise HAError(f"subscribe failed: {msg.get('error')}")
+            raise ConnectionError('event stream closed')
+
+    async def run(self):
+        """Follow HA forever, reconnecting with exponential backoff."""
+        backoff = 1
+        while True:
+            try:
+                await self.session_once()
+            except (aiohttp.ClientError, ConnectionError, HAError, asyncio.TimeoutError, ValueError) as e:
+                if self.connected:
+                    backoff = 1
+                self.log(f"mirror disconnected: {e}; retrying in {backoff}s")
+            self.connected = False
+            await asyncio.sleep(backoff)
+            backoff = min(MAX_BACKOFF, backoff * 2)
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key."""
+
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # shield: one caller disconnecting must not cancel the others' request
+        return await asyncio.shield(future)
+
+
+class Proxy:
+    """aiohttp app: mirror reads, single-flight reads, pass-through writes."""
+
+    def __init__(self, url, token, log=None):
+        self.url = url
+        self.token = token
+        self.log = log or (lambda message: print(message, file=sys.stderr, flush=True))
+        self.flight = SingleFlight()
+        self.session = None
+        self.mirror = None
+        self.mirror_reads = 0
+        self.passed = 0
+
+    # --------------------------------------------------------
+    # Upstream
+    # --------------------------------------------------------
+
+    async def upstream(self, method, path_qs, body=None, content_type=None):
+        """One upstream REST call; returns (status, content_type, body bytes)."""
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        try:
+            async with self.session.request(method, self.url + path_qs, data=body, headers=headers,
+                                            timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT)) as resp:
+                return resp.status, resp.content_type, await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return 502, 'application/json', json.dumps({'message': f'upstream: {e}'}).encode()
+
+    async def forward(self, request, coalesce):
+        body = await request.read() if request.can_read_body else None
+        call = functools.partial(self.upstream, request.method, request.path_qs, body,
+                                 request.headers.get('Content-Type'))
+        if coalesce:
+            status, content_type, data = await self.flight.do((request.method, request.path_qs, body), call)
+        else:
+            self.passed += 1
+            status, content_type, data = await call()
+        return web.Response(status=status, body=data, content_type=content_type)
+
+    # --------------------------------------------------------
+    # Handlers
+    # --------------------------------------------------------
+
+    @web.middleware
+    async def auth(self, request, handler):
+        # WebSocket clients authenticate with HA inside the tunnel
+        if request.path != '/api/websocket':
+            given = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(given.encode(), f'Bearer {self.token}'.encode()):
+                return web.Response(status=401, text='401: Unauthorized')
+        return await handler(request)
+
+    async def all_states(self, request):
+        if not self.mirror.connected:
+            return await self.forward(request, coalesce=True)
+        self.mirror_reads += 1
+        return web.Response(body=self.mirror.states_body(), content_type='application/json')
+
+    async def one_state(self, request):
+        if not self.mirror.connected:
+            return await self.forward(request, coalesce=True)
+        self.mirror_reads += 1
+        state = self.mirror.states.get(request.match_info['entity_id'])
+        if state is None:
+            return web.json_response({'message': 'Entity not found.'}, status=404)
+        return web.json_response(state)
+
+    async def other(self, request):
+        coalesce = request.method in ('GET', 'HEAD') or (request.method == 'POST'
+                                                         and request.path in COALESCED_POSTS)
+        return await self.forward(request, coalesce)
+
+    async def tunnel(self, request):
+        """Relay a WebSocket client to HA frame by frame."""
+        client = web.WebSocketResponse(max_msg_size=0)
+        await client.prepare(request)
+        try:
+            async with self.session.ws_connect(websocket_url(self.url), max_msg_size=0) as upstream:
+                async def pump(source, sink):
+                    async for msg in source:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            await sink.send_str(msg.data)
+                        elif msg.type == aiohttp.WSMsgType.BINARY:
+                            await sink.send_bytes(msg.data)
+                        else:
+                            break
+
+                tasks = [asyncio.ensure_future(pump(client, upstream)),
+                         asyncio.ensure_future(pump(upstream, client))]
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    task.cancel()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.log(f"websocket tunnel: {e}")
+        await client.close()
+        return client
+
+    async def status(self, request):
+        return web.json_response({
+            'connected': self.mirror.connected,
+            'entities': len(self.mirror.states),
+            'synced_at': self.mirror.synced_at,
+            'events': self.mirror.events,
+            'mirror_reads': self.mirror_reads,
+            'upstream_reads': self.flight.calls,
+            'coalesced_reads': self.flight.coalesced,
+            'passed_through': self.passed,
+        })
+
+    # --------------------------------------------------------
+    # Lifecycle
+    # --------------------------------------------------------
+
+    def app(self):
+        app = web.Application(middlewares=[self.auth], client_max_size=16 * 1024 * 1024)
+        app.router.add_get('/api/states', self.all_states)
+        app.router.add_get('/api/states/{entity_id}', self.one_state)
+        app.router.add_get('/api/websocket', self.tunnel)
+        app.router.add_get('/proxy/status', self.status)
+        app.router.add_route('*', '/api/{tail:.*}', self.other)
+        app.cleanup_ctx.append(self._background)
+        return app
+
+    async def _background(self, app):
+        # No session-wide timeout: the mirror and tunnels hold WebSockets open
+        self.session = aiohttp.ClientSession()
+        self.mirror = Mirror(self.url, self.token, self.session, self.log)
+        task = asyncio.create_task(self.mirror.run())
+        yield
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Home Assistant state mirror and proxy')
+    parser.add_argument('--host', default='127.0.0.1', help='Listen address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Listen port (default: {DEFAULT_PORT})')
+    args = parser.parse_args()
+
+    try:
+        url, headers = ha_env()
+    except HAError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    token = headers['Authorization'].removeprefix('Bearer ')
+    print(f"▶ proxying {url} on http://{args.host}:{args.port}", file=sys.stderr, flush=True)
+    web.run_app(Proxy(url, token).app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
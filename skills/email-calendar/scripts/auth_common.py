@@ -24,6 +24,13 @@ def is_headless():
 CONFIG_DIR = Path.home() / '.config' / 'openclaw-email'
 PROFILES_FILE = CONFIG_DIR / 'profiles.json'
 
+# Pseudo-profile that fans a command out over every configured profile
+ALL_PROFILES = 'all'
+
+
+class AuthError(Exception):
+    """Raised instead of prompting when non-interactive auth is impossible."""
+
 # Default scopes
 GMAIL_READONLY = ['https://www.googleapis.com/auth/gmail.readonly']
 GMAIL_SEND = ['https://www.googleapis.com/auth/gmail.send']
@@ -45,6 +52,13 @@ def list_profiles() -> list:
     return [p.name for p in profiles_dir.iterdir() if p.is_dir() and (p / 'credentials.json').exists()]
 
 
+def resolve_profiles(profile: str) -> list:
+    """Expand the 'all' pseudo-profile; any other name maps to itself."""
+    if profile == ALL_PROFILES:
+        return sorted(list_profiles())
+    return [profile]
+
+
 def get_profile_info(profile: str = 'default') -> dict:
     """Get profile metadata."""
     profile_dir = get_profile_dir(profile)
@@ -62,8 +76,14 @@ def save_profile_info(profile: str, email: str, name: str = None):
     (profile_dir / 'profile.json').write_text(json.dumps(info, indent=2))
 
 
-def get_credentials(profile: str = 'default', scopes: list = None) -> Credentials:
-    """Get or refresh OAuth credentials for a profile."""
+def get_credentials(profile: str = 'default', scopes: list = None,
+                    interactive: bool = True) -> Credentials:
+    """Get or refresh OAuth credentials for a profile.
+
+    With interactive=False a missing or unrefreshable token raises AuthError
+    instead of starting the browser flow or exiting, so one profile can fail
+    without taking down a multi-profile run.
+    """
     if scopes is None:
         scopes = GMAIL_READONLY
     
@@ -81,15 +101,16 @@ def get_credentials(profile: str = 'default', scopes: list = None) -> Credential
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+        elif not interactive:
+            raise AuthError(f"No valid token for profile '{profile}' "
+                            f"(run: python scripts/profile_setup.py --profile {profile})")
         else:
             if not creds_file.exists():
-                print(f"ERROR: Credentials not found for profile '{profile}'")
-                print(f"Expected at: {creds_file}")
-                print(f"\nTo set up this profile:")
-                print(f"  1. Download OAuth credentials from Google Cloud Console")
-                print(f"  2. Save to: {creds_file}")
-                print(f"\nOr run: python scripts/profile_setup.py --profile {profile}")
-                sys.exit(1)
+                print(f"\nTo set up profile '{profile}':", file=sys.stderr)
+                print(f"  1. Download OAuth credentials from Google Cloud Console", file=sys.stderr)
+                print(f"  2. Save to: {creds_file}", file=sys.stderr)
+                print(f"\nOr run: python scripts/profile_setup.py --profile {profile}", file=sys.stderr)
+                raise AuthError(f"Credentials not found for profile '{profile}' (expected at {creds_file})")
             
             flow = InstalledAppFlow.from_client_secrets_file(str(creds_file), scopes)
             
@@ -118,7 +139,8 @@ def get_credentials(profile: str = 'default', scopes: list = None) -> Credential
 def add_profile_args(parser):
     """Add common profile arguments to argparser."""
     parser.add_argument('--profile', '-p', default='default', 
-                        help='Account profile to use (default: default)')
+                        help='Account profile to use (default: default; '
+                             "'all' where supported)")
     parser.add_argument('--list-profiles', action='store_true',
                         help='List available profiles and exit')
 
@@ -127,7 +149,11 @@ def handle_profile_args(args):
     """Handle profile listing if requested."""
     if getattr(args, 'list_profiles', False):
         profiles = list_profiles()
-        if not profiles:
+        if getattr(args, 'ndjson', False):
+            from records import emit, profile_record
+            for p in profiles:
+                emit(profile_record(p, get_profile_info(p).get('email')))
+        elif not profiles:
             print("No profiles configured.")
             print(f"\nRun: python scripts/profile_setup.py --profile <name>")
         else:
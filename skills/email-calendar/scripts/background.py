@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Detached background work for commands that return before it is done.
+
+Used by the outbox flusher (outbox.start_flusher) and the body prefetch
+(gmail_read.prefetch_detached).
+"""
+
+import os
+import sys
+
+
+def detach():
+    """Fork a detached child: True in the child, False in the parent.
+
+    Output is flushed first and the child's stdin, stdout and stderr are
+    /dev/null, so the parent's output is complete and a reader piping it
+    sees EOF without waiting for the child. The child must end with
+    os._exit().
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if os.fork() > 0:
+        return False
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    return True
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Size-bounded on-disk cache of decoded message bodies.
+
+Every read used to cost a messages.get (format=full) and a fresh decode,
+even for a message read a minute earlier. BodyCache keeps what the read
+commands show, per profile and keyed on message ID, in a SQLite file:
+
+- the message's ID, thread, labels and display headers
+- the decoded body, its HTML-stripped text and the attachment manifest
+
+A cached message is served without any API call. Gmail never changes a
+message body, only its labels, and a message can be deleted. So each cache
+miss, which opens a client anyway, also runs users.history.list from the
+last historyId the cache saw. Every message touched since (labels added or
+removed, deleted) is dropped, and the next read fetches it again. An
+expired historyId empties the cache.
+
+Entries are evicted least recently read first once the stored text passes
+the budget: GMAIL_BODY_CACHE_MB, default 64. Set it to 0 to turn the cache
+off. gmail_read.py --no-cache and `google-tool mail read --no-cache` skip
+it for one read.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from auth_common import get_profile_dir
+from gapi_async import ApiError
+
+CACHE_FILE = 'body_cache.sqlite'
+DEFAULT_MB = 64
+# Headers kept with a cached body; enough for records.message_body_record
+KEPT_HEADERS = ('From', 'To', 'Cc', 'Date', 'Subject')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bodies (
+    id TEXT PRIMARY KEY,
+    message TEXT NOT NULL,
+    body TEXT NOT NULL,
+    text TEXT NOT NULL,
+    attachments TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bodies_accessed ON bodies (accessed);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def budget_bytes():
+    """Byte budget from GMAIL_BODY_CACHE_MB (0 disables the cache)."""
+    try:
+        mb = float(os.environ.get('GMAIL_BODY_CACHE_MB', DEFAULT_MB))
+    except ValueError:
+        mb = DEFAULT_MB
+    return max(0, int(mb * 1024 * 1024))
+
+
+def message_stub(message):
+    """The parts of a messages.get response that the read output uses."""
+    return {
+        'id': message['id'],
+        'threadId': message.get('threadId'),
+        'labelIds': message.get('labelIds', []),
+        'internalDate': message.get('internalDate'),
+        'payload': {'headers': [h for h in message.get('payload', {}).get('headers', [])
+                                if h['name'] in KEPT_HEADERS]},
+    }
+
+
+class BodyCache:
+    """message ID -> {message, body, text, attachments}, LRU within max_bytes."""
+
+    def __init__(self, path, max_bytes=None):
+        self.path = Path(path)
+        self.max_bytes = budget_bytes() if max_bytes is None else max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # --------------------------------------------------------
+    # Entries
+    # --------------------------------------------------------
+
+    def get(self, message_id):
+        """The cached entry for message_id, or None. A hit counts as a use."""
+        row = self.db.execute('SELECT message, body, text, attachments FROM bodies WHERE id = ?',
+                              (message_id,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute('UPDATE bodies SET accessed = ? WHERE id = ?', (time.time(), message_id))
+        message, body, text, attachments = row
+        return {'message': json.loads(message), 'body': body, 'text': text,
+                'attachments': json.loads(attachments)}
+
+    def put(self, entry):
+        """Store an entry (as built by gmail_read.message_entry), then evict to budget."""
+        message = json.dumps(message_stub(entry['message']))
+        attachments = json.dumps(entry['attachments'])
+        size = sum(len(s.encode()) for s in (message, entry['body'], entry['text'], attachments))
+        if size > self.max_bytes:
+            return
+        self.db.execute('INSERT OR REPLACE INTO bodies VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (entry['message']['id'], message, entry['body'], entry['text'],
+                         attachments, size, time.time()))
+        self.evict()
+
+    def missing(self, message_ids):
+        """The IDs among message_ids with no entry, in order."""
+        have = {row[0] for row in self.db.execute(
+            f"SELECT id FROM bodies WHERE id IN ({','.join('?' * len(message_ids))})", message_ids)}
+        return [m for m in message_ids if m not in have]
+
+    def resolve(self, prefix):
+        """The one cached ID starting with prefix, else prefix unchanged."""
+        rows = self.db.execute("SELECT id FROM bodies WHERE substr(id, 1, ?) = ? LIMIT 2",
+                               (len(prefix), prefix)).fetchall()
+        return rows[0][0] if len(rows) == 1 else prefix
+
+    def evict(self):
+        """Drop least recently read entries until the total fits max_bytes."""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for message_id, size in self.db.execute('SELECT id, size FROM bodies ORDER BY accessed'):
+            if total <= self.max_bytes:
+                break
+            doomed.append((message_id,))
+            total -= size
+        self.db.executemany('DELETE FROM bodies WHERE id = ?', doomed)
+
+    def invalidate(self, message_ids):
+        self.db.executemany('DELETE FROM bodies WHERE id = ?', [(m,) for m in message_ids])
+
+    def clear(self):
+        self.db.execute('DELETE FROM bodies')
+
+    def stats(self):
+        count, total = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM bodies').fetchone()
+        return {'entries': count, 'bytes': total, 'max_bytes': self.max_bytes,
+                'history_id': self.history_id}
+
+    # --------------------------------------------------------
+    # History
+    # --------------------------------------------------------
+
+    @property
+    def history_id(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'history_id'").fetchone()
+        return row[0] if row else None
+
+    @history_id.setter
+    def history_id(self, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('history_id', ?)", (str(value),))
+
+    async def sync(self, client):
+        """Drop every entry changed since the last sync.
+
+        Returns the IDs of all messages touched in that span, or None when
+        there was no usable historyId (first use, or expired) and the cache
+        was emptied and re-based on the mailbox's current one.
+        """
+        start = self.history_id
+        if start is not None:
+            touched = set()
+            latest = start
+            page_token = None
+            try:
+                while True:
+                    page = await client.list_history(start, page_token=page_token)
+                    latest = page.get('historyId', latest)
+                    for record in page.get('history', []):
+                        touched.update(m['id'] for m in record.get('messages', []))
+                    page_token = page.get('nextPageToken')
+                    if not page_token:
+                        break
+            except ApiError as e:
+                if e.status != 404:
+                    raise
+            else:
+                self.invalidate(touched)
+                self.history_id = latest
+                return touched
+        self.clear()
+        self.history_id = (await client.get_profile())['historyId']
+        return None
+
+
+def open_cache(path, max_bytes=None):
+    """A BodyCache at path, or None when the budget is 0."""
+    max_bytes = budget_bytes() if max_bytes is None else max_bytes
+    return BodyCache(path, max_bytes) if max_bytes > 0 else None
+
+
+def profile_cache(profile='default'):
+    """The body cache for a profile (None when disabled)."""
+    return open_cache(get_profile_dir(profile) / CACHE_FILE)
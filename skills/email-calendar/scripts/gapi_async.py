@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""Asyncio client for the Gmail and Calendar REST endpoints these tools use.
+
+googleapiclient is blocking and sits on httplib2, which is not thread-safe, so
+listing, reading and fan-out go straight to the REST API over a pooled aiohttp
+session instead. One GoogleClient wraps one set of credentials (one profile)
+and caps that profile's in-flight requests with a semaphore. batch() packs
+many calls into multipart/mixed requests to the /batch endpoints.
+"""
+
+import asyncio
+import base64
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from urllib.parse import quote, urlencode
+
+try:
+    import aiohttp
+except ImportError:
+    print("ERROR: Run: pip install aiohttp  (Debian/Ubuntu: sudo apt install python3-aiohttp)")
+    sys.exit(1)
+
+API_ROOT = 'https://www.googleapis.com'
+GMAIL_URL = f'{API_ROOT}/gmail/v1/users/me'
+CALENDAR_URL = f'{API_ROOT}/calendar/v3'
+GMAIL_BATCH_URL = f'{API_ROOT}/batch/gmail/v1'
+CALENDAR_BATCH_URL = f'{API_ROOT}/batch/calendar/v3'
+
+# Gmail allows ~250 quota units/s per user and messages.get costs 5, so
+# eight requests in flight stays well inside the budget for one profile.
+DEFAULT_CONCURRENCY = 8
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# For calls that must not run twice (sends, inserts): a 429 was refused
+# unprocessed, but after a 5xx the call may already have taken effect
+NON_IDEMPOTENT_RETRY = {429}
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+# Calls per batch request: Google's hard limit is 100, Gmail advises 50
+BATCH_SIZE = 50
+
+# Failures worth waiting out in long-running loops
+TRANSIENT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+# Of those, the ones raised before a request went out: safe to send again
+UNSENT_ERRORS = (aiohttp.ClientConnectorError,)
+
+
+class ApiError(Exception):
+    """Non-retryable error response from a Google API."""
+
+    def __init__(self, status, message):
+        super().__init__(f'HTTP {status}: {message}')
+        self.status = status
+        self.message = message
+
+
+def header_map(message):
+    """Return a message's top-level headers as a dict."""
+    return {h['name']: h['value'] for h in message.get('payload', {}).get('headers', [])}
+
+
+def decode_b64url(data):
+    """Decode Gmail's unpadded base64url payloads to bytes."""
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _params(**kwargs):
+    """Build a query list, dropping None and repeating list-valued keys."""
+    params = []
+    for key, value in kwargs.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        if isinstance(value, (list, tuple)):
+            params.extend((key, str(v)) for v in value)
+        else:
+            params.append((key, str(value)))
+    return params
+
+
+class TokenBucket:
+    """At most `rate` tokens per second on average, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    async def take(self, n=1):
+        n = min(n, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            await asyncio.sleep((n - self.tokens) / self.rate)
+
+
+class GoogleClient:
+    """Bounded-concurrency client for one profile's credentials.
+
+    Use as an async context manager so the session is closed:
+
+        async with GoogleClient(creds) as client:
+            page = await client.list_messages(q='is:unread')
+    """
+
+    def __init__(self, creds, concurrency=DEFAULT_CONCURRENCY, label=None):
+        self.creds = creds
+        self.concurrency = concurrency
+        self.label = label
+        self._sem = asyncio.Semaphore(concurrency)
+        self._refresh_lock = asyncio.Lock()
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def _token(self):
+        """Return a valid access token, refreshing it at most once at a time."""
+        if not self.creds.valid:
+            async with self._refresh_lock:
+                if not self.creds.valid:
+                    from google.auth.transport.requests import Request
+                    await asyncio.to_thread(self.creds.refresh, Request())
+        return self.creds.token
+
+    async def send(self, method, url, params=None, body=None, data=None, headers=None,
+                   idempotent=True):
+        """Send a request with auth and retries; return (content_type, body bytes).
+
+        With idempotent=False only a 429 is retried; a 5xx raises ApiError
+        and the caller decides whether sending again is safe.
+        """
+        retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY
+        refreshed = False
+        for attempt in range(MAX_RETRIES + 1):
+            request_headers = {'Authorization': f'Bearer {await self._token()}'}
+            if headers:
+                request_headers.update(headers)
+            async with self._sem:
+                async with self._session.request(method, url, params=params, json=body,
+                                                 data=data, headers=request_headers) as resp:
+                    status = resp.status
+                    payload = await resp.read()
+                    content_type = resp.headers.get('Content-Type', '')
+            if status < 300:
+                return content_type, payload
+            if status == 401 and not refreshed:
+                # Token revoked or expired early: force one refresh.
+                self.creds.token = None
+                refreshed = True
+                continue
+            if status in retry_statuses and attempt < MAX_RETRIES:
+                await asyncio.sleep(min(32, 2 ** attempt) + random.random())
+                continue
+            raise ApiError(status, _error_message(payload))
+        raise ApiError(status, _error_message(payload))
+
+    async def request(self, method, url, params=None, body=None, data=None, headers=None,
+                      idempotent=True):
+        """Send a request and decode the JSON response (None for empty bodies)."""
+        _, payload = await self.send(method, url, params=params, body=body, data=data,
+                                     headers=headers, idempotent=idempotent)
+        return json.loads(payload) if payload else None
+
+    async def batch(self, calls, batch_url=GMAIL_BATCH_URL, size=BATCH_SIZE, rate=None,
+                    idempotent=True):
+        """Run (method, url, params, body) calls as multipart/mixed batch requests.
+
+        Returns one result per call, in order: the decoded JSON, or an
+        ApiError for a call that failed. Each batch counts as one HTTP round
+        trip, but every call in it still costs its own quota. Calls refused
+        with a retryable status go out again in a later batch, with backoff.
+
+        Batches go out concurrently, unless rate (calls per second) is given:
+        then they are sent one at a time and paced by a token bucket, for
+        runs large enough to hit the per-user quota.
+
+        With idempotent=False (sends) only calls refused with 429 go out
+        again. A 5xx, or a call missing from the reply, comes back as an
+        ApiError, because it may already have taken effect.
+        """
+        retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY
+        results = [None] * len(calls)
+        pending = list(range(len(calls)))
+        bucket = TokenBucket(rate, size) if rate else None
+        for attempt in range(MAX_RETRIES + 1):
+            chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+            if bucket is None:
+                replies = await asyncio.gather(*(
+                    self._send_batch([calls[i] for i in chunk], batch_url, idempotent) for chunk in chunks))
+            else:
+                replies = []
+                for chunk in chunks:
+                    await bucket.take(len(chunk))
+                    replies.append(await self._send_batch([calls[i] for i in chunk], batch_url, idempotent))
+            retry = []
+            for chunk, reply in zip(chunks, replies):
+                for i, (status, payload) in zip(chunk, reply):
+                    if status < 300:
+                        results[i] = json.loads(payload) if payload.strip() else None
+                    elif status in retry_statuses and attempt < MAX_RETRIES:
+                        retry.append(i)
+                    else:
+                        results[i] = ApiError(status, _error_message(payload))
+            if not retry:
+                break
+            pending = retry
+            await asyncio.sleep(min(32, 2 ** attempt) + random.random())
+        return results
+
+    async def _send_batch(self, calls, batch_url, idempotent=True):
+        """POST one batch; returns [(status, body bytes)] in call order."""
+        boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for i, (method, url, params, body) in enumerate(calls):
+            path = url[len(API_ROOT):] + (f'?{urlencode(params)}' if params else '')
+            part = (f'--{boundary}\r\nContent-Type: application/http\r\n'
+                    f'Content-ID: <item{i}>\r\n\r\n{method} {path} HTTP/1.1\r\n')
+            if body is not None:
+                part += f'Content-Type: application/json\r\n\r\n{json.dumps(body)}'
+            parts.append(part + '\r\n')
+        data = (''.join(parts) + f'--{boundary}--\r\n').encode()
+        content_type, payload = await self.send(
+            'POST', batch_url, data=data, headers={'Content-Type': f'multipart/mixed; boundary={boundary}'},
+            idempotent=idempotent)
+        replies = _parse_batch(content_type, payload)
+        # A part missing from the reply is treated as a server error
+        return [replies.get(i, (500, b'no response in batch')) for i in range(len(calls))]
+
+    # --------------------------------------------------------
+    # Gmail
+    # --------------------------------------------------------
+
+    async def get_profile(self):
+        return await self.request('GET', f'{GMAIL_URL}/profile')
+
+    async def list_messages(self, q=None, max_results=None, label_ids=None, page_token=None):
+        """Return one page of users.messages.list."""
+        return await self.request('GET', f'{GMAIL_URL}/messages', params=_params(
+            q=q, maxResults=max_results, labelIds=label_ids, pageToken=page_token))
+
+    async def iter_message_ids(self, q=None, limit=None, label_ids=None, page_size=500):
+        """Yield message IDs page by page without materialising the full list."""
+        page_token = None
+        seen = 0
+        while True:
+            size = page_size if limit is None else min(page_size, limit - seen)
+            page = await self.list_messages(q=q, max_results=size, label_ids=label_ids,
+                                            page_token=page_token)
+            for msg in page.get('messages', []):
+                yield msg['id']
+                seen += 1
+                if limit is not None and seen >= limit:
+                    return
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    async def get_message(self, message_id, format='full', metadata_headers=None, fields=None):
+        return await self.request('GET', f'{GMAIL_URL}/messages/{quote(message_id)}', params=_params(
+            format=format, metadataHeaders=metadata_headers, fields=fields))
+
+    async def get_messages(self, message_ids, format='metadata', metadata_headers=None, fields=None):
+        """Fetch several messages concurrently, preserving input order."""
+        return await asyncio.gather(*(
+            self.get_message(mid, format=format, metadata_headers=metadata_headers, fields=fields)
+            for mid in message_ids
+        ))
+
+    async def iter_messages(self, message_ids, format='metadata', metadata_headers=None, fields=None):
+        """Fetch several messages concurrently, yielding each as it completes."""
+        tasks = [
+            asyncio.ensure_future(self.get_message(mid, format=format,
+                                                   metadata_headers=metadata_headers, fields=fields))
+            for mid in message_ids
+        ]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def batch_get_messages(self, message_ids, format='full', metadata_headers=None, fields=None,
+                                 rate=None):
+        """messages.get for many IDs through batch requests (ApiError per failure)."""
+        params = _params(format=format, metadataHeaders=metadata_headers, fields=fields)
+        return await self.batch([('GET', f'{GMAIL_URL}/messages/{quote(mid)}', params, None)
+                                 for mid in message_ids], rate=rate)
+
+    async def get_attachment(self, message_id, attachment_id):
+        return await self.request(
+            'GET', f'{GMAIL_URL}/messages/{quote(message_id)}/attachments/{quote(attachment_id)}')
+
+    async def list_labels(self):
+        return await self.request('GET', f'{GMAIL_URL}/labels')
+
+    async def send_message(self, raw):
+        return await self.request('POST', f'{GMAIL_URL}/messages/send', body={'raw': raw},
+                                  idempotent=False)
+
+    async def list_history(self, start_history_id, history_types=None, label_id=None,
+                           page_token=None, max_results=None):
+        """Return one page of users.history.list."""
+        return await self.request('GET', f'{GMAIL_URL}/history', params=_params(
+            startHistoryId=start_history_id, historyTypes=history_types, labelId=label_id,
+            pageToken=page_token, maxResults=max_results))
+
+    # --------------------------------------------------------
+    # Calendar
+    # --------------------------------------------------------
+
+    async def get_calendar(self, calendar_id='primary'):
+        return await self.request('GET', f'{CALENDAR_URL}/calendars/{quote(calendar_id)}')
+
+    async def list_events(self, calendar_id='primary', time_min=None, time_max=None, q=None,
+                          max_results=None, single_events=True, order_by='startTime',
+                          page_token=None):
+        """Return one page of events.list."""
+        return await self.request('GET', f'{CALENDAR_URL}/calendars/{quote(calendar_id)}/events',
+                                  params=_params(timeMin=time_min, timeMax=time_max, q=q,
+                                                 maxResults=max_results, singleEvents=single_events,
+                                                 orderBy=order_by if single_events else None,
+                                                 pageToken=page_token))
+
+    async def iter_events(self, calendar_id='primary', time_min=None, time_max=None, q=None,
+                          single_events=True):
+        """Yield every event in a range, following pagination."""
+        page_token = None
+        while True:
+            page = await self.list_events(calendar_id, time_min=time_min, time_max=time_max, q=q,
+                                          max_results=250, single_events=single_events,
+                                          page_token=page_token)
+            for event in page.get('items', []):
+                yield event
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    async def insert_event(self, event, calendar_id='primary'):
+        return await self.request('POST', f'{CALENDAR_URL}/calendars/{quote(calendar_id)}/events',
+                                  body=event, idempotent=False)
+
+    async def freebusy(self, time_min, time_max, calendar_ids=('primary',)):
+        return await self.request('POST', f'{CALENDAR_URL}/freeBusy', body={
+            'timeMin': time_min,
+            'timeMax': time_max,
+            'items': [{'id': cid} for cid in calendar_ids],
+        })
+
+
+def _split_head(data):
+    """(head, rest) of an HTTP-style block, split at the first blank line."""
+    pieces = re.split(rb'\r?\n\r?\n', data, maxsplit=1)
+    return pieces[0], pieces[1] if len(pieces) > 1 else b''
+
+
+def _parse_batch(content_type, payload):
+    """{call index: (status, body bytes)} from a multipart/mixed batch reply."""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        raise ApiError(502, f'batch reply is not multipart: {content_type}')
+    replies = {}
+    for chunk in payload.split(b'--' + match.group(1).encode()):
+        outer, inner = _split_head(chunk.strip(b'\r\n'))
+        index = re.search(rb'Content-ID:\s*<response-item(\d+)>', outer, re.IGNORECASE)
+        if not index:
+            continue
+        status_head, body = _split_head(inner)
+        try:
+            status = int(status_head.split(None, 2)[1])
+        except (IndexError, ValueError):
+            status = 500
+        replies[int(index.group(1))] = (status, body)
+    return replies
+
+
+def _error_message(body):
+    """Pull the human-readable message out of a Google error body."""
+    try:
+        return json.loads(body)['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return body.decode('utf-8', errors='replace')[:200]
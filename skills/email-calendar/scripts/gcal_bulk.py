@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Move, patch or delete many calendar events at once.
+
+Events are selected by time range (--from/--to) and optionally by a title
+match. The changes then go out as events.patch / events.delete calls
+packed 50 to a batch request, so hundreds of edits take a few round trips.
+--dry-run prints the plan and changes nothing.
+
+    gcal_bulk.py move   --from 2026-03-02 --to 2026-03-31 --match workshop --by +1h
+    gcal_bulk.py patch  --from 2026-03-02 --to 2026-03-09 --match standup --set location="Room 4"
+    gcal_bulk.py delete --from 2026-03-09 --to 2026-03-14 --dry-run
+
+By default each occurrence of a recurring event is changed on its own (it
+becomes an exception). --series selects the recurring events themselves
+instead, so moving or patching one changes every occurrence.
+
+Moves shift wall-clock time in the event's time zone (or the calendar's), so
+a 09:00 meeting moved by a week across a DST change still starts at 09:00.
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import quote
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+sys.path.insert(0, str(Path(__file__).parent))
+from auth_common import get_credentials, add_profile_args, handle_profile_args, CALENDAR_FULL
+from gapi_async import GoogleClient, ApiError, CALENDAR_BATCH_URL, CALENDAR_URL
+from gcal_create import parse_datetime
+from records import add_output_args, emit, errors_as_records
+
+# Calendar accepts at most 50 calls per batch request
+BATCH_SIZE = 50
+DELTA = re.compile(r'^([+-]?)(?:(\d+)w)?(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?$')
+
+
+def parse_delta(text):
+    """'+1h', '-30m', '2d', '1w2d', '-1h30m' as a timedelta."""
+    match = DELTA.match(text.strip())
+    if not match or not any(match.groups()[1:]):
+        raise ValueError(f"Could not parse offset: {text} (e.g. +1h, -30m, 2d, 1w)")
+    sign, weeks, days, hours, minutes = match.groups()
+    delta = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0))
+    return -delta if sign == '-' else delta
+
+
+def parse_fields(assignments):
+    """['location=Room 4', 'colorId=5'] as a patch body; values are JSON when they parse."""
+    body = {}
+    for assignment in assignments:
+        field, sep, value = assignment.partition('=')
+        if not sep or not field:
+            raise ValueError(f"Expected field=value, got: {assignment}")
+        try:
+            body[field] = json.loads(value)
+        except ValueError:
+            body[field] = value
+    return body
+
+
+def _rfc3339(text):
+    """A --from/--to value as an RFC 3339 timestamp in local time."""
+    return parse_datetime(text).astimezone().isoformat()
+
+
+async def select_events(client, calendar_id, time_min, time_max, match=None, series=False):
+    """Events in [time_min, time_max) whose title contains match (case-insensitive)."""
+    needle = match.lower() if match else None
+    events = []
+    async for event in client.iter_events(calendar_id, time_min=time_min, time_max=time_max,
+                                          q=match, single_events=not series):
+        if event.get('status') == 'cancelled':
+            continue
+        if series and 'recurrence' not in event:
+            continue
+        if needle and needle not in event.get('summary', '').lower():
+            continue
+        events.append(event)
+    return events
+
+
+def _zone(name):
+    try:
+        return ZoneInfo(name) if name else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _instant(when):
+    return datetime.fromisoformat(when['dateTime'].replace('Z', '+00:00'))
+
+
+def _shift(when, delta, time_zone=None):
+    """A start/end dict moved by delta, or None for an all-day time and a partial-day delta.
+
+    A timed value is shifted in local wall-clock time of its own timeZone,
+    else time_zone (the calendar's), and only by the raw offset if neither
+    is known.
+    """
+    if 'dateTime' in when:
+        start = _instant(when)
+        name = when.get('timeZone') or time_zone
+        zone = _zone(name)
+        if zone is None:
+            return dict(when, dateTime=(start + delta).isoformat())
+        local = start.astimezone(zone).replace(tzinfo=None) + delta
+        # Through UTC so a wall time skipped by the clock change lands on a real instant
+        moved = local.replace(tzinfo=zone).astimezone(timezone.utc).astimezone(zone)
+        return dict(when, dateTime=moved.isoformat(), timeZone=name)
+    if delta % timedelta(days=1):
+        return None
+    return dict(when, date=(date.fromisoformat(when['date']) + delta).isoformat())
+
+
+def plan_move(events, delta, time_zone=None):
+    """[(event, method, body, note)] shifting each event by delta.
+
+    time_zone is the calendar's, used for events that name none.
+    """
+    plan = []
+    for event in events:
+        start, end = _shift(event['start'], delta, time_zone), _shift(event['end'], delta, time_zone)
+        if start is None or end is None:
+            plan.append((event, None, None, 'skipped: all-day event, offset is not whole days'))
+            continue
+        if 'dateTime' in start and _instant(end) < _instant(start):
+            # The start fell into a skipped hour and moved past the end; keep the length
+            length = _instant(event['end']) - _instant(event['start'])
+            end = dict(end, dateTime=(_instant(start) + length).isoformat())
+        plan.append((event, 'PATCH', {'start': start, 'end': end}, None))
+    return plan
+
+
+def plan_patch(events, body, time_zone=None):
+    return [(event, 'PATCH', body, None) for event in events]
+
+
+def plan_delete(events, time_zone=None):
+    return [(event, 'DELETE', None, None) for event in events]
+
+
+async def apply_plan(client, calendar_id, plan, send_updates='none'):
+    """Run the plan's calls in batch requests; returns one result per plan entry.
+
+    A result is the updated event, None (deleted or skipped) or an ApiError.
+    Deleting an event that is already gone (410) counts as done.
+    """
+    todo = [i for i, (_, method, _, _) in enumerate(plan) if method]
+    calls = [(plan[i][1], f"{CALENDAR_URL}/calendars/{quote(calendar_id)}/events/{quote(plan[i][0]['id'])}",
+              [('sendUpdates', send_updates)], plan[i][2]) for i in todo]
+    replies = await client.batch(calls, batch_url=CALENDAR_BATCH_URL, size=BATCH_SIZE)
+    results = [None] * len(plan)
+    for i, reply in zip(todo, replies):
+        if isinstance(reply, ApiError) and reply.status == 410 and plan[i][1] == 'DELETE':
+            reply = None
+        results[i] = reply
+    return results
+
+
+def change_record(event, method, body, note, result, dry_run, profile=None, calendar=None):
+    """calendar_change record for one planned or applied change."""
+    new = body or {}
+    start = new.get('start', event.get('start', {}))
+    end = new.get('end', event.get('end', {}))
+    if note:
+        status = 'skipped'
+    elif dry_run:
+        status = 'planned'
+    elif isinstance(result, Exception):
+        status = 'error'
+    else:
+        status = 'done'
+    return {
+        'type': 'calendar_change',
+        'profile': profile,
+        'calendar': calendar,
+        'action': {'PATCH': 'patch', 'DELETE': 'delete'}.get(method),
+        'id': event['id'],
+        'summary': event.get('summary'),
+        'start': start.get('dateTime', start.get('date')),
+        'end': end.get('dateTime', end.get('date')),
+        'fields': sorted(new),
+        'status': status,
+        'error': note or (str(result) if isinstance(result, Exception) else None),
+    }
+
+
+def print_changes(records, dry_run):
+    """Human-readable plan or outcome."""
+    marks = {'planned': '▶', 'done': '✅', 'error': '❌', 'skipped': '⚠️ '}
+    for r in records:
+        change = 'delete' if r['action'] == 'delete' else f"{r['start']} → {r['end']}"
+        if r['action'] == 'patch' and r['fields'] != ['end', 'start']:
+            change = 'set ' + ', '.join(r['fields'])
+        print(f"{marks[r['status']]} {r['summary'] or '(No title)'}  [{change}]")
+        if r['error']:
+            print(f"    {r['error']}")
+    counts = {s: sum(1 for r in records if r['status'] == s) for s in marks}
+    if dry_run:
+        print(f"\n{counts['planned']} changes planned, {counts['skipped']} skipped (dry run, nothing sent)")
+    else:
+        print(f"\n{counts['done']} done, {counts['error']} failed, {counts['skipped']} skipped")
+
+
+async def bulk_edit(client, calendar_id, time_min, time_max, make_plan, match=None, series=False,
+                    dry_run=False, send_updates='none', profile=None):
+    """Select, plan and (unless dry_run) apply; returns calendar_change records.
+
+    make_plan(events, time_zone) gets the calendar's time zone as well.
+    """
+    events = await select_events(client, calendar_id, time_min, time_max, match, series)
+    time_zone = (await client.get_calendar(calendar_id)).get('timeZone') if events else None
+    plan = make_plan(events, time_zone)
+    results = [None] * len(plan) if dry_run else await apply_plan(client, calendar_id, plan, send_updates)
+    return [change_record(event, method, body, note, result, dry_run, profile, calendar_id)
+            for (event, method, body, note), result in zip(plan, results)]
+
+
+async def _run(args, time_min, time_max, make_plan):
+    creds = get_credentials(args.profile, CALENDAR_FULL)
+    async with GoogleClient(creds, label=args.profile) as client:
+        return await bulk_edit(client, args.calendar, time_min, time_max, make_plan, match=args.match,
+                               series=args.series, dry_run=args.dry_run,
+                               send_updates='all' if args.notify else 'none', profile=args.profile)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk move, patch or delete calendar events')
+    parser.add_argument('action', choices=['move', 'patch', 'delete'])
+    add_profile_args(parser)
+    parser.add_argument('--from', dest='start', required=True, help='Range start (YYYY-MM-DD [HH:MM])')
+    parser.add_argument('--to', dest='end', required=True, help='Range end, exclusive')
+    parser.add_argument('--match', help='Only events whose title contains this')
+    parser.add_argument('--series', action='store_true', help='Change whole recurring series, not occurrences')
+    parser.add_argument('--by', help='move: offset such as +1h, -30m, 2d, 1w')
+    parser.add_argument('--set', action='append', default=[], metavar='FIELD=VALUE',
+                        help='patch: field to set, repeatable (JSON values allowed)')
+    parser.add_argument('--calendar', default='primary', help='Calendar ID')
+    parser.add_argument('--notify', action='store_true', help='Email attendees about the changes')
+    parser.add_argument('--dry-run', action='store_true', help='Show what would change, send nothing')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    handle_profile_args(args)
+    try:
+        if args.action == 'move':
+            if not args.by:
+                parser.error('move needs --by')
+            delta = parse_delta(args.by)
+            make_plan = lambda events, time_zone: plan_move(events, delta, time_zone)
+        elif args.action == 'patch':
+            if not args.set:
+                parser.error('patch needs at least one --set')
+            body = parse_fields(args.set)
+            make_plan = lambda events, time_zone: plan_patch(events, body, time_zone)
+        else:
+            make_plan = plan_delete
+        time_min, time_max = _rfc3339(args.start), _rfc3339(args.end)
+    except ValueError as e:
+        parser.error(str(e))
+    with errors_as_records(args.ndjson, args.profile):
+        records = asyncio.run(_run(args, time_min, time_max, make_plan))
+
+        if args.ndjson:
+            for record in records:
+                emit(record)
+        elif not records:
+            print("No matching events.")
+        else:
+            print_changes(records, args.dry_run)
+        if any(r['status'] == 'error' for r in records):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 from auth_common import get_credentials, add_profile_args, handle_profile_args, CALENDAR_FULL
+from records import add_output_args, emit, event_record, errors_as_records
 
 try:
     from googleapiclient.discovery import build
@@ -34,7 +35,7 @@ def parse_datetime(dt_str):
 
 def create_event(profile='default', title=None, start=None, end=None, 
                  location=None, description=None, attendees=None, 
-                 calendar_id='primary', timezone='America/Denver'):
+                 calendar_id='primary', timezone='America/Denver', output_ndjson=False):
     """Create a calendar event."""
     creds = get_credentials(profile, CALENDAR_FULL)
     service = build('calendar', 'v3', credentials=creds)
@@ -57,6 +58,10 @@ def create_event(profile='default', title=None, start=None, end=None,
     
     result = service.events().insert(calendarId=calendar_id, body=event).execute()
     
+    if output_ndjson:
+        emit(event_record(result, profile, calendar_id))
+        return result
+    
     print(f"✅ Event created!")
     print(f"   Title: {title}")
     print(f"   Start: {start_dt.strftime('%Y-%m-%d %I:%M %p')}")
@@ -79,13 +84,15 @@ def main():
     parser.add_argument('--attendees', help='Emails (comma-sep)')
     parser.add_argument('--calendar', default='primary', help='Calendar ID')
     parser.add_argument('--timezone', default='America/Denver', help='Timezone')
+    add_output_args(parser)
     args = parser.parse_args()
     
     handle_profile_args(args)
-    create_event(profile=args.profile, title=args.title, start=args.start,
-                 end=args.end, location=args.location, description=args.description,
-                 attendees=args.attendees, calendar_id=args.calendar, 
-                 timezone=args.timezone)
+    with errors_as_records(args.ndjson, args.profile):
+        create_event(profile=args.profile, title=args.title, start=args.start,
+                     end=args.end, location=args.location, description=args.description,
+                     attendees=args.attendees, calendar_id=args.calendar, 
+                     timezone=args.timezone, output_ndjson=args.ndjson)
 
 
 if __name__ == '__main__':
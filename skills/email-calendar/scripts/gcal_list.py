@@ -2,39 +2,43 @@
 """List upcoming Google Calendar events."""
 
 import argparse
+import asyncio
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 from auth_common import get_credentials, add_profile_args, handle_profile_args, CALENDAR_READONLY
+from gapi_async import GoogleClient
+from records import add_output_args, emit, event_record, errors_as_records
 
-try:
-    from googleapiclient.discovery import build
-except ImportError:
-    print("ERROR: Run: pip install google-auth-oauthlib google-api-python-client")
-    sys.exit(1)
 
-
-def list_events(profile='default', days=7, calendar_id='primary', output_json=False):
-    """List upcoming calendar events."""
-    creds = get_credentials(profile, CALENDAR_READONLY)
-    service = build('calendar', 'v3', credentials=creds)
-    
+async def fetch_events(client, days=7, calendar_id='primary'):
+    """Fetch the next `days` of events from one calendar."""
     now = datetime.utcnow()
     time_min = now.isoformat() + 'Z'
     time_max = (now + timedelta(days=days)).isoformat() + 'Z'
     
-    events_result = service.events().list(
-        calendarId=calendar_id,
-        timeMin=time_min,
-        timeMax=time_max,
-        maxResults=50,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
+    events_result = await client.list_events(calendar_id, time_min=time_min, time_max=time_max,
+                                             max_results=50)
+    return events_result.get('items', [])
+
+
+async def _list(profile, days, calendar_id):
+    creds = get_credentials(profile, CALENDAR_READONLY)
+    async with GoogleClient(creds, label=profile) as client:
+        return await fetch_events(client, days=days, calendar_id=calendar_id)
+
+
+def list_events(profile='default', days=7, calendar_id='primary', output_json=False,
+                output_ndjson=False):
+    """List upcoming calendar events."""
+    events = asyncio.run(_list(profile, days, calendar_id))
     
-    events = events_result.get('items', [])
+    if output_ndjson:
+        for event in events:
+            emit(event_record(event, profile, calendar_id))
+        return events
     
     if output_json:
         import json
@@ -90,11 +94,14 @@ def main():
     parser.add_argument('--days', type=int, default=7, help='Days ahead')
     parser.add_argument('--calendar', default='primary', help='Calendar ID')
     parser.add_argument('--json', action='store_true', help='JSON output')
+    add_output_args(parser)
     args = parser.parse_args()
     
     handle_profile_args(args)
-    list_events(profile=args.profile, days=args.days, 
-                calendar_id=args.calendar, output_json=args.json)
+    with errors_as_records(args.ndjson, args.profile):
+        list_events(profile=args.profile, days=args.days, 
+                    calendar_id=args.calendar, output_json=args.json,
+                    output_ndjson=args.ndjson)
 
 
 if __name__ == '__main__':
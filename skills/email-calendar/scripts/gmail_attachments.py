@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""Download attachments from matching messages into a content-addressed store.
+
+Every MIME part with a filename is collected, however deeply it is nested
+(forwards, multipart/related, attached .eml files). Parts are fetched with
+users.messages.attachments.get, up to --concurrency at a time. Each one is
+decoded in chunks into a temp file while its SHA-256 is computed, then
+renamed to objects/<sha[:2]>/<sha>. Identical content is stored once however
+many messages carry it.
+
+Before downloading, a part is matched on (size, X-Attachment-Id). Gmail
+assigns that ID and keeps it through forwards and replies, so an attachment
+repeated across a thread is usually fetched once. Concurrent fetches of the
+same pair are coalesced. Parts without one (Content-IDs such as Outlook's
+image001.png@... repeat across unrelated mail) are always downloaded and
+deduplicated on their SHA-256.
+
+Layout of DEST:
+    objects/ab/abcdef...         content, one file per SHA-256
+    files/<date>_<id8>_<name>    hard links with readable names (a name taken
+                                 by other content gets _<sha8> added)
+    manifest.jsonl               one line per stored attachment
+    .attachments-done            message IDs fully processed
+
+A message's manifest lines and its ID are written only after its files are
+on disk, so an interrupted run resumes where it stopped.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from auth_common import get_credentials, add_profile_args, handle_profile_args, GMAIL_READONLY
+from gapi_async import GoogleClient, ApiError, header_map
+from gmail_export import load_checkpoint
+from records import add_output_args, emit, errors_as_records
+
+MANIFEST_FILE = 'manifest.jsonl'
+CHECKPOINT_FILE = '.attachments-done'
+BATCH_SIZE = 50
+# base64 characters decoded per write (a multiple of 4)
+CHUNK = 4 * 256 * 1024
+UNSAFE_NAME = re.compile(r'[^\w.\- ]+')
+
+
+def _part_headers(part):
+    return {h['name'].lower(): h['value'] for h in part.get('headers', [])}
+
+
+def attachment_parts(payload, include_inline=False):
+    """Yield every attachment part in a message payload, depth first.
+
+    Inline parts (signature logos, embedded images) are skipped unless
+    include_inline is set.
+    """
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        stack.extend(reversed(part.get('parts', [])))
+        if not part.get('filename'):
+            continue
+        headers = _part_headers(part)
+        if not include_inline and headers.get('content-disposition', '').lower().startswith('inline'):
+            continue
+        yield part
+
+
+def part_summary(part):
+    """{filename, mimeType, size} as gmail_read and records.py expect."""
+    return {'filename': part['filename'], 'mimeType': part.get('mimeType'),
+            'size': part.get('body', {}).get('size')}
+
+
+def dedupe_key(part):
+    """(size, X-Attachment-Id) when the part has Gmail's ID, else None."""
+    ident = _part_headers(part).get('x-attachment-id')
+    size = part.get('body', {}).get('size')
+    return (size, ident.strip('<> ')) if ident and size else None
+
+
+def safe_name(name):
+    name = UNSAFE_NAME.sub('_', name).strip(' .') or 'attachment'
+    return name[:120]
+
+
+class AttachmentStore:
+    """objects/ by SHA-256, files/ links, plus the manifest and checkpoint."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        for sub in ('objects/tmp', 'files'):
+            (self.path / sub).mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.path / MANIFEST_FILE
+        self.checkpoint_path = self.path / CHECKPOINT_FILE
+        # Partial downloads from an interrupted run (one run per store at a time)
+        for stale in (self.path / 'objects' / 'tmp').iterdir():
+            stale.unlink()
+        self.known = {}  # dedupe key -> sha256, from earlier runs and this one
+        for record in self.records():
+            if record.get('key'):
+                self.known[tuple(record['key'])] = record['sha256']
+
+    def records(self):
+        """Manifest entries (a torn last line is ignored)."""
+        try:
+            with open(self.manifest_path) as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def object_path(self, sha):
+        return self.path / 'objects' / sha[:2] / sha
+
+    def put_b64(self, data):
+        """Decode base64url data into the store; return (sha256, size, was_new)."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.path / 'objects' / 'tmp', prefix='part-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for start in range(0, len(data), CHUNK):
+                    chunk = data[start:start + CHUNK]
+                    if start + CHUNK >= len(data):
+                        chunk += '=' * (-len(chunk) % 4)
+                    raw = base64.urlsafe_b64decode(chunk)
+                    digest.update(raw)
+                    size += len(raw)
+                    f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            sha = digest.hexdigest()
+            target = self.object_path(sha)
+            if target.exists():
+                os.unlink(tmp)
+                return sha, size, False
+            target.parent.mkdir(exist_ok=True)
+            os.rename(tmp, target)
+            return sha, size, True
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def link(self, sha, name):
+        """Hard-link an object under files/; returns the link's relative path.
+
+        If name already links to different content (two parts called
+        image.png in one message), the link is named <stem>_<sha8><ext>.
+        """
+        target = self.object_path(sha)
+        link = self.path / 'files' / name
+        if link.exists() and not os.path.samefile(link, target):
+            link = link.with_name(f'{link.stem}_{sha[:8]}{link.suffix}')
+        if not link.exists():
+            try:
+                os.link(target, link)
+            except OSError:
+                return None
+        return str(link.relative_to(self.path))
+
+    def commit(self, message_id, records):
+        """Record a finished message: manifest lines first, then its ID."""
+        with open(self.manifest_path, 'a') as f:
+            f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.checkpoint_path, 'a') as f:
+            f.write(f'{message_id}\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class Downloader:
+    """Fetch attachment parts into a store, deduplicating by key and content."""
+
+    def __init__(self, client, store, include_inline=False, mime_prefixes=None):
+        self.client = client
+        self.store = store
+        self.include_inline = include_inline
+        self.mime_prefixes = tuple(mime_prefixes or ())
+        self.in_flight = {}
+        self.stats = {'messages': 0, 'attachments': 0, 'downloaded': 0, 'reused': 0,
+                      'duplicates': 0, 'bytes': 0}
+
+    async def _fetch(self, message_id, part):
+        body = part.get('body', {})
+        if body.get('attachmentId'):
+            data = (await self.client.get_attachment(message_id, body['attachmentId']))['data']
+        else:
+            data = body.get('data', '')  # small parts come inline
+        sha, size, new = await asyncio.to_thread(self.store.put_b64, data)
+        self.stats['downloaded'] += 1
+        self.stats['bytes'] += size
+        if not new:
+            self.stats['duplicates'] += 1
+        return sha
+
+    async def fetch_part(self, message_id, part):
+        """Return the part's SHA-256, downloading only if it is not known yet."""
+        key = dedupe_key(part)
+        if key is not None:
+            if key in self.store.known:
+                self.stats['reused'] += 1
+                return self.store.known[key]
+            if key in self.in_flight:
+                self.stats['reused'] += 1
+                return await asyncio.shield(self.in_flight[key])
+            future = asyncio.ensure_future(self._fetch(message_id, part))
+            self.in_flight[key] = future
+            try:
+                sha = await asyncio.shield(future)
+            finally:
+                self.in_flight.pop(key, None)
+            self.store.known[key] = sha
+            return sha
+        return await self._fetch(message_id, part)
+
+    async def process(self, message_id):
+        """Fetch one message's attachments; return its manifest records."""
+        try:
+            message = await self.client.get_message(message_id, format='full')
+        except ApiError as e:
+            if e.status == 404:
+                return message_id, []
+            raise
+        parts = [p for p in attachment_parts(message.get('payload', {}), self.include_inline)
+                 if not self.mime_prefixes or (p.get('mimeType') or '').startswith(self.mime_prefixes)]
+        shas = await asyncio.gather(*(self.fetch_part(message_id, p) for p in parts))
+
+        headers = header_map(message)
+        received = datetime.fromtimestamp(int(message.get('internalDate', 0)) / 1000, tz=timezone.utc)
+        records = []
+        for part, sha in zip(parts, shas):
+            name = f"{received:%Y-%m-%d}_{message_id[:8]}_{safe_name(part['filename'])}"
+            records.append({
+                'type': 'attachment',
+                'message_id': message_id,
+                'thread_id': message.get('threadId'),
+                'part_id': part.get('partId'),
+                'filename': part['filename'],
+                'mime_type': part.get('mimeType'),
+                'size': part.get('body', {}).get('size'),
+                'sha256': sha,
+                'path': self.store.link(sha, name),
+                'key': dedupe_key(part),
+                'from': headers.get('From'),
+                'subject': headers.get('Subject'),
+                'received': received.isoformat(),
+            })
+        self.stats['messages'] += 1
+        self.stats['attachments'] += len(records)
+        return message_id, records
+
+
+async def download_attachments(client, store, query=None, limit=None, include_inline=False,
+                               mime_prefixes=None, batch_size=BATCH_SIZE, on_record=None,
+                               progress=None):
+    """Store attachments of every message matching query; return the stats dict.
+
+    limit caps the messages processed in this run; IDs already in the
+    checkpoint do not count toward it.
+    """
+    done = load_checkpoint(store.checkpoint_path)
+    downloader = Downloader(client, store, include_inline, mime_prefixes)
+    skipped = processed = 0
+    q = f'has:attachment {query}' if query else 'has:attachment'
+
+    async def flush(batch):
+        nonlocal processed
+        processed += len(batch)
+        for fut in asyncio.as_completed([downloader.process(mid) for mid in batch]):
+            message_id, records = await fut
+            store.commit(message_id, records)
+            for record in records:
+                if on_record:
+                    on_record(record)
+        if progress:
+            progress(downloader.stats, skipped)
+
+    batch = []
+    async for mid in client.iter_message_ids(q=q):
+        if mid in done:
+            skipped += 1
+            continue
+        batch.append(mid)
+        if len(batch) >= batch_size or (limit is not None and processed + len(batch) >= limit):
+            await flush(batch)
+            batch = []
+            if limit is not None and processed >= limit:
+                break
+    if batch:
+        await flush(batch)
+    return dict(downloader.stats, skipped=skipped)
+
+
+async def _run(profile, dest, query, limit, concurrency, include_inline, mime, output_ndjson):
+    creds = get_credentials(profile, GMAIL_READONLY)
+    store = AttachmentStore(dest)
+
+    def on_record(record):
+        if output_ndjson:
+            emit(dict(record, profile=profile))
+
+    def progress(stats, skipped):
+        if not output_ndjson:
+            print(f"\r   {stats['messages']} messages, {stats['attachments']} attachments, "
+                  f"{stats['downloaded']} downloaded, {skipped} skipped", end='', file=sys.stderr, flush=True)
+
+    async with GoogleClient(creds, concurrency=concurrency, label=profile) as client:
+        return await download_attachments(client, store, query=query, limit=limit,
+                                          include_inline=include_inline, mime_prefixes=mime,
+                                          on_record=on_record, progress=progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download Gmail attachments (deduplicated, resumable)')
+    add_profile_args(parser)
+    parser.add_argument('--dest', required=True, help='Store directory')
+    parser.add_argument('--query', '-q', help='Gmail search (has:attachment is implied)')
+    parser.add_argument('--limit', type=int, help='Stop after processing this many new messages')
+    parser.add_argument('--mime', action='append', help='Only parts whose type starts with this, repeatable')
+    parser.add_argument('--include-inline', action='store_true', help='Also keep inline parts (logos, images)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel fetches')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    handle_profile_args(args)
+    with errors_as_records(args.ndjson, args.profile):
+        stats = asyncio.run(_run(args.profile, args.dest, args.query, args.limit, args.concurrency,
+                                 args.include_inline, args.mime, args.ndjson))
+        if args.ndjson:
+            emit({'type': 'attachments_done', 'profile': args.profile, 'dest': args.dest, **stats})
+        else:
+            print(f"\n✅ {stats['attachments']} attachments from {stats['messages']} messages in {args.dest} "
+                  f"({stats['downloaded']} downloaded, {stats['reused']} reused, "
+                  f"{stats['duplicates']} duplicate content, {stats['skipped']} messages already done)")
+
+
+if __name__ == '__main__':
+    main()
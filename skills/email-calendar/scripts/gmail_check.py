@@ -2,83 +2,201 @@
 """Check Gmail inbox for recent messages."""
 
 import argparse
+import asyncio
+import functools
+import heapq
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
-from auth_common import get_credentials, add_profile_args, handle_profile_args, GMAIL_READONLY
+from auth_common import (
+    get_credentials, add_profile_args, handle_profile_args, get_profile_dir, resolve_profiles,
+    ALL_PROFILES, GMAIL_READONLY
+)
+from body_cache import CACHE_FILE
+from gapi_async import GoogleClient, METADATA_HEADERS
+from gmail_read import prefetch_detached
+from records import add_output_args, emit, error_record, message_record, errors_as_records
 
-try:
-    from googleapiclient.discovery import build
-except ImportError:
-    print("ERROR: Run: pip install google-auth-oauthlib google-api-python-client")
-    sys.exit(1)
 
+def json_summary(email):
+    """The --json shape gmail_check.py has always printed, from a message record."""
+    return {
+        'id': email['id'],
+        'from': 'Unknown' if email['from'] is None else email['from'],
+        'subject': '(no subject)' if email['subject'] is None else email['subject'],
+        'date': 'Unknown' if email['date'] is None else email['date'],
+        'snippet': email['snippet'][:100],
+        'unread': email['unread'],
+    }
 
-def check_inbox(profile='default', count=10, unread_only=False, output_json=False):
-    """Fetch recent emails from inbox."""
-    creds = get_credentials(profile, GMAIL_READONLY)
-    service = build('gmail', 'v1', credentials=creds)
-    
+
+def by_received(email):
+    """Sort key on received; records without an internalDate sort last."""
+    return email['received'] or ''
+
+
+async def iter_inbox(client, count=10, unread_only=False):
+    """Yield message records for the newest inbox messages as each fetch completes."""
     query = 'in:inbox'
     if unread_only:
         query += ' is:unread'
-    
-    results = service.users().messages().list(
-        userId='me', q=query, maxResults=count
-    ).execute()
-    
-    messages = results.get('messages', [])
-    
-    if not messages:
-        print("No messages found.")
+
+    results = await client.list_messages(q=query, max_results=count)
+    ids = [m['id'] for m in results.get('messages', [])]
+    async for detail in client.iter_messages(ids, format='metadata',
+                                             metadata_headers=METADATA_HEADERS):
+        yield message_record(detail, client.label)
+
+
+async def fetch_inbox(client, count=10, unread_only=False):
+    """Return the newest inbox messages, newest first by received date."""
+    emails = [e async for e in iter_inbox(client, count=count, unread_only=unread_only)]
+    emails.sort(key=by_received, reverse=True)
+    return emails
+
+
+async def _run_profile(profile, interactive, consume):
+    creds = await asyncio.to_thread(get_credentials, profile, GMAIL_READONLY, interactive)
+    async with GoogleClient(creds, label=profile) as client:
+        return await consume(client)
+
+
+async def _fan_out(profiles, consume):
+    """Run `consume(client)` for every profile concurrently.
+
+    Returns (results, errors) with errors as error records; only a single
+    named profile may fall back to the browser OAuth flow.
+    """
+    interactive = len(profiles) == 1
+    outcomes = await asyncio.gather(
+        *(_run_profile(p, interactive, consume) for p in profiles),
+        return_exceptions=True,
+    )
+    results, errors = [], []
+    for profile, outcome in zip(profiles, outcomes):
+        if isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome
+            errors.append(error_record(outcome, profile))
+        else:
+            results.append(outcome)
+    return results, errors
+
+
+async def check_profiles(profiles, count=10, unread_only=False):
+    """Check several profiles concurrently.
+
+    Returns (emails, errors): emails merged newest-first by received date,
+    errors as records for accounts that could not be checked.
+    """
+    per_profile, errors = await _fan_out(
+        profiles, lambda client: fetch_inbox(client, count=count, unread_only=unread_only))
+    emails = list(heapq.merge(*per_profile, key=by_received, reverse=True))
+    return emails, errors
+
+
+async def stream_profiles(profiles, count=10, unread_only=False, seen=None):
+    """Emit message records from every profile as they arrive; return error records.
+
+    Emitted records are also appended to seen, if given.
+    """
+    async def consume(client):
+        async for email in iter_inbox(client, count=count, unread_only=unread_only):
+            emit(email)
+            if seen is not None:
+                seen.append(email)
+
+    _, errors = await _fan_out(profiles, consume)
+    for err in errors:
+        emit(err)
+    return errors
+
+
+def prefetch(emails, top):
+    """Warm the body caches with the newest `top` listed messages, in the background."""
+    by_profile = {}
+    for email in sorted(emails, key=by_received, reverse=True)[:top]:
+        by_profile.setdefault(email['profile'], []).append(email['id'])
+    prefetch_detached([
+        (functools.partial(get_credentials, p, GMAIL_READONLY, False), get_profile_dir(p) / CACHE_FILE, ids)
+        for p, ids in by_profile.items()
+    ])
+
+
+def check_inbox(profile='default', count=10, unread_only=False, output_json=False,
+                output_ndjson=False, prefetch_top=0):
+    """Fetch recent emails from inbox (profile 'all' checks every account).
+
+    With prefetch_top, the bodies of that many of the newest listed messages
+    are fetched into the body cache after the listing is printed.
+    """
+    profiles = resolve_profiles(profile)
+    if not profiles:
+        if output_ndjson:
+            emit(error_record('No profiles configured.'))
+        else:
+            print("No profiles configured.")
         return []
-    
-    emails = []
-    for msg in messages:
-        detail = service.users().messages().get(
-            userId='me', id=msg['id'], format='metadata',
-            metadataHeaders=['From', 'Subject', 'Date']
-        ).execute()
-        
-        headers = {h['name']: h['value'] for h in detail.get('payload', {}).get('headers', [])}
-        
-        emails.append({
-            'id': msg['id'],
-            'from': headers.get('From', 'Unknown'),
-            'subject': headers.get('Subject', '(no subject)'),
-            'date': headers.get('Date', 'Unknown'),
-            'snippet': detail.get('snippet', '')[:100],
-            'unread': 'UNREAD' in detail.get('labelIds', [])
-        })
-    
-    if output_json:
+
+    if output_ndjson:
+        emails = []
+        errors = asyncio.run(stream_profiles(profiles, count, unread_only, emails))
+        if errors and len(errors) == len(profiles):
+            sys.exit(1)
+        if prefetch_top:
+            prefetch(emails, prefetch_top)
+        return None
+
+    multi = profile == ALL_PROFILES
+    emails, errors = asyncio.run(check_profiles(profiles, count, unread_only))
+
+    if output_json and multi:
+        import json
+        messages = [dict(json_summary(e), profile=e['profile']) for e in emails]
+        print(json.dumps({'messages': messages, 'errors': errors}, indent=2))
+    elif not emails and not errors:
+        print("No messages found.")
+    elif output_json:
         import json
-        print(json.dumps(emails, indent=2))
+        print(json.dumps([json_summary(e) for e in emails], indent=2))
     else:
         for email in emails:
             unread_marker = '📬' if email['unread'] else '📭'
-            print(f"{unread_marker} {email['date']}")
-            print(f"   From: {email['from']}")
-            print(f"   Subject: {email['subject']}")
+            account = f" [{email['profile']}]" if multi else ''
+            print(f"{unread_marker} {email['date'] or 'Unknown'}{account}")
+            print(f"   From: {email['from'] or 'Unknown'}")
+            print(f"   Subject: {email['subject'] or '(no subject)'}")
             print(f"   ID: {email['id']}")
-            print(f"   {email['snippet']}...")
+            print(f"   {email['snippet'][:100]}...")
             print()
-    
+
+    for err in errors:
+        print(f"⚠️  {err['profile']}: {err['error']}", file=sys.stderr)
+    if errors and len(errors) == len(profiles):
+        sys.exit(1)
+
+    if prefetch_top:
+        prefetch(emails, prefetch_top)
     return emails
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Check Gmail inbox')
+    parser = argparse.ArgumentParser(description='Check Gmail inbox (--profile all merges every account)')
     add_profile_args(parser)
     parser.add_argument('--count', type=int, default=10, help='Number of messages')
     parser.add_argument('--unread-only', action='store_true', help='Only unread')
     parser.add_argument('--json', action='store_true', help='Output as JSON')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='N',
+                        help='Then cache the bodies of the newest N in the background')
+    add_output_args(parser)
     args = parser.parse_args()
-    
+
     handle_profile_args(args)
-    check_inbox(profile=args.profile, count=args.count, 
-                unread_only=args.unread_only, output_json=args.json)
+    with errors_as_records(args.ndjson, args.profile):
+        check_inbox(profile=args.profile, count=args.count,
+                    unread_only=args.unread_only, output_json=args.json,
+                    output_ndjson=args.ndjson, prefetch_top=args.prefetch)
 
 
 if __name__ == '__main__':
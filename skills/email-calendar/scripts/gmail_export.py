@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Export a mailbox (or a query) to Maildir or mbox, resumably.
+
+Message IDs are streamed page by page and fetched with format='raw' in
+parallel batches. The decoded RFC 822 bytes go straight to disk. Each
+exported ID is appended to a checkpoint log in the destination, and a rerun
+skips everything already listed there, so a long export can be interrupted
+and resumed.
+
+An mbox is a single file, so each checkpoint flush also records the mbox
+size it covers ('@<bytes>' after the flush's IDs). Reopening cuts the mbox
+back to that size, dropping any message a crash left half-written or
+unrecorded before it is exported again.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from auth_common import get_credentials, add_profile_args, handle_profile_args, GMAIL_READONLY
+from gapi_async import GoogleClient, ApiError, decode_b64url
+from records import add_output_args, emit, errors_as_records
+
+CHECKPOINT_FILE = '.export-done'
+BATCH_SIZE = 100
+
+
+class MaildirWriter:
+    """Write messages into a Maildir (tmp/ then rename into new/)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        for sub in ('tmp', 'new', 'cur'):
+            (self.path / sub).mkdir(parents=True, exist_ok=True)
+
+    @property
+    def checkpoint_path(self):
+        return self.path / CHECKPOINT_FILE
+
+    def exists(self, name):
+        """True if name is in new/, or in cur/ (where readers append ':2,<flags>')."""
+        return ((self.path / 'new' / name).exists() or (self.path / 'cur' / name).exists()
+                or any((self.path / 'cur').glob(f'{name}:*')))
+
+    def write(self, message_id, data):
+        # Named by Gmail ID alone, so a message that reached new/ before a
+        # crash kept it out of the checkpoint is not written twice on resume
+        name = f'{message_id}.gmail'
+        if self.exists(name):
+            return
+        tmp = self.path / 'tmp' / name
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path / 'new' / name)
+
+    def sync(self):
+        pass
+
+    def marker(self):
+        return ''
+
+    def close(self):
+        pass
+
+
+class MboxWriter:
+    """Append messages to an mbox file with mboxrd From-quoting."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._recover()
+        self._file = open(self.path, 'ab')
+
+    @property
+    def checkpoint_path(self):
+        return self.path.with_name(self.path.name + CHECKPOINT_FILE)
+
+    def _recover(self):
+        """Cut the mbox and checkpoint back to the last committed flush.
+
+        A flush appends its IDs and then its '@<mbox size>' line in one
+        write, so IDs after the last complete '@' line were never committed.
+        A checkpoint without any '@' line predates offsets and is left as is.
+        """
+        size = self.path.stat().st_size if self.path.exists() else 0
+        try:
+            data = self.checkpoint_path.read_bytes()
+        except FileNotFoundError:
+            # Start from the current size, so a pre-existing mbox is kept
+            self.checkpoint_path.write_text(f'@{size}\n')
+            return
+        committed = offset = None
+        pos = 0
+        for line in data.splitlines(keepends=True):
+            pos += len(line)
+            if line.startswith(b'@') and line.endswith(b'\n'):
+                committed, offset = pos, int(line[1:])
+        if committed is None:
+            return
+        if committed < len(data):
+            os.truncate(self.checkpoint_path, committed)
+        if offset < size:
+            os.truncate(self.path, offset)
+
+    def write(self, message_id, data):
+        out = self._file
+        out.write(b'From MAILER-DAEMON ' + time.asctime(time.gmtime()).encode() + b'\n')
+        lines = data.replace(b'\r\n', b'\n').split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        for line in lines:
+            if line.lstrip(b'>').startswith(b'From '):
+                out.write(b'>')
+            out.write(line)
+            out.write(b'\n')
+        out.write(b'\n')
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def marker(self):
+        """Checkpoint line recording the mbox size after a flush."""
+        return f'@{self._file.tell()}\n'
+
+    def close(self):
+        self._file.close()
+
+
+def open_writer(fmt, dest):
+    return MaildirWriter(dest) if fmt == 'maildir' else MboxWriter(dest)
+
+
+def load_checkpoint(path):
+    """Return the set of already-exported IDs (ignores a torn last line)."""
+    try:
+        with open(path) as f:
+            return {line.strip() for line in f if line.endswith('\n') and not line.startswith('@')}
+    except FileNotFoundError:
+        return set()
+
+
+async def _fetch_raw(client, message_id):
+    """Return (id, raw bytes); bytes are None if the message vanished mid-export."""
+    try:
+        msg = await client.get_message(message_id, format='raw', fields='raw')
+    except ApiError as e:
+        if e.status == 404:
+            return message_id, None
+        raise
+    return message_id, decode_b64url(msg['raw'])
+
+
+async def export_mailbox(client, writer, query=None, limit=None, batch_size=BATCH_SIZE,
+                         progress=None):
+    """Export matching messages through `writer`; return (exported, skipped).
+
+    limit caps the messages written in this run; IDs already in the
+    checkpoint do not count toward it.
+    """
+    done = load_checkpoint(writer.checkpoint_path)
+    exported = skipped = 0
+
+    with open(writer.checkpoint_path, 'a') as checkpoint:
+        async def flush(batch):
+            nonlocal exported
+            written = []
+            try:
+                for fut in asyncio.as_completed([_fetch_raw(client, mid) for mid in batch]):
+                    mid, data = await fut
+                    if data is not None:
+                        writer.write(mid, data)
+                        exported += 1
+                    written.append(mid)
+            finally:
+                # Messages reach disk before their IDs reach the checkpoint,
+                # so a resume never skips something that was not written.
+                writer.sync()
+                checkpoint.write(''.join(f'{mid}\n' for mid in written) + writer.marker())
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+            if progress:
+                progress(exported, skipped)
+
+        batch = []
+        async for mid in client.iter_message_ids(q=query):
+            if mid in done:
+                skipped += 1
+                continue
+            batch.append(mid)
+            if len(batch) >= batch_size or (limit is not None and exported + len(batch) >= limit):
+                await flush(batch)
+                batch = []
+                if limit is not None and exported >= limit:
+                    break
+        if batch:
+            await flush(batch)
+
+    return exported, skipped
+
+
+async def _export(profile, fmt, dest, query, limit, concurrency, output_ndjson):
+    creds = get_credentials(profile, GMAIL_READONLY)
+    writer = open_writer(fmt, dest)
+
+    def progress(exported, skipped):
+        if output_ndjson:
+            emit({'type': 'export_progress', 'profile': profile,
+                  'exported': exported, 'skipped': skipped})
+        else:
+            print(f"\r   exported {exported}, skipped {skipped}", end='', file=sys.stderr, flush=True)
+
+    try:
+        async with GoogleClient(creds, concurrency=concurrency, label=profile) as client:
+            return await export_mailbox(client, writer, query=query, limit=limit,
+                                        progress=progress)
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export Gmail to Maildir or mbox (resumable)')
+    add_profile_args(parser)
+    parser.add_argument('--dest', required=True, help='Maildir directory or mbox file')
+    parser.add_argument('--format', choices=['maildir', 'mbox'], default='maildir')
+    parser.add_argument('--query', '-q', help='Only export messages matching this search')
+    parser.add_argument('--limit', type=int, help='Stop after writing this many new messages')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel fetches')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    handle_profile_args(args)
+    with errors_as_records(args.ndjson, args.profile):
+        exported, skipped = asyncio.run(_export(args.profile, args.format, args.dest, args.query,
+                                                args.limit, args.concurrency, args.ndjson))
+        if args.ndjson:
+            emit({'type': 'export_done', 'profile': args.profile, 'dest': args.dest,
+                  'exported': exported, 'skipped': skipped})
+        else:
+            print(f"\n✅ Exported {exported} messages to {args.dest} ({skipped} already done)")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,19 +2,20 @@
 """Read a specific Gmail message by ID."""
 
 import argparse
+import asyncio
 import base64
+import os
 import re
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 from auth_common import get_credentials, add_profile_args, handle_profile_args, GMAIL_READONLY
-
-try:
-    from googleapiclient.discovery import build
-except ImportError:
-    print("ERROR: Run: pip install google-auth-oauthlib google-api-python-client")
-    sys.exit(1)
+from background import detach
+from body_cache import open_cache, profile_cache
+from gapi_async import GoogleClient, ApiError, header_map
+from gmail_attachments import attachment_parts, part_summary
+from records import add_output_args, emit, message_body_record, errors_as_records
 
 
 def get_body(payload):
@@ -40,16 +41,119 @@ def get_body(payload):
     return body
 
 
-def read_message(profile='default', message_id=None):
-    """Read a specific email message."""
+async def _fetch(profile, message_id, cache=None):
     creds = get_credentials(profile, GMAIL_READONLY)
-    service = build('gmail', 'v1', credentials=creds)
+    async with GoogleClient(creds, label=profile) as client:
+        return await fetch_entry(client, message_id, cache)
+
+
+def strip_html(body):
+    """Reduce an HTML body to plain text; plain bodies pass through."""
+    if '<html' in body.lower() or '<div' in body.lower():
+        body = re.sub(r'<style[^>]*>.*?</style>', '', body, flags=re.DOTALL | re.IGNORECASE)
+        body = re.sub(r'<script[^>]*>.*?</script>', '', body, flags=re.DOTALL | re.IGNORECASE)
+        body = re.sub(r'<[^>]+>', ' ', body)
+        body = re.sub(r'\s+', ' ', body).strip()
+    return body
+
+
+def get_attachments(payload):
+    """List attachment parts at any depth."""
+    return [part_summary(p) for p in attachment_parts(payload)]
+
+
+def message_entry(message):
+    """Decoded body, stripped text and attachment manifest of a full message."""
+    payload = message.get('payload', {})
+    body = get_body(payload)
+    return {'message': message, 'body': body, 'text': strip_html(body),
+            'attachments': get_attachments(payload)}
+
+
+async def fetch_entry(client, message_id, cache=None):
+    """Fetch and decode one message, storing it in cache (a body_cache.BodyCache).
+
+    The cache's history sync runs alongside the fetch. A message that sync
+    saw change is not stored, since the fetch may predate the change.
+    """
+    if cache is None:
+        return message_entry(await client.get_message(message_id, format='full'))
+    if cache.history_id is None:
+        await cache.sync(client)
+    message, touched = await asyncio.gather(client.get_message(message_id, format='full'),
+                                            cache.sync(client))
+    entry = message_entry(message)
+    if touched is not None and message['id'] not in touched:
+        cache.put(entry)
+    return entry
+
+
+async def prefetch_bodies(client, message_ids, cache):
+    """Batch-fetch the uncached messages among message_ids into cache.
+
+    Returns how many were stored. Like fetch_entry, anything the concurrent
+    history sync saw change is left out.
+    """
+    wanted = cache.missing(list(dict.fromkeys(message_ids)))
+    if not wanted:
+        return 0
+    if cache.history_id is None:
+        await cache.sync(client)
+    messages, touched = await asyncio.gather(client.batch_get_messages(wanted), cache.sync(client))
+    if touched is None:
+        return 0
+    stored = 0
+    for message in messages:
+        if isinstance(message, ApiError) or message['id'] in touched:
+            continue
+        cache.put(message_entry(message))
+        stored += 1
+    return stored
+
+
+def prefetch_detached(jobs):
+    """Warm body caches in a background process, after the listing is out.
+
+    jobs are (get_creds, cache_path, message_ids): get_creds is called in the
+    child and must not prompt. stdout is flushed first, so the listing is
+    complete and a reader piping it sees EOF without waiting (see
+    background.detach). Failures are silent: the next read just fetches.
+    """
+    jobs = [job for job in jobs if job[2]]
+    if not jobs or not detach():
+        return
+
+    async def warm(get_creds, cache_path, message_ids):
+        cache = open_cache(cache_path)
+        if cache is None:
+            return
+        creds = await asyncio.to_thread(get_creds)
+        async with GoogleClient(creds) as client:
+            await prefetch_bodies(client, message_ids, cache)
+        cache.close()
+
+    async def run():
+        await asyncio.gather(*(warm(*job) for job in jobs), return_exceptions=True)
+
+    try:
+        asyncio.run(run())
+    finally:
+        os._exit(0)
+
+
+def read_message(profile='default', message_id=None, output_ndjson=False, use_cache=True):
+    """Read a specific email message, from the body cache when possible."""
+    cache = profile_cache(profile) if use_cache else None
+    entry = cache.get(message_id) if cache else None
+    if entry is None:
+        entry = asyncio.run(_fetch(profile, message_id, cache))
+    message, body, attachments = entry['message'], entry['text'], entry['attachments']
     
-    message = service.users().messages().get(
-        userId='me', id=message_id, format='full'
-    ).execute()
+    if output_ndjson:
+        emit(message_body_record(message, body, attachments, profile))
+        return message
     
-    headers = {h['name']: h['value'] for h in message.get('payload', {}).get('headers', [])}
+    headers = header_map(message)
     
     print("=" * 60)
     print(f"From: {headers.get('From', 'Unknown')}")
@@ -58,27 +162,8 @@ def read_message(profile='default', message_id=None):
     print(f"Subject: {headers.get('Subject', '(no subject)')}")
     print("=" * 60)
     
-    body = get_body(message.get('payload', {}))
-    
-    # Strip HTML
-    if '<html' in body.lower() or '<div' in body.lower():
-        body = re.sub(r'<style[^>]*>.*?</style>', '', body, flags=re.DOTALL | re.IGNORECASE)
-        body = re.sub(r'<script[^>]*>.*?</script>', '', body, flags=re.DOTALL | re.IGNORECASE)
-        body = re.sub(r'<[^>]+>', ' ', body)
-        body = re.sub(r'\s+', ' ', body).strip()
-    
     print(f"\n{body}\n")
     
-    # Attachments
-    attachments = []
-    if 'parts' in message.get('payload', {}):
-        for part in message['payload']['parts']:
-            if part.get('filename'):
-                attachments.append({
-                    'filename': part['filename'],
-                    'mimeType': part.get('mimeType'),
-                })
-    
     if attachments:
         print("=" * 60)
         print("Attachments:")
@@ -88,16 +173,21 @@ def read_message(profile='default', message_id=None):
     print("=" * 60)
     print(f"Message ID: {message_id}")
     print(f"Thread ID: {message.get('threadId')}")
+    return message
 
 
 def main():
     parser = argparse.ArgumentParser(description='Read Gmail message')
     add_profile_args(parser)
     parser.add_argument('--id', required=True, help='Message ID')
+    parser.add_argument('--no-cache', action='store_true', help='Fetch from Gmail even if cached')
+    add_output_args(parser)
     args = parser.parse_args()
     
     handle_profile_args(args)
-    read_message(profile=args.profile, message_id=args.id)
+    with errors_as_records(args.ndjson, args.profile):
+        read_message(profile=args.profile, message_id=args.id, output_ndjson=args.ndjson,
+                     use_cache=not args.no_cache)
 
 
 if __name__ == '__main__':
@@ -2,29 +2,43 @@
 """Search Gmail messages."""
 
 import argparse
+import asyncio
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 from auth_common import get_credentials, add_profile_args, handle_profile_args, GMAIL_READONLY
+from gapi_async import GoogleClient, header_map, METADATA_HEADERS
+from records import add_output_args, emit, message_record, errors_as_records
 
-try:
-    from googleapiclient.discovery import build
-except ImportError:
-    print("ERROR: Run: pip install google-auth-oauthlib google-api-python-client")
-    sys.exit(1)
 
+async def _search(profile, query, max_results):
+    creds = get_credentials(profile, GMAIL_READONLY)
+    async with GoogleClient(creds, label=profile) as client:
+        results = await client.list_messages(q=query, max_results=max_results)
+        messages = results.get('messages', [])
+        details = await client.get_messages([m['id'] for m in messages], format='metadata',
+                                            metadata_headers=METADATA_HEADERS)
+    return messages, details
 
-def search_messages(profile='default', query=None, max_results=20):
-    """Search Gmail messages."""
+
+async def _stream(profile, query, max_results):
     creds = get_credentials(profile, GMAIL_READONLY)
-    service = build('gmail', 'v1', credentials=creds)
-    
-    results = service.users().messages().list(
-        userId='me', q=query, maxResults=max_results
-    ).execute()
-    
-    messages = results.get('messages', [])
+    async with GoogleClient(creds, label=profile) as client:
+        results = await client.list_messages(q=query, max_results=max_results)
+        messages = results.get('messages', [])
+        async for detail in client.iter_messages([m['id'] for m in messages], format='metadata',
+                                                 metadata_headers=METADATA_HEADERS):
+            emit(message_record(detail, profile))
+    return messages
+
+
+def search_messages(profile='default', query=None, max_results=20, output_ndjson=False):
+    """Search Gmail messages."""
+    if output_ndjson:
+        return asyncio.run(_stream(profile, query, max_results))
+
+    messages, details = asyncio.run(_search(profile, query, max_results))
     
     if not messages:
         print(f"No messages found for: {query}")
@@ -32,13 +46,8 @@ def search_messages(profile='default', query=None, max_results=20):
     
     print(f"🔍 Found {len(messages)} messages for: {query}\n")
     
-    for msg in messages:
-        detail = service.users().messages().get(
-            userId='me', id=msg['id'], format='metadata',
-            metadataHeaders=['From', 'Subject', 'Date']
-        ).execute()
-        
-        headers = {h['name']: h['value'] for h in detail.get('payload', {}).get('headers', [])}
+    for msg, detail in zip(messages, details):
+        headers = header_map(detail)
         unread = 'UNREAD' in detail.get('labelIds', [])
         marker = '📬' if unread else '📭'
         
@@ -56,10 +65,13 @@ def main():
     add_profile_args(parser)
     parser.add_argument('--query', '-q', required=True, help='Search query')
     parser.add_argument('--max', type=int, default=20, help='Max results')
+    add_output_args(parser)
     args = parser.parse_args()
     
     handle_profile_args(args)
-    search_messages(profile=args.profile, query=args.query, max_results=args.max)
+    with errors_as_records(args.ndjson, args.profile):
+        search_messages(profile=args.profile, query=args.query, max_results=args.max,
+                        output_ndjson=args.ndjson)
 
 
 if __name__ == '__main__':
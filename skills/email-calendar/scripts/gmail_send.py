@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
-"""Send email via Gmail."""
+"""Send email via Gmail (--queue: spool it and return, see outbox.py)."""
 
 import argparse
 import base64
+import functools
 import mimetypes
 import sys
 from email.mime.base import MIMEBase
@@ -12,6 +13,8 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 from auth_common import get_credentials, add_profile_args, handle_profile_args, GMAIL_SEND
+from outbox import Outbox, profile_outbox, queued_record, start_flusher
+from records import add_output_args, emit, sent_record, errors_as_records
 
 try:
     from googleapiclient.discovery import build
@@ -29,7 +32,7 @@ def create_message(to, subject, body, cc=None, bcc=None, html=False, attachments
         for filepath in attachments:
             path = Path(filepath)
             if not path.exists():
-                print(f"Warning: Attachment not found: {filepath}")
+                print(f"Warning: Attachment not found: {filepath}", file=sys.stderr)
                 continue
             
             content_type, _ = mimetypes.guess_type(str(path))
@@ -61,7 +64,7 @@ def create_message(to, subject, body, cc=None, bcc=None, html=False, attachments
     return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
 
 
-def send_email(profile='default', to=None, subject=None, body=None, **kwargs):
+def send_email(profile='default', to=None, subject=None, body=None, output_ndjson=False, **kwargs):
     """Send email via Gmail API."""
     creds = get_credentials(profile, GMAIL_SEND)
     service = build('gmail', 'v1', credentials=creds)
@@ -69,6 +72,10 @@ def send_email(profile='default', to=None, subject=None, body=None, **kwargs):
     message = create_message(to, subject, body, **kwargs)
     result = service.users().messages().send(userId='me', body=message).execute()
     
+    if output_ndjson:
+        emit(sent_record(result, to, subject, profile))
+        return result
+    
     print(f"✅ Email sent!")
     print(f"   To: {to}")
     print(f"   Subject: {subject}")
@@ -76,6 +83,24 @@ def send_email(profile='default', to=None, subject=None, body=None, **kwargs):
     return result
 
 
+def queue_email(profile='default', to=None, subject=None, body=None, output_ndjson=False, **kwargs):
+    """Spool an email and start the background flusher; returns the entry name."""
+    path = profile_outbox(profile)
+    message = create_message(to, subject, body, **kwargs)
+    name = Outbox(path).enqueue(message['raw'], to, subject)
+    
+    if output_ndjson:
+        emit(queued_record(name, to, subject, profile))
+    else:
+        print("📤 Email queued")
+        print(f"   To: {to}")
+        print(f"   Subject: {subject}")
+        print(f"   Spool: {path / 'new' / name}")
+    
+    start_flusher(path, functools.partial(get_credentials, profile, GMAIL_SEND, False))
+    return name
+
+
 def main():
     parser = argparse.ArgumentParser(description='Send email via Gmail')
     add_profile_args(parser)
@@ -87,12 +112,17 @@ def main():
     parser.add_argument('--html', action='store_true', help='HTML body')
     parser.add_argument('--attach', action='append', help='Attachment')
     parser.add_argument('--reply-to', help='Reply to message ID')
+    parser.add_argument('--queue', action='store_true',
+                        help='Spool and return at once; a background flusher sends it (outbox.py)')
+    add_output_args(parser)
     args = parser.parse_args()
     
     handle_profile_args(args)
-    send_email(profile=args.profile, to=args.to, subject=args.subject, body=args.body,
-               cc=args.cc, bcc=args.bcc, html=args.html, attachments=args.attach,
-               reply_to=args.reply_to)
+    with errors_as_records(args.ndjson, args.profile):
+        send = queue_email if args.queue else send_email
+        send(profile=args.profile, to=args.to, subject=args.subject, body=args.body,
+             output_ndjson=args.ndjson, cc=args.cc, bcc=args.bcc, html=args.html,
+             attachments=args.attach, reply_to=args.reply_to)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Follow a mailbox and print only newly arrived messages.
+
+Instead of re-listing the unread set on a timer, this keeps the mailbox's
+last historyId and polls users.history.list (messageAdded) from it. An idle
+poll costs 2 quota units instead of a list plus one get per unread message.
+The interval starts at --min-interval, stretches by 1.5x on every idle poll
+up to --max-interval, and snaps back as soon as mail arrives.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from auth_common import (
+    get_credentials, add_profile_args, handle_profile_args, get_profile_dir, GMAIL_READONLY
+)
+from gapi_async import GoogleClient, ApiError, METADATA_HEADERS, RETRY_STATUSES, TRANSIENT_ERRORS
+from records import add_output_args, emit, error_record, message_record, errors_as_records
+
+STATE_FILE = 'watch_state.json'
+MIN_INTERVAL = 5
+MAX_INTERVAL = 120
+BACKOFF = 1.5
+# Still failing after the client's own retries, but likely to recover:
+# outages, rate limits and auth trouble are waited out, not fatal
+RECOVERABLE = RETRY_STATUSES | {401, 403}
+
+
+def load_state(path):
+    """Read watch state; a missing or corrupt file starts fresh."""
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    """Write watch state atomically so a crash never leaves a torn file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+async def poll_history(client, start_history_id, label='INBOX'):
+    """Return (new message IDs, latest historyId) since start_history_id."""
+    new_ids = []
+    seen = set()
+    latest = start_history_id
+    page_token = None
+    while True:
+        page = await client.list_history(start_history_id, history_types='messageAdded',
+                                         label_id=label, page_token=page_token)
+        latest = page.get('historyId', latest)
+        for record in page.get('history', []):
+            for added in record.get('messagesAdded', []):
+                mid = added['message']['id']
+                if mid not in seen and 'DRAFT' not in added['message'].get('labelIds', []):
+                    seen.add(mid)
+                    new_ids.append(mid)
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return new_ids, latest
+
+
+async def _get_if_exists(client, message_id):
+    """Fetch headers, or None if the message was deleted before we got to it."""
+    try:
+        return await client.get_message(message_id, format='metadata',
+                                        metadata_headers=METADATA_HEADERS)
+    except ApiError as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+async def watch(client, state_path, on_message, label='INBOX', min_interval=MIN_INTERVAL,
+                max_interval=MAX_INTERVAL, once=False, on_error=None):
+    """Poll history forever (or once), calling on_message(detail) for each new message.
+
+    State is saved only after a batch has been handed to on_message, so a
+    crash re-delivers rather than drops. With no saved historyId (first run,
+    or the saved one expired with a 404) the next poll starts from the
+    mailbox's current historyId. Network errors and RECOVERABLE statuses go
+    to on_error and the next poll waits max_interval.
+    """
+    history_id = load_state(state_path).get('history_id')
+    interval = min_interval
+    while True:
+        try:
+            if not history_id:
+                history_id = (await client.get_profile())['historyId']
+                save_state(state_path, {'history_id': history_id})
+            new_ids, latest = await poll_history(client, history_id, label)
+            if new_ids:
+                for detail in await asyncio.gather(*(_get_if_exists(client, m) for m in new_ids)):
+                    if detail is not None:
+                        on_message(detail)
+                interval = min_interval
+            else:
+                interval = min(max_interval, interval * BACKOFF)
+            history_id = latest
+            save_state(state_path, {'history_id': history_id})
+        except ApiError as e:
+            if e.status in RECOVERABLE:
+                if on_error:
+                    on_error(e)
+                interval = max_interval
+            elif e.status == 404:
+                if on_error:
+                    on_error(f'history {history_id} expired, resyncing')
+                history_id = None
+                save_state(state_path, {})
+            else:
+                raise
+        except TRANSIENT_ERRORS as e:
+            # Transient network trouble: keep the state and try again later
+            if on_error:
+                on_error(e)
+            interval = max_interval
+
+        if once:
+            return history_id
+        await asyncio.sleep(interval)
+
+
+def print_message(detail, profile=None):
+    """Human-readable line block for one new message."""
+    record = message_record(detail, profile)
+    print(f"📬 {record['date'] or 'Unknown'}")
+    print(f"   From: {record['from'] or 'Unknown'}")
+    print(f"   Subject: {record['subject'] or '(no subject)'}")
+    print(f"   ID: {record['id']}")
+    print(flush=True)
+
+
+async def _watch(profile, label, min_interval, max_interval, once, output_ndjson):
+    creds = get_credentials(profile, GMAIL_READONLY)
+    state_path = get_profile_dir(profile) / STATE_FILE
+
+    def on_message(detail):
+        if output_ndjson:
+            emit(message_record(detail, profile))
+        else:
+            print_message(detail, profile)
+
+    def on_error(error):
+        if output_ndjson:
+            emit(error_record(error, profile))
+        else:
+            print(f"⚠️  {error}", file=sys.stderr)
+
+    async with GoogleClient(creds, label=profile) as client:
+        await watch(client, state_path, on_message, label=label, min_interval=min_interval,
+                    max_interval=max_interval, once=once, on_error=on_error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream newly arrived Gmail messages')
+    add_profile_args(parser)
+    parser.add_argument('--label', default='INBOX', help='Only messages added to this label')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL,
+                        help='Seconds between polls while mail is arriving')
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL,
+                        help='Longest idle poll interval in seconds')
+    parser.add_argument('--once', action='store_true',
+                        help='Poll once and exit (for cron-style use)')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    handle_profile_args(args)
+    with errors_as_records(args.ndjson, args.profile):
+        try:
+            asyncio.run(_watch(args.profile, args.label, args.min_interval, args.max_interval,
+                               args.once, args.ndjson))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""Durable outbox: queue mail locally, send it from a background flusher.
+
+gmail_send.py --queue and `google-tool mail send --queue` build the MIME
+message, write it to the spool and return; nothing waits on OAuth or Gmail.
+A detached flusher then drains the spool, laid out like a maildir:
+
+    tmp/         entries being written (fsynced, then renamed into new/)
+    new/         queued, sent oldest name first
+    cur/         claimed by the flusher while the send is in flight
+    failed/      dead letters, with the last error recorded
+    sent.jsonl   one line per delivered message
+    outbox.log   flusher activity
+
+One flusher runs per spool (flock on .lock); enqueueing starts one unless
+it is already running. Small messages go out BATCH_SIZE to a batch request,
+paced by a token bucket at SEND_RATE sends/s (messages.send costs 100 of
+the 250 quota units/s Gmail allows). A send Gmail surely did not take
+(429, 401, 403, or no connection at all) goes back to new/ with
+exponential backoff, until MAX_ATTEMPTS. Anything else moves to failed/:
+errors a resend cannot fix (400, 404, 413), and outcomes that leave the
+send in doubt (5xx, a timeout or dropped connection, a part missing from
+a batch reply, an entry a crashed flusher left in cur/). The flusher
+waits out backoffs and exits once new/ is empty.
+
+Nothing is sent twice automatically. A doubtful entry is recorded in
+failed/ as "may have been delivered"; --retry-failed resends it, so check
+the Sent folder first.
+
+Usage:
+    outbox.py [-p PROFILE]          spool status
+    outbox.py --flush               drain now, in the foreground (cron, systemd)
+    outbox.py --retry-failed        move dead letters back to new/
+"""
+
+import argparse
+import asyncio
+import fcntl
+import functools
+import json
+import os
+import secrets
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from auth_common import (
+    get_credentials, add_profile_args, handle_profile_args, get_profile_dir, GMAIL_SEND
+)
+from background import detach
+from gapi_async import GoogleClient, ApiError, GMAIL_URL, TRANSIENT_ERRORS, UNSENT_ERRORS, TokenBucket
+from records import add_output_args, emit, errors_as_records
+
+SPOOL_DIR = 'outbox'
+SUBDIRS = ('tmp', 'new', 'cur', 'failed')
+SEND_RATE = 2.0
+BATCH_SIZE = 5
+# Bigger messages are sent on their own rather than inside a batch
+BATCH_MAX_BYTES = 1024 * 1024
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30
+BACKOFF_MAX = 1800
+# Refused unprocessed, worth another attempt later: rate limits, auth that may recover
+RETRYABLE = {429, 401, 403}
+DOUBTFUL = 'may have been delivered'
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class Outbox:
+    """The spool directory and its entry lifecycle."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        for sub in SUBDIRS:
+            (self.path / sub).mkdir(parents=True, exist_ok=True)
+
+    def _write(self, directory, name, entry):
+        """Write an entry to tmp/, fsync, then rename it into directory."""
+        tmp = self.path / 'tmp' / name
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path / directory / name)
+
+    def enqueue(self, raw, to, subject):
+        """Spool one base64url message; returns the entry name."""
+        name = f'{time.time():.6f}.{os.getpid()}.{secrets.token_hex(4)}.json'
+        self._write('new', name, {'raw': raw, 'to': to, 'subject': subject, 'queued_at': _now_iso(),
+                                  'attempts': 0, 'next_attempt': 0, 'last_error': None})
+        return name
+
+    def entries(self, directory):
+        return sorted(p.name for p in (self.path / directory).iterdir() if p.suffix == '.json')
+
+    def read(self, directory, name):
+        """An entry, or None if it vanished or cannot be parsed."""
+        try:
+            return json.loads((self.path / directory / name).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def claim(self, name):
+        os.rename(self.path / 'new' / name, self.path / 'cur' / name)
+
+    def sent(self, name, entry, result):
+        with open(self.path / 'sent.jsonl', 'a') as f:
+            f.write(json.dumps({'id': result.get('id'), 'thread_id': result.get('threadId'),
+                                'to': entry['to'], 'subject': entry['subject'],
+                                'queued_at': entry['queued_at'], 'sent_at': _now_iso()}) + '\n')
+        os.unlink(self.path / 'cur' / name)
+
+    def fail(self, name, entry, error):
+        """Back to new/ with backoff if Gmail surely refused it, else to failed/."""
+        entry['attempts'] += 1
+        entry['last_error'] = str(error)
+        status = getattr(error, 'status', None)
+        refused = status in RETRYABLE or isinstance(error, UNSENT_ERRORS)
+        if not refused and (status is None or status >= 500):
+            entry['last_error'] = f'{DOUBTFUL}: {error}'
+        if not refused or entry['attempts'] >= MAX_ATTEMPTS:
+            self._write('failed', name, entry)
+            self.log(f'dead letter {name} to {entry["to"]}: {entry["last_error"]}')
+        else:
+            entry['next_attempt'] = time.time() + min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (entry['attempts'] - 1))
+            self._write('new', name, entry)
+            self.log(f'retry {name} in {entry["next_attempt"] - time.time():.0f}s: {error}')
+        os.unlink(self.path / 'cur' / name)
+
+    def recover(self):
+        """Move entries a crashed flusher left in cur/ to failed/: they may have gone out."""
+        for name in self.entries('cur'):
+            entry = self.read('cur', name)
+            if entry is None:
+                os.replace(self.path / 'cur' / name, self.path / 'failed' / name)
+                continue
+            entry['last_error'] = f'{DOUBTFUL}: flusher stopped mid-send'
+            self._write('failed', name, entry)
+            os.unlink(self.path / 'cur' / name)
+            self.log(f'dead letter {name} to {entry["to"]}: {entry["last_error"]}')
+
+    def retry_failed(self):
+        """Move every dead letter back to new/ with a fresh attempt count."""
+        names = self.entries('failed')
+        for name in names:
+            entry = self.read('failed', name)
+            if entry is not None:
+                entry.update(attempts=0, next_attempt=0)
+                self._write('new', name, entry)
+                os.unlink(self.path / 'failed' / name)
+        return len(names)
+
+    def status(self):
+        try:
+            with open(self.path / 'sent.jsonl') as f:
+                sent = sum(1 for _ in f)
+        except FileNotFoundError:
+            sent = 0
+        return {'queued': len(self.entries('new')), 'in_flight': len(self.entries('cur')),
+                'failed': len(self.entries('failed')), 'sent': sent}
+
+    def log(self, message):
+        with open(self.path / 'outbox.log', 'a') as f:
+            f.write(f'{_now_iso()} {message}\n')
+
+    def try_lock(self):
+        """The spool lock's fd, or None while another flusher holds it."""
+        fd = os.open(self.path / '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _groups(ready):
+    """Split (name, entry) pairs into batch-sized groups; big messages go alone."""
+    group = []
+    for item in ready:
+        if len(item[1]['raw']) > BATCH_MAX_BYTES:
+            yield [item]
+            continue
+        group.append(item)
+        if len(group) == BATCH_SIZE:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+async def _send(client, group):
+    """Send a group; one result (response dict or exception) per entry."""
+    try:
+        if len(group) == 1:
+            return [await client.send_message(group[0][1]['raw'])]
+        return await client.batch([('POST', f'{GMAIL_URL}/messages/send', None, {'raw': entry['raw']})
+                                   for _, entry in group], idempotent=False)
+    except (ApiError, *TRANSIENT_ERRORS) as e:
+        return [e] * len(group)
+
+
+async def flush(outbox, get_creds, rate=SEND_RATE):
+    """Drain new/ (caller holds the lock). Returns False if it gave up early."""
+    outbox.recover()
+    if not outbox.entries('new'):
+        return True
+    try:
+        creds = await asyncio.to_thread(get_creds)
+    except Exception as e:  # AuthError, refresh failures: leave the spool for later
+        outbox.log(f'no credentials, leaving {len(outbox.entries("new"))} queued: {e}')
+        return False
+    bucket = TokenBucket(rate, BATCH_SIZE)
+    async with GoogleClient(creds) as client:
+        while True:
+            now = time.time()
+            ready, waiting = [], []
+            for name in outbox.entries('new'):
+                entry = outbox.read('new', name)
+                if entry is None:
+                    os.replace(outbox.path / 'new' / name, outbox.path / 'failed' / name)
+                    outbox.log(f'dead letter {name}: unreadable spool entry')
+                elif entry['next_attempt'] <= now:
+                    ready.append((name, entry))
+                else:
+                    waiting.append(entry['next_attempt'])
+            if not ready:
+                if not waiting:
+                    return True
+                await asyncio.sleep(min(waiting) - now)
+                continue
+            for group in _groups(ready):
+                await bucket.take(len(group))
+                for name, _ in group:
+                    outbox.claim(name)
+                for (name, entry), result in zip(group, await _send(client, group)):
+                    if isinstance(result, Exception):
+                        outbox.fail(name, entry, result)
+                    else:
+                        outbox.sent(name, entry, result or {})
+                        outbox.log(f'sent {name} to {entry["to"]}')
+
+
+def run_flusher(path, get_creds):
+    """Flush the spool at path under its lock. False if another flusher has it.
+
+    After releasing the lock, new/ is checked once more: an enqueue that
+    raced the final scan saw the lock held and did not start a flusher.
+    """
+    outbox = Outbox(path)
+    while True:
+        fd = outbox.try_lock()
+        if fd is None:
+            return False
+        try:
+            drained = asyncio.run(flush(outbox, get_creds))
+        finally:
+            outbox.unlock(fd)
+        if not drained or not outbox.entries('new'):
+            return True
+
+
+def start_flusher(path, get_creds):
+    """Drain the spool at path from a detached process; returns at once.
+
+    get_creds runs in that process and must not prompt.
+    """
+    if not detach():
+        return
+    try:
+        run_flusher(path, get_creds)
+    finally:
+        os._exit(0)
+
+
+def queued_record(name, to, subject, profile=None):
+    return {'type': 'queued', 'id': name, 'profile': profile, 'to': to, 'subject': subject}
+
+
+def profile_outbox(profile='default'):
+    return get_profile_dir(profile) / SPOOL_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Outbox spool status and flushing')
+    add_profile_args(parser)
+    parser.add_argument('--flush', action='store_true', help='Send everything queued now (foreground)')
+    parser.add_argument('--retry-failed', action='store_true', help='Requeue dead letters')
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    handle_profile_args(args)
+    with errors_as_records(args.ndjson, args.profile):
+        path = profile_outbox(args.profile)
+        outbox = Outbox(path)
+        get_creds = functools.partial(get_credentials, args.profile, GMAIL_SEND, False)
+        if args.retry_failed:
+            count = outbox.retry_failed()
+            if not args.ndjson:
+                print(f"↩️  {count} dead letters requeued")
+        if args.flush:
+            if not run_flusher(path, get_creds) and not args.ndjson:
+                print("⚠️  Another flusher is already running", file=sys.stderr)
+        elif args.retry_failed:
+            start_flusher(path, get_creds)
+
+        status = outbox.status()
+        if args.ndjson:
+            emit({'type': 'outbox', 'profile': args.profile, **status})
+            return
+        print(f"📤 Outbox ({args.profile}): {status['queued']} queued, {status['in_flight']} in flight, "
+              f"{status['failed']} failed, {status['sent']} sent")
+        for name in outbox.entries('failed'):
+            entry = outbox.read('failed', name) or {}
+            print(f"   ❌ {entry.get('to')}: {entry.get('subject')} ({entry.get('last_error')})")
+
+
+if __name__ == '__main__':
+    main()
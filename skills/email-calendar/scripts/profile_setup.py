@@ -4,14 +4,16 @@
 import argparse
 import shutil
 import sys
+from contextlib import nullcontext, redirect_stdout
 from pathlib import Path
 
 # Import from local module
 sys.path.insert(0, str(Path(__file__).parent))
 from auth_common import (
     get_profile_dir, list_profiles, get_profile_info, save_profile_info,
-    get_credentials, GMAIL_READONLY, CALENDAR_READONLY, CONFIG_DIR
+    get_credentials, AuthError, GMAIL_READONLY, CALENDAR_READONLY, CONFIG_DIR
 )
+from records import add_output_args, emit, error_record, profile_record
 
 try:
     from googleapiclient.discovery import build
@@ -22,7 +24,11 @@ except ImportError:
 
 
 def setup_profile(profile: str, credentials_path: str = None):
-    """Set up a new profile with credentials."""
+    """Set up a new profile with credentials.
+
+    Returns the account's email address, or None when credentials.json is
+    still missing. Raises AuthError if setup fails.
+    """
     profile_dir = get_profile_dir(profile)
     profile_dir.mkdir(parents=True, exist_ok=True)
     
@@ -31,8 +37,7 @@ def setup_profile(profile: str, credentials_path: str = None):
     if credentials_path:
         src = Path(credentials_path)
         if not src.exists():
-            print(f"ERROR: Credentials file not found: {credentials_path}")
-            sys.exit(1)
+            raise AuthError(f"Credentials file not found: {credentials_path}")
         shutil.copy(src, creds_dest)
         print(f"✅ Copied credentials to {creds_dest}")
     elif not creds_dest.exists():
@@ -41,7 +46,7 @@ def setup_profile(profile: str, credentials_path: str = None):
         print(f"  1. Download OAuth credentials from Google Cloud Console")
         print(f"  2. Save to: {creds_dest}")
         print(f"  3. Re-run this script")
-        return
+        return None
     
     # Authenticate and get email address
     print(f"\nAuthenticating profile '{profile}'...")
@@ -62,19 +67,18 @@ def setup_profile(profile: str, credentials_path: str = None):
         print("✅ Calendar access configured")
         
     except Exception as e:
-        print(f"ERROR: Authentication failed: {e}")
-        sys.exit(1)
+        raise AuthError(f"Authentication failed: {e}") from e
+    return email
 
 
 def delete_profile(profile: str):
-    """Delete a profile."""
+    """Delete a profile; False if it does not exist."""
     profile_dir = get_profile_dir(profile)
     if not profile_dir.exists():
-        print(f"Profile '{profile}' does not exist.")
-        return
+        return False
     
     shutil.rmtree(profile_dir)
-    print(f"✅ Profile '{profile}' deleted")
+    return True
 
 
 def main():
@@ -84,16 +88,24 @@ def main():
     parser.add_argument('--list', action='store_true', help='List profiles')
     parser.add_argument('--delete', action='store_true', help='Delete profile')
     parser.add_argument('--config-dir', action='store_true', help='Show config directory')
+    add_output_args(parser)
     args = parser.parse_args()
     
     if args.config_dir:
+        if args.ndjson:
+            emit({'type': 'config', 'config_dir': str(CONFIG_DIR),
+                  'profiles_dir': str(CONFIG_DIR / 'profiles')})
+            return
         print(f"Config directory: {CONFIG_DIR}")
         print(f"Profiles stored in: {CONFIG_DIR / 'profiles'}")
         return
     
     if args.list:
         profiles = list_profiles()
-        if not profiles:
+        if args.ndjson:
+            for p in profiles:
+                emit(profile_record(p, get_profile_info(p).get('email')))
+        elif not profiles:
             print("No profiles configured.")
         else:
             print("Configured profiles:")
@@ -104,10 +116,29 @@ def main():
         return
     
     if args.delete:
-        delete_profile(args.profile)
+        deleted = delete_profile(args.profile)
+        if args.ndjson:
+            emit({'type': 'profile_deleted', 'name': args.profile} if deleted
+                 else error_record(f"Profile '{args.profile}' does not exist.", args.profile))
+        elif deleted:
+            print(f"✅ Profile '{args.profile}' deleted")
+        else:
+            print(f"Profile '{args.profile}' does not exist.")
         return
     
-    setup_profile(args.profile, args.credentials)
+    # With --ndjson the setup chatter and OAuth prompts go to stderr
+    try:
+        with redirect_stdout(sys.stderr) if args.ndjson else nullcontext():
+            email = setup_profile(args.profile, args.credentials)
+    except AuthError as e:
+        if args.ndjson:
+            emit(error_record(e, args.profile))
+        else:
+            print(f"ERROR: {e}")
+        sys.exit(1)
+    if args.ndjson:
+        emit(profile_record(args.profile, email) if email else
+             error_record(f"No credentials.json for profile '{args.profile}'", args.profile))
 
 
 if __name__ == '__main__':
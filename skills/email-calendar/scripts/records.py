@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Streaming NDJSON records shared by the scripts and google-tool.
+
+With --ndjson every command writes one JSON object per line, flushed as soon
+as it is produced, and never mixes in human text or emoji. Each record has a
+"type" naming its schema; every listed field is always present (null when
+unknown) so consumers can index keys without guarding:
+
+    message       id, thread_id, profile, from, subject, date, received,
+                  snippet, unread, labels
+    message_body  id, thread_id, profile, from, to, subject, date, body,
+                  attachments [{filename, mime_type, size}]
+    event         id, profile, calendar, summary, start, end, all_day,
+                  location, attendees, link
+    busy          start, end
+    calendar_change  profile, calendar, action (patch|delete), id, summary,
+                  start, end, fields, status (planned|done|error|skipped), error
+    sent          id, thread_id, profile, to, subject
+    queued        id (outbox entry), profile, to, subject
+    outbox        profile, queued, in_flight, failed, sent
+    profile       name, email
+    profile_deleted  name
+    config        config_dir, profiles_dir
+    export_progress  profile, exported, skipped
+    export_done   profile, dest, exported, skipped
+    attachment    profile, message_id, thread_id, part_id, filename, mime_type,
+                  size, sha256, path, key, from, subject, received
+    attachments_done  profile, dest, messages, attachments, downloaded,
+                  reused, duplicates, bytes, skipped
+    stats_sender  profile, sender, count, bytes, last_seen
+    stats_label   profile, label, count, bytes
+    stats_volume  profile, period, messages, bytes
+    stats_threads profile, threads, sizes {bucket: threads}, largest
+                  [{thread_id, messages}]
+    stats_done    profile, messages, bytes, history_id
+    error         profile, error
+
+A command that fails outright ends its stream with an error record and
+exits 1 (errors_as_records); it never leaves a traceback on stdout.
+
+Fan-out commands emit records in completion order; sort on `received` or
+`start` downstream if order matters.
+"""
+
+import json
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+def emit(record, stream=None):
+    """Write one record as a compact JSON line and flush it."""
+    stream = stream or sys.stdout
+    stream.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+    stream.flush()
+
+
+def add_output_args(parser):
+    """Add the --ndjson flag to an argparser."""
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Stream newline-delimited JSON records (see records.py)')
+
+
+def _headers(message):
+    return {h['name']: h['value'] for h in message.get('payload', {}).get('headers', [])}
+
+
+def received_iso(message):
+    """Gmail's internalDate (ms since epoch) as a UTC ISO timestamp."""
+    if 'internalDate' not in message:
+        return None
+    ts = int(message['internalDate']) / 1000
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def message_record(message, profile=None):
+    """Summary record for a metadata- or full-format message."""
+    headers = _headers(message)
+    labels = message.get('labelIds', [])
+    return {
+        'type': 'message',
+        'id': message['id'],
+        'thread_id': message.get('threadId'),
+        'profile': profile,
+        'from': headers.get('From'),
+        'subject': headers.get('Subject'),
+        'date': headers.get('Date'),
+        'received': received_iso(message),
+        'snippet': message.get('snippet', ''),
+        'unread': 'UNREAD' in labels,
+        'labels': labels,
+    }
+
+
+def message_body_record(message, body, attachments, profile=None):
+    """Full-message record; `attachments` are manifest dicts."""
+    headers = _headers(message)
+    return {
+        'type': 'message_body',
+        'id': message['id'],
+        'thread_id': message.get('threadId'),
+        'profile': profile,
+        'from': headers.get('From'),
+        'to': headers.get('To'),
+        'subject': headers.get('Subject'),
+        'date': headers.get('Date'),
+        'body': body,
+        'attachments': [
+            {'filename': a.get('filename'), 'mime_type': a.get('mimeType'), 'size': a.get('size')}
+            for a in attachments
+        ],
+    }
+
+
+def event_record(event, profile=None, calendar='primary'):
+    """Record for a Calendar API event resource."""
+    start = event.get('start', {})
+    end = event.get('end', {})
+    return {
+        'type': 'event',
+        'id': event.get('id'),
+        'profile': profile,
+        'calendar': calendar,
+        'summary': event.get('summary'),
+        'start': start.get('dateTime', start.get('date')),
+        'end': end.get('dateTime', end.get('date')),
+        'all_day': 'date' in start,
+        'location': event.get('location'),
+        'attendees': [a.get('email') for a in event.get('attendees', [])],
+        'link': event.get('htmlLink'),
+    }
+
+
+def busy_record(slot):
+    return {'type': 'busy', 'start': slot.get('start'), 'end': slot.get('end')}
+
+
+def sent_record(result, to, subject, profile=None):
+    return {
+        'type': 'sent',
+        'id': result.get('id'),
+        'thread_id': result.get('threadId'),
+        'profile': profile,
+        'to': to,
+        'subject': subject,
+    }
+
+
+def profile_record(name, email):
+    return {'type': 'profile', 'name': name, 'email': email}
+
+
+def error_record(error, profile=None):
+    return {'type': 'error', 'profile': profile, 'error': str(error) or type(error).__name__}
+
+
+@contextmanager
+def errors_as_records(ndjson, profile=None):
+    """With ndjson, turn an uncaught error into a final error record and exit 1.
+
+    Without it, an AuthError is printed as a one-line error; anything else
+    propagates as usual.
+    """
+    from auth_common import AuthError
+    try:
+        yield
+    except Exception as e:
+        if ndjson:
+            emit(error_record(e, profile))
+        elif isinstance(e, AuthError):
+            print(f"ERROR: {e}", file=sys.stderr)
+        else:
+            raise
+        sys.exit(1)
@@ -0,0 +1,8 @@
+"""Put the script directories on sys.path, as the scripts do for themselves."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+for scripts in (ROOT / 'skills' / 'email-calendar' / 'scripts', ROOT / 'battery-monitor' / 'scripts'):
+    sys.path.insert(0, str(scripts))
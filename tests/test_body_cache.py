@@ -0,0 +1,124 @@
+import asyncio
+import itertools
+
+import pytest
+
+import body_cache
+from body_cache import BodyCache, budget_bytes, open_cache
+from gapi_async import ApiError
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Distinct access times, so LRU order does not depend on clock resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(body_cache.time, 'time', lambda: next(ticks))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = BodyCache(tmp_path / 'cache.sqlite', max_bytes=10_000)
+    yield cache
+    cache.close()
+
+
+def entry(message_id, body='hello'):
+    return {'message': {'id': message_id, 'threadId': 't', 'labelIds': ['INBOX'],
+                        'payload': {'headers': [{'name': 'Subject', 'value': 'Hi'},
+                                                {'name': 'X-Mailer', 'value': 'dropped'}]}},
+            'body': body, 'text': body, 'attachments': []}
+
+
+def test_round_trip_keeps_only_display_headers(cache):
+    cache.put(entry('m1'))
+    got = cache.get('m1')
+    assert got['body'] == 'hello' and got['attachments'] == []
+    assert got['message']['payload']['headers'] == [{'name': 'Subject', 'value': 'Hi'}]
+    assert cache.get('m2') is None
+    assert cache.missing(['m2', 'm1', 'm3']) == ['m2', 'm3']
+
+
+def test_lru_eviction_within_budget(cache):
+    big = 'x' * 1500  # body and text: about 3.1 kB an entry
+    for message_id in ('m1', 'm2', 'm3'):
+        cache.put(entry(message_id, big))
+    cache.get('m1')  # m2 is now the least recently read
+    cache.put(entry('m4', big))
+    assert cache.missing(['m1', 'm2', 'm3', 'm4']) == ['m2']
+    assert cache.stats()['bytes'] <= 10_000
+    # An entry bigger than the whole budget is not stored
+    cache.put(entry('huge', 'x' * 6000))
+    assert cache.get('huge') is None and cache.missing(['m1', 'm3', 'm4']) == []
+
+
+def test_resolve_prefix(cache):
+    cache.put(entry('abc123'))
+    cache.put(entry('abd456'))
+    assert cache.resolve('abc') == 'abc123'
+    assert cache.resolve('ab') == 'ab'
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, 64 * 1024 * 1024), ('0', 0), ('0.5', 512 * 1024), ('junk', 64 * 1024 * 1024), ('-3', 0),
+])
+def test_budget_from_environment(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv('GMAIL_BODY_CACHE_MB', raising=False)
+    else:
+        monkeypatch.setenv('GMAIL_BODY_CACHE_MB', value)
+    assert budget_bytes() == expected
+
+
+def test_zero_budget_disables_the_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv('GMAIL_BODY_CACHE_MB', '0')
+    assert open_cache(tmp_path / 'cache.sqlite') is None
+    assert not (tmp_path / 'cache.sqlite').exists()
+
+
+class FakeHistory:
+    def __init__(self, pages, history_id='500'):
+        self.pages = list(pages)
+        self.history_id = history_id
+        self.starts = []
+
+    async def list_history(self, start_history_id, page_token=None, **kwargs):
+        self.starts.append((start_history_id, page_token))
+        page = self.pages.pop(0)
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+    async def get_profile(self):
+        return {'historyId': self.history_id}
+
+
+def test_sync_invalidates_touched_messages(cache):
+    for message_id in ('m1', 'm2', 'm3'):
+        cache.put(entry(message_id))
+    cache.history_id = 100
+    client = FakeHistory([
+        {'historyId': '120', 'nextPageToken': 'p2', 'history': [{'messages': [{'id': 'm1'}]}]},
+        {'historyId': '130', 'history': [{'messages': [{'id': 'm3'}, {'id': 'gone'}]}]},
+    ])
+    assert asyncio.run(cache.sync(client)) == {'m1', 'm3', 'gone'}
+    assert client.starts == [('100', None), ('100', 'p2')]
+    assert cache.missing(['m1', 'm2', 'm3']) == ['m1', 'm3']
+    assert cache.history_id == '130'
+
+
+def test_sync_rebases_when_history_expired(cache):
+    cache.put(entry('m1'))
+    cache.history_id = 100
+    assert asyncio.run(cache.sync(FakeHistory([ApiError(404, 'Not Found')]))) is None
+    assert cache.stats()['entries'] == 0 and cache.history_id == '500'
+
+
+def test_sync_first_use_and_other_errors(cache):
+    client = FakeHistory([])
+    assert asyncio.run(cache.sync(client)) is None
+    assert client.starts == [] and cache.history_id == '500'
+
+    cache.put(entry('m1'))
+    with pytest.raises(ApiError):
+        asyncio.run(cache.sync(FakeHistory([ApiError(500, 'Backend Error')])))
+    assert cache.get('m1') is not None and cache.history_id == '500'
@@ -0,0 +1,74 @@
+import pytest
+
+from cadence import POLL_MAX, POLL_MIN, POLL_UNKNOWN, SLOPE_WINDOW, Cadence, slope
+from replay import MemoryFlags
+from rules import Rule
+
+
+def low_voltage(when='any', group=None, name='low'):
+    return Rule(name, ['sensor.a', 'sensor.b'], 'Low', when=when, below=26.0, reset=26.2,
+                group=group)
+
+
+def test_slope():
+    assert slope([(0, 1.0), (10, 2.0), (20, 3.0)]) == pytest.approx(0.1)
+    assert slope([(0, 1.0)]) == 0.0
+    # Under a second of spread is noise, not a trend
+    assert slope([(0, 1.0), (0.5, 2.0)]) == 0.0
+
+
+def test_proximity():
+    cadence = Cadence()
+    cadence.observe('sensor.a', 26.65, 0)
+    # 0.65 V is half of FAR_MARGIN (1.3 V at 26 V): half of POLL_MAX
+    assert cadence.entity_interval('sensor.a', 26.0, rising=False) == pytest.approx(150.0)
+    assert cadence.entity_interval('sensor.a', 20.0, rising=False) == POLL_MAX
+    assert cadence.entity_interval('sensor.a', 26.7, rising=False) == POLL_MIN
+    assert cadence.entity_interval('sensor.b', 26.0, rising=False) is None
+
+
+def test_rate_only_counts_toward_the_level():
+    cadence = Cadence()
+    for t in range(0, 61, 10):
+        cadence.observe('sensor.a', 27.25 - 0.01 * t, t)
+    # At 26.65 V falling 10 mV/s, 0.65 V away: SAFETY * 65 s
+    assert cadence.entity_interval('sensor.a', 26.0, rising=False) == pytest.approx(16.25)
+    # Moving away from a rising level leaves proximity alone
+    assert cadence.entity_interval('sensor.a', 27.3, rising=True) == pytest.approx(
+        POLL_MAX * 0.65 / 27.3 / 0.05)
+
+
+def test_window_and_unavailable():
+    cadence = Cadence()
+    cadence.observe('sensor.a', 27.0, 0)
+    cadence.observe('sensor.a', 26.9, SLOPE_WINDOW + 10)
+    assert list(cadence.readings['sensor.a']) == [(SLOPE_WINDOW + 10, 26.9)]
+    cadence.observe('sensor.a', None, SLOPE_WINDOW + 20)
+    assert cadence.entity_interval('sensor.a', 26.0, rising=False) is None
+
+
+@pytest.mark.parametrize('when, flagged, pick', [
+    ('any', False, min),
+    ('any', True, max),
+    ('all', False, max),
+    ('all', True, min),
+])
+def test_rule_interval(when, flagged, pick):
+    # Fire needs one entity for `any`, every one for `all`; reset the reverse
+    cadence = Cadence()
+    cadence.observe('sensor.a', 26.1, 0)
+    cadence.observe('sensor.b', 26.6, 0)
+    level, rising = (26.2, True) if flagged else (26.0, False)
+    each = [cadence.entity_interval(e, level, rising) for e in ('sensor.a', 'sensor.b')]
+    assert each[0] != each[1]
+    assert cadence.rule_interval(low_voltage(when), flagged) == pick(each)
+
+
+def test_intervals_per_group():
+    cadence = Cadence()
+    cadence.observe('sensor.a', 26.5, 0)
+    rules = [low_voltage(group='bank'), low_voltage('all', group='bank', name='low-all'),
+             Rule('other', 'sensor.c', 'x', below=26.0, group='spare')]
+    flags = MemoryFlags()
+    fastest = min(cadence.rule_interval(r, False) for r in rules[:2])
+    assert cadence.intervals(rules, flags) == {'bank': fastest, 'spare': POLL_UNKNOWN}
@@ -0,0 +1,96 @@
+import asyncio
+import re
+
+import pytest
+
+import gapi_async
+from gapi_async import GMAIL_URL, ApiError, GoogleClient, _parse_batch, _split_head
+
+
+def part(index, status, body='{}'):
+    return (f'--b\r\nContent-Type: application/http\r\nContent-ID: <response-item{index}>\r\n\r\n'
+            f'HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{body}\r\n')
+
+
+def reply(*parts):
+    return ('multipart/mixed; boundary=b', (''.join(parts) + '--b--\r\n').encode())
+
+
+def test_split_head():
+    assert _split_head(b'A: 1\r\nB: 2\r\n\r\nbody\r\n\r\nmore') == (b'A: 1\r\nB: 2', b'body\r\n\r\nmore')
+    assert _split_head(b'A: 1\n\nbody') == (b'A: 1', b'body')
+    assert _split_head(b'A: 1') == (b'A: 1', b'')
+
+
+def test_parse_batch_maps_content_ids():
+    # Parts can come back in any order; item 1 is missing entirely
+    content_type, payload = reply(part(2, 404, '{"error": {"message": "Not Found"}}'),
+                                  part(0, 200, '{"id": "m0"}'))
+    assert _parse_batch(content_type, payload) == {
+        0: (200, b'{"id": "m0"}'),
+        2: (404, b'{"error": {"message": "Not Found"}}'),
+    }
+
+
+def test_parse_batch_quoted_boundary_and_bad_status_line():
+    payload = ('--q\r\nContent-ID: <response-item0>\r\n\r\ngarbage\r\n\r\n{}\r\n--q--').encode()
+    assert _parse_batch('multipart/mixed; boundary="q"', payload) == {0: (500, b'{}')}
+
+
+def test_parse_batch_rejects_non_multipart():
+    with pytest.raises(ApiError) as e:
+        _parse_batch('application/json', b'{}')
+    assert e.value.status == 502
+
+
+class FakeClient(GoogleClient):
+    """Answers batch POSTs from a list of {call index: status}, one per round trip."""
+
+    def __init__(self, rounds):
+        self.rounds = list(rounds)
+        self.sent = []
+
+    async def send(self, method, url, data=None, headers=None, idempotent=True, **kwargs):
+        count = len(re.findall(rb'Content-ID: <item\d+>', data))
+        self.sent.append(count)
+        statuses = self.rounds.pop(0)
+        return reply(*(part(i, statuses[i], f'{{"n": {i}}}') for i in range(count) if i in statuses))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(_):
+        pass
+    monkeypatch.setattr(gapi_async.asyncio, 'sleep', sleep)
+
+
+CALLS = [('GET', f'{GMAIL_URL}/messages/{i}', None, None) for i in range(4)]
+
+
+def test_batch_retries_refused_and_missing_calls():
+    # Round one: a 503, a 429, a 404 and a missing part
+    client = FakeClient([{0: 503, 1: 429, 2: 404}, {0: 200, 1: 200, 2: 200}])
+    results = asyncio.run(client.batch(CALLS))
+    assert client.sent == [4, 3]
+    # The retried calls went out again as items 0..2 of the second batch
+    assert results[:2] == [{'n': 0}, {'n': 1}]
+    assert isinstance(results[2], ApiError) and results[2].status == 404
+    assert results[3] == {'n': 2}
+
+
+def test_batch_non_idempotent_retries_only_429():
+    client = FakeClient([{0: 503, 1: 429, 2: 200}, {0: 200}])
+    results = asyncio.run(client.batch(CALLS, idempotent=False))
+    assert client.sent == [4, 1]
+    assert isinstance(results[0], ApiError) and results[0].status == 503
+    assert results[1] == {'n': 0}
+    assert results[2] == {'n': 2}
+    # Missing from the reply: it may have been sent, so it is not sent again
+    assert isinstance(results[3], ApiError) and results[3].status == 500
+
+
+def test_batch_gives_up_after_max_retries():
+    client = FakeClient([{0: 503}] * (gapi_async.MAX_RETRIES + 1))
+    [result] = asyncio.run(client.batch(CALLS[:1]))
+    assert len(client.sent) == gapi_async.MAX_RETRIES + 1
+    assert isinstance(result, ApiError) and result.status == 503
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+import pytest
+
+from gcal_bulk import parse_delta, plan_move
+
+
+def timed(start, end, zone=None):
+    event = {'id': 'e1', 'summary': 'Workshop',
+             'start': {'dateTime': start}, 'end': {'dateTime': end}}
+    if zone:
+        event['start']['timeZone'] = event['end']['timeZone'] = zone
+    return event
+
+
+@pytest.mark.parametrize('text, delta', [
+    ('+1h', timedelta(hours=1)),
+    ('-30m', timedelta(minutes=-30)),
+    ('2d', timedelta(days=2)),
+    ('1w2d', timedelta(weeks=1, days=2)),
+    ('-1h30m', timedelta(hours=-1, minutes=-30)),
+])
+def test_parse_delta(text, delta):
+    assert parse_delta(text) == delta
+
+
+@pytest.mark.parametrize('text', ['', '+', '1x', 'h1'])
+def test_parse_delta_rejects(text):
+    with pytest.raises(ValueError):
+        parse_delta(text)
+
+
+def test_move_keeps_wall_clock_across_dst():
+    # US clocks spring forward on 2026-03-08
+    event = timed('2026-03-02T09:00:00-05:00', '2026-03-02T10:00:00-05:00', 'America/New_York')
+    [(_, method, body, note)] = plan_move([event], parse_delta('1w'))
+    assert method == 'PATCH' and note is None
+    assert body['start'] == {'dateTime': '2026-03-09T09:00:00-04:00', 'timeZone': 'America/New_York'}
+    assert body['end']['dateTime'] == '2026-03-09T10:00:00-04:00'
+
+
+def test_move_uses_calendar_zone_when_event_names_none():
+    event = timed('2026-10-26T09:00:00+00:00', '2026-10-26T09:30:00+00:00')
+    [(_, _, body, _)] = plan_move([event], parse_delta('-1w'), 'Europe/London')
+    # BST until 2026-10-25, so a week earlier 09:00 London is UTC+1
+    assert body['start']['dateTime'] == '2026-10-19T09:00:00+01:00'
+    assert body['start']['timeZone'] == 'Europe/London'
+
+
+def test_move_without_any_zone_shifts_the_instant():
+    event = timed('2026-03-02T09:00:00-05:00', '2026-03-02T10:00:00-05:00')
+    [(_, _, body, _)] = plan_move([event], parse_delta('1w'))
+    assert body['start'] == {'dateTime': '2026-03-09T09:00:00-05:00'}
+
+
+def test_move_into_skipped_hour_keeps_length():
+    event = timed('2026-03-07T02:30:00-05:00', '2026-03-07T03:00:00-05:00', 'America/New_York')
+    [(_, _, body, _)] = plan_move([event], parse_delta('1d'))
+    assert body['start']['dateTime'] == '2026-03-08T03:30:00-04:00'
+    assert body['end']['dateTime'] == '2026-03-08T04:00:00-04:00'
+
+
+def test_all_day_moves_only_by_whole_days():
+    event = {'id': 'e2', 'start': {'date': '2026-03-02'}, 'end': {'date': '2026-03-03'}}
+    [(_, method, body, _)] = plan_move([event], parse_delta('2d'))
+    assert method == 'PATCH' and body == {'start': {'date': '2026-03-04'}, 'end': {'date': '2026-03-05'}}
+    [(_, method, body, note)] = plan_move([event], parse_delta('1h'))
+    assert method is None and body is None and note.startswith('skipped')
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import gmail_check
+from records import message_record
+
+DETAILS = [
+    {'id': 'm1', 'internalDate': '1760000000000', 'snippet': 'x' * 150, 'labelIds': ['UNREAD'],
+     'payload': {'headers': [{'name': 'From', 'value': 'a@example.com'},
+                             {'name': 'Subject', 'value': 'Hi'},
+                             {'name': 'Date', 'value': 'Thu, 9 Oct 2025 08:53:20 +0000'}]}},
+    {'id': 'm2', 'snippet': 'no headers'},
+]
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    async def check_profiles(profiles, count=10, unread_only=False):
+        emails = [message_record(d, p) for p in profiles for d in DETAILS]
+        return sorted(emails, key=gmail_check.by_received, reverse=True), []
+    monkeypatch.setattr(gmail_check, 'check_profiles', check_profiles)
+    monkeypatch.setattr(gmail_check, 'resolve_profiles',
+                        lambda profile: ['home', 'work'] if profile == 'all' else [profile])
+
+
+def test_json_keeps_the_legacy_shape(inbox, capsys):
+    gmail_check.check_inbox('default', output_json=True)
+    assert json.loads(capsys.readouterr().out) == [
+        {'id': 'm1', 'from': 'a@example.com', 'subject': 'Hi',
+         'date': 'Thu, 9 Oct 2025 08:53:20 +0000', 'snippet': 'x' * 100, 'unread': True},
+        {'id': 'm2', 'from': 'Unknown', 'subject': '(no subject)', 'date': 'Unknown',
+         'snippet': 'no headers', 'unread': False},
+    ]
+
+
+def test_json_all_profiles_adds_profile(inbox, capsys):
+    gmail_check.check_inbox('all', output_json=True)
+    output = json.loads(capsys.readouterr().out)
+    assert output['errors'] == []
+    assert [(m['id'], m['profile']) for m in output['messages']] == [
+        ('m1', 'home'), ('m1', 'work'), ('m2', 'home'), ('m2', 'work')]
+    assert set(output['messages'][0]) == {'id', 'from', 'subject', 'date', 'snippet', 'unread', 'profile'}
+
+
+def test_by_received_sorts_missing_dates_last():
+    records = [message_record(d) for d in reversed(DETAILS)]
+    assert [r['id'] for r in sorted(records, key=gmail_check.by_received, reverse=True)] == ['m1', 'm2']
@@ -0,0 +1,90 @@
+import asyncio
+
+from gapi_async import ApiError
+from gmail_export import MaildirWriter, MboxWriter, export_mailbox, load_checkpoint
+
+MESSAGE = b'From: a@example.com\r\nSubject: Hi\r\n\r\nFrom here on\r\n'
+
+
+def test_maildir_resume_does_not_duplicate(tmp_path):
+    writer = MaildirWriter(tmp_path)
+    writer.write('m1', MESSAGE)
+    # A mail reader moved it to cur/ and flagged it seen
+    (tmp_path / 'new' / 'm1.gmail').rename(tmp_path / 'cur' / 'm1.gmail:2,S')
+    writer.write('m1', MESSAGE)
+    writer.write('m2', MESSAGE)
+    assert sorted(p.name for p in (tmp_path / 'new').iterdir()) == ['m2.gmail']
+    assert [p.name for p in (tmp_path / 'cur').iterdir()] == ['m1.gmail:2,S']
+    assert list((tmp_path / 'tmp').iterdir()) == []
+
+
+def test_mbox_quotes_from_lines(tmp_path):
+    writer = MboxWriter(tmp_path / 'all.mbox')
+    writer.write('m1', MESSAGE)
+    writer.close()
+    lines = (tmp_path / 'all.mbox').read_bytes().split(b'\n')
+    assert lines[0].startswith(b'From MAILER-DAEMON ')
+    assert lines[1:] == [b'From: a@example.com', b'Subject: Hi', b'', b'>From here on', b'', b'']
+
+
+def test_mbox_recover_truncates_to_last_committed_flush(tmp_path):
+    path = tmp_path / 'all.mbox'
+    writer = MboxWriter(path)
+    checkpoint = writer.checkpoint_path
+    assert checkpoint.read_text() == '@0\n'
+    writer.write('m1', MESSAGE)
+    writer.sync()
+    with open(checkpoint, 'a') as f:
+        f.write('m1\n' + writer.marker())
+    committed = path.stat().st_size
+    # Crash mid-flush: m2 is on disk and its ID torn in the checkpoint
+    writer.write('m2', MESSAGE)
+    writer.sync()
+    writer.close()
+    with open(checkpoint, 'a') as f:
+        f.write('m2\n@99')
+
+    MboxWriter(path).close()
+    assert path.stat().st_size == committed
+    assert checkpoint.read_text() == f'@0\nm1\n@{committed}\n'
+    assert load_checkpoint(checkpoint) == {'m1'}
+
+
+def test_mbox_keeps_existing_file_and_legacy_checkpoint(tmp_path):
+    path = tmp_path / 'all.mbox'
+    path.write_bytes(b'From x\n\nold\n\n')
+    MboxWriter(path).close()
+    assert path.read_bytes() == b'From x\n\nold\n\n'
+    assert MboxWriter(path).checkpoint_path.read_text() == '@13\n'
+
+    legacy = tmp_path / 'legacy.mbox'
+    legacy.write_bytes(b'From x\n\nold\n\n')
+    (tmp_path / 'legacy.mbox.export-done').write_text('m1\n')
+    MboxWriter(legacy).close()
+    assert legacy.stat().st_size == 13
+
+
+class FakeClient:
+    def __init__(self, ids, gone=()):
+        self.ids = ids
+        self.gone = set(gone)
+
+    async def iter_message_ids(self, q=None, limit=None):
+        for mid in self.ids:
+            yield mid
+
+    async def get_message(self, message_id, format=None, fields=None):
+        if message_id in self.gone:
+            raise ApiError(404, 'Not Found')
+        return {'raw': 'RnJvbTogYUBleGFtcGxlLmNvbQ0KDQpoaQ0K'}
+
+
+def test_export_limit_counts_only_new_messages(tmp_path):
+    ids = [f'm{i}' for i in range(10)]
+    writer = MaildirWriter(tmp_path)
+    assert asyncio.run(export_mailbox(FakeClient(ids), writer, limit=3, batch_size=2)) == (3, 0)
+    exported, skipped = asyncio.run(export_mailbox(FakeClient(ids, gone={'m4'}), writer, limit=3))
+    # m4 vanished: checkpointed but not counted, so three more are written
+    assert (exported, skipped) == (3, 3)
+    assert load_checkpoint(writer.checkpoint_path) == {f'm{i}' for i in range(7)}
+    assert len(list((tmp_path / 'new').iterdir())) == 6
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import gmail_watch
+from gapi_async import ApiError
+from gmail_watch import load_state, watch
+
+
+class FakeClient:
+    """Plays back get_profile and history.list outcomes (an exception or a value)."""
+
+    def __init__(self, profiles, histories):
+        self.profiles = list(profiles)
+        self.histories = list(histories)
+
+    @staticmethod
+    def _next(outcomes):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def get_profile(self):
+        return {'historyId': self._next(self.profiles)}
+
+    async def list_history(self, start_history_id, **kwargs):
+        return self._next(self.histories)
+
+    async def get_message(self, message_id, **kwargs):
+        return {'id': message_id}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        if len(slept) == 5:
+            raise asyncio.CancelledError
+    monkeypatch.setattr(gmail_watch.asyncio, 'sleep', sleep)
+    return slept
+
+
+def run(client, state_path, **kwargs):
+    messages, errors = [], []
+    try:
+        asyncio.run(watch(client, state_path, messages.append, on_error=errors.append,
+                          min_interval=5, max_interval=120, **kwargs))
+    except asyncio.CancelledError:
+        pass
+    return messages, errors
+
+
+def added(*ids, history_id='20'):
+    return {'historyId': history_id,
+            'history': [{'messagesAdded': [{'message': {'id': i, 'labelIds': ['INBOX']}}]} for i in ids]}
+
+
+def test_startup_outage_is_waited_out(tmp_path, sleeps):
+    state = tmp_path / 'state.json'
+    client = FakeClient([ApiError(503, 'Backend Error'), '10'], [added('m1')] + [{'historyId': '20'}] * 3)
+    messages, errors = run(client, state)
+    assert messages == [{'id': 'm1'}]
+    assert [e.status for e in errors] == [503]
+    assert sleeps[:2] == [120, 5]
+    assert load_state(state) == {'history_id': '20'}
+
+
+def test_expired_history_resyncs_after_sleeping(tmp_path, sleeps):
+    state = tmp_path / 'state.json'
+    state.write_text('{"history_id": "1"}')
+    client = FakeClient(['30', '31'], [ApiError(404, 'Not Found'), ApiError(404, 'Not Found')]
+                        + [{'historyId': '31'}] * 3)
+    messages, errors = run(client, state)
+    assert errors == ['history 1 expired, resyncing', 'history 30 expired, resyncing']
+    # Each 404 still waits out the normal interval
+    assert sleeps == [5, 5, 7.5, 11.25, 16.875]
+    assert load_state(state) == {'history_id': '31'}
+
+
+def test_once_clears_expired_state(tmp_path, sleeps):
+    state = tmp_path / 'state.json'
+    state.write_text('{"history_id": "1"}')
+    run(FakeClient([], [ApiError(404, 'Not Found')]), state, once=True)
+    assert load_state(state) == {} and sleeps == []
+
+
+def test_other_errors_are_fatal(tmp_path, sleeps):
+    with pytest.raises(ApiError):
+        run(FakeClient(['10'], [ApiError(400, 'Bad Request')]), tmp_path / 'state.json')
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from ha_client import HAClient, HAError, HAUnknownOutcome
+from notify import Dispatcher, coalesce, deliver
+from replay import MemoryFlags
+
+
+class Sender:
+    """Raises the queued errors in turn, then succeeds."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.messages = []
+
+    def __call__(self, message):
+        self.messages.append(message)
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+ANNOUNCEMENTS = [('Bank low. ', 'bank-low'), ('Cell 3 high. ', 'cell-high')]
+
+
+def test_coalesce():
+    assert coalesce(ANNOUNCEMENTS) == ('Bank low. Cell 3 high.', ['bank-low', 'cell-high'])
+    assert coalesce(ANNOUNCEMENTS[:1]) == ('Bank low. ', ['bank-low'])
+
+
+def test_deliver_retries_failures():
+    send, flags = Sender(HAError('HTTP 502')), MemoryFlags()
+    assert deliver(send, flags, ANNOUNCEMENTS, base=0)
+    assert len(send.messages) == 2 and flags.names == {'bank-low', 'cell-high'}
+
+    send, flags = Sender(*[ConnectionError('refused')] * 3), MemoryFlags()
+    assert not deliver(send, flags, ANNOUNCEMENTS, base=0)
+    assert len(send.messages) == 3 and flags.names == set()
+
+
+def test_deliver_never_resends_an_unconfirmed_call():
+    send, flags = Sender(HAUnknownOutcome('POST: sent, response lost')), MemoryFlags()
+    assert deliver(send, flags, ANNOUNCEMENTS, base=0)
+    assert len(send.messages) == 1 and flags.names == {'bank-low', 'cell-high'}
+
+
+def test_dispatcher_never_resends_an_unconfirmed_call():
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        raise HAUnknownOutcome('call_service: sent, no result: timed out')
+
+    async def main():
+        flags = MemoryFlags()
+        dispatcher = Dispatcher(send, flags, window=0)
+        task = asyncio.create_task(dispatcher.run())
+        dispatcher.submit(ANNOUNCEMENTS)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        task.cancel()
+        return dispatcher, flags
+
+    dispatcher, flags = asyncio.run(main())
+    assert len(sent) == 1 and dispatcher.failed == 0
+    assert flags.names == {'bank-low', 'cell-high'}
+
+
+@pytest.fixture
+def hangup_server():
+    """A server that reads each request and hangs up without answering."""
+    server = socket.create_server(('127.0.0.1', 0))
+    requests = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                data = conn.recv(65536)
+                if data:
+                    requests.append(data.split(b' ', 1)[0].decode())
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f'http://127.0.0.1:{server.getsockname()[1]}', requests
+    server.close()
+
+
+def test_ha_client_does_not_replay_a_lost_post(hangup_server):
+    url, requests = hangup_server
+    client = HAClient(url, 'token', timeout=2)
+    with pytest.raises(HAUnknownOutcome):
+        client.call_service('notify', 'alexa_media', {'message': 'hi'})
+    assert requests == ['POST']
+
+    with pytest.raises(HAError) as e:
+        client.get_states()
+    assert not isinstance(e.value, HAUnknownOutcome)
+    assert requests == ['POST', 'GET', 'GET']
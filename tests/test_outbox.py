@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from gapi_async import ApiError
+from outbox import BATCH_SIZE, DOUBTFUL, MAX_ATTEMPTS, Outbox, _groups
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(tmp_path / 'outbox')
+
+
+def claimed(outbox):
+    name = outbox.enqueue('cmF3', 'to@example.com', 'Hi')
+    outbox.claim(name)
+    return name, outbox.read('cur', name)
+
+
+def test_enqueue_claim_sent(outbox):
+    name, entry = claimed(outbox)
+    assert outbox.entries('new') == [] and outbox.entries('cur') == [name]
+    outbox.sent(name, entry, {'id': 'm1', 'threadId': 't1'})
+    assert outbox.status() == {'queued': 0, 'in_flight': 0, 'failed': 0, 'sent': 1}
+
+
+@pytest.mark.parametrize('error', [
+    ApiError(429, 'Rate limit'),
+    ApiError(401, 'Invalid credentials'),
+    aiohttp.ClientConnectorError(SimpleNamespace(host='gmail.googleapis.com', port=443, ssl=True),
+                                 OSError(101, 'Network is unreachable')),
+])
+def test_refused_sends_back_off(outbox, error):
+    name, entry = claimed(outbox)
+    outbox.fail(name, entry, error)
+    assert outbox.entries('new') == [name] and outbox.entries('cur') == []
+    entry = outbox.read('new', name)
+    assert entry['attempts'] == 1 and entry['next_attempt'] > 0
+
+
+@pytest.mark.parametrize('error', [
+    ApiError(500, 'no response in batch'),
+    ApiError(503, 'Backend Error'),
+    asyncio.TimeoutError(),
+    aiohttp.ServerDisconnectedError(),
+])
+def test_doubtful_sends_are_not_resent(outbox, error):
+    name, entry = claimed(outbox)
+    outbox.fail(name, entry, error)
+    assert outbox.entries('failed') == [name] and outbox.entries('new') == []
+    assert outbox.read('failed', name)['last_error'].startswith(DOUBTFUL)
+
+
+def test_rejected_and_exhausted_sends_fail(outbox):
+    name, entry = claimed(outbox)
+    outbox.fail(name, entry, ApiError(400, 'Invalid To header'))
+    assert outbox.read('failed', name)['last_error'] == 'HTTP 400: Invalid To header'
+
+    name, entry = claimed(outbox)
+    entry['attempts'] = MAX_ATTEMPTS - 1
+    outbox.fail(name, entry, ApiError(429, 'Rate limit'))
+    assert name in outbox.entries('failed')
+
+
+def test_recover_moves_in_flight_entries_to_failed(outbox):
+    name, _ = claimed(outbox)
+    (outbox.path / 'cur' / 'broken.json').write_text('{')
+    outbox.recover()
+    assert outbox.entries('cur') == [] and outbox.entries('new') == []
+    assert outbox.entries('failed') == sorted([name, 'broken.json'])
+    assert outbox.read('failed', name)['last_error'].startswith(DOUBTFUL)
+
+
+def test_retry_failed_resets_attempts(outbox):
+    name, entry = claimed(outbox)
+    entry['attempts'] = 3
+    outbox.fail(name, entry, ApiError(502, 'Bad Gateway'))
+    assert outbox.retry_failed() == 1
+    entry = outbox.read('new', name)
+    assert (entry['attempts'], entry['next_attempt']) == (0, 0)
+    assert outbox.entries('failed') == []
+
+
+def test_groups_send_big_messages_alone():
+    small = [(f'{i}.json', {'raw': 'x'}) for i in range(BATCH_SIZE + 1)]
+    big = ('big.json', {'raw': 'x' * (1024 * 1024 + 1)})
+    groups = list(_groups(small[:2] + [big] + small[2:]))
+    assert [len(g) for g in groups] == [1, BATCH_SIZE, 1]
+    assert groups[0] == [big]
+
+
+def test_try_lock_is_exclusive(outbox):
+    fd = outbox.try_lock()
+    assert fd is not None and outbox.try_lock() is None
+    Outbox.unlock(fd)
+    Outbox.unlock(outbox.try_lock())
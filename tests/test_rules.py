@@ -0,0 +1,79 @@
+import pytest
+
+from replay import MemoryFlags
+from rules import Rule, RuleError, compile_rules, expand
+
+
+def states(**values):
+    return {f'sensor.cell_{k[1:]}': {'state': str(v)} for k, v in values.items()}
+
+
+def cells(when='any', **levels):
+    levels = levels or {'above': 3.6, 'reset': 3.39}
+    return Rule('overvoltage', 'sensor.cell_{1..3}', 'High: {items}', when=when,
+                item='{index}={value} ', **levels)
+
+
+def test_expand_ranges():
+    assert expand('cell_{1..3}') == [('cell_1', 1), ('cell_2', 2), ('cell_3', 3)]
+    assert expand('cell_{2..1}_{1..2}') == [('cell_2_1', 2), ('cell_2_2', 2),
+                                            ('cell_1_1', 1), ('cell_1_2', 1)]
+    assert expand('cell') == [('cell', None)]
+
+
+def test_any_hysteresis():
+    rule = cells()
+    assert rule.evaluate(states(c1=3.3, c2=3.61, c3=3.6)) == ('fire', 'High: 2=3.61 3=3.6 ')
+    # Between reset and trigger: hold until every cell is back
+    assert rule.evaluate(states(c1=3.3, c2=3.5, c3=3.39)) == (None, None)
+    assert rule.evaluate(states(c1=3.3, c2=3.39, c3=3.2)) == ('reset', None)
+
+
+def test_all_hysteresis():
+    rule = cells('all', below=3.0, reset=3.2)
+    assert rule.evaluate(states(c1=2.9, c2=2.8, c3=3.1))[0] is None
+    assert rule.evaluate(states(c1=2.9, c2=2.8, c3=2.99))[0] == 'fire'
+    # `all` resets as soon as one cell recovers
+    assert rule.evaluate(states(c1=2.9, c2=3.2, c3=2.99)) == ('reset', None)
+
+
+def test_below_is_strict_and_reset_defaults_to_level():
+    rule = cells(below=3.0)
+    assert rule.evaluate(states(c1=3.0, c2=3.1, c3=3.2)) == ('reset', None)
+    assert rule.evaluate(states(c1=2.99, c2=3.1, c3=3.2))[0] == 'fire'
+
+
+def test_unavailable_entities():
+    readings = states(c1=3.7, c3=3.0)
+    readings['sensor.cell_2'] = {'state': 'unavailable'}
+    assert cells().evaluate(readings)[0] == 'fire'
+    assert cells('all').evaluate(readings) == ('unknown', None)
+
+
+def test_ruleset_flags_announce_once_and_clear_on_reset():
+    ruleset = compile_rules([{'name': 'overvoltage', 'entities': 'sensor.cell_{1..3}',
+                              'above': 3.6, 'reset': 3.39, 'message': '{count} high'}])
+    flags = MemoryFlags()
+    hot = states(c1=3.65, c2=3.3, c3=3.3)
+    assert ruleset.evaluate(hot, flags) == ([('1 high', 'overvoltage')], True)
+    flags.set('overvoltage')
+    assert ruleset.evaluate(hot, flags) == ([], True)
+    # Back below trigger but above reset: the flag stays
+    ruleset.evaluate(states(c1=3.5, c2=3.3, c3=3.3), flags)
+    assert flags.is_set('overvoltage')
+    ruleset.evaluate(states(c1=3.3, c2=3.3, c3=3.3), flags)
+    assert not flags.is_set('overvoltage')
+    assert [r.name for r in ruleset.affected('sensor.cell_2')] == ['overvoltage']
+
+
+@pytest.mark.parametrize('spec', [
+    {'name': 'x', 'entities': 'e', 'message': 'm'},
+    {'name': 'x', 'entities': 'e', 'message': 'm', 'above': 1, 'below': 0},
+    {'name': 'x', 'entities': 'e', 'message': 'm', 'above': 1, 'when': 'most'},
+    {'name': 'x', 'entities': 'e', 'message': '{nope}', 'above': 1},
+    {'name': 'x', 'entities': 'e', 'message': 'm', 'above': 1, 'colour': 'red'},
+    {'name': 'x', 'entities': [], 'message': 'm', 'above': 1},
+])
+def test_bad_specs(spec):
+    with pytest.raises(RuleError):
+        compile_rules([spec])